@@ -1,6 +1,8 @@
+from channels.db import database_sync_to_async
 from django.conf import settings
-from rest_framework import HTTP_HEADER_ENCODING
+from rest_framework import HTTP_HEADER_ENCODING, exceptions
 from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 
 
 class JSONWebTokenCookieAuthentication(authentication.JWTAuthentication):
@@ -19,3 +21,30 @@ class JSONWebTokenCookieAuthentication(authentication.JWTAuthentication):
 
     def get_raw_token(self, header):
         return header
+
+
+class JSONWebTokenCookieAuthMiddleware:
+    """Channels middleware authenticating WebSocket connections with the JWT cookie.
+
+    Put inside ``AuthMiddlewareStack``, which parses the cookies: a valid
+    access token replaces ``scope["user"]``; otherwise the session user is kept.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        token = scope.get("cookies", {}).get(settings.ACCESS_TOKEN_COOKIE)
+        if token:
+            user = await database_sync_to_async(self.get_user)(token)
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await self.inner(scope, receive, send)
+
+    @staticmethod
+    def get_user(token):
+        backend = JSONWebTokenCookieAuthentication()
+        try:
+            return backend.get_user(backend.get_validated_token(token.encode(HTTP_HEADER_ENCODING)))
+        except (exceptions.AuthenticationFailed, InvalidToken):
+            return None
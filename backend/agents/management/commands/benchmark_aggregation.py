@@ -0,0 +1,84 @@
+import statistics
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from agents.utils.aggregation import group_by, pivot
+from agents.utils.sheets import ColumnarTable
+
+
+def python_group_by(rows):
+    """Row-at-a-time baseline for the same group-by the engine runs."""
+    groups = defaultdict(list)
+    for region, _, amount, _ in rows:
+        if amount != "":
+            groups[region].append(amount)
+    return {
+        region: (len(values), sum(values), statistics.fmean(values), statistics.quantiles(values, n=10)[-1])
+        for region, values in sorted(groups.items())
+    }
+
+
+class Command(BaseCommand):
+    help = "Time local group-by and pivot aggregation over a synthetic sheet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--regions", type=int, default=50)
+        parser.add_argument("--products", type=int, default=20)
+        parser.add_argument("--block-rows", type=int, default=5000)
+
+    def _time(self, label, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(f"{label}: {(time.perf_counter() - started) * 1000:.1f}ms")
+        return result
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        count = options["rows"]
+        regions = rng.integers(0, options["regions"], count)
+        products = rng.integers(0, options["products"], count)
+        amounts = np.round(rng.gamma(2.0, 50.0, count), 2)
+        days = rng.integers(0, 365, count)
+        # Values as the API returns them with UNFORMATTED_VALUE: numbers stay
+        # numbers, dates come back as formatted strings, some cells are blank.
+        rows = [
+            [
+                f"region-{regions[i]}",
+                f"product-{products[i]}",
+                "" if i % 97 == 0 else float(amounts[i]),
+                str(np.datetime64("2024-01-01") + int(days[i])),
+            ]
+            for i in range(count)
+        ]
+        header = ["Region", "Product", "Amount", "Date"]
+        block_rows = options["block_rows"]
+        blocks = [[header] + rows[:block_rows]] + [
+            rows[start : start + block_rows] for start in range(block_rows, count, block_rows)
+        ]
+
+        table = self._time(f"columnar load ({count} rows)", lambda: ColumnarTable.from_blocks(blocks))
+        aggregations = ["count:Amount", "sum:Amount", "mean:Amount", "p90:Amount"]
+        _, result = self._time(
+            "numpy group-by (count, sum, mean, p90)",
+            lambda: group_by(table, ["Region"], aggregations),
+        )
+        self._time(
+            "numpy group-by again (column codes cached)",
+            lambda: group_by(table, ["Region"], aggregations),
+        )
+        baseline = self._time("python group-by (count, sum, mean, p90)", lambda: python_group_by(rows))
+        self._time("numpy group-by 2 keys", lambda: group_by(table, ["Region", "Product"], ["sum:Amount"]))
+        self._time("numpy pivot region x product sum", lambda: pivot(table, "Region", "Product", "Amount"))
+        self._time("numpy pivot region x product median", lambda: pivot(table, "Region", "Product", "Amount", "median"))
+        self._time("numpy group-by max date", lambda: group_by(table, ["Product"], ["max:Date"]))
+
+        # statistics.quantiles uses the "exclusive" method; compare the rest.
+        matches = all(
+            row[1] == expected[0] and abs(row[2] - expected[1]) < 1e-6 and abs(row[3] - expected[2]) < 1e-9
+            for row, expected in zip(result, baseline.values())
+        )
+        self.stdout.write(f"results match baseline: {matches}")
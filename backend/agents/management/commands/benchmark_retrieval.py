@@ -0,0 +1,53 @@
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from agents.utils.retrieval import VectorIndex
+
+
+class Command(BaseCommand):
+    help = "Measure vector index query latency with brute-force and IVF search on random vectors."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunks", type=int, default=100000)
+        parser.add_argument("--dim", type=int, default=384)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--nlist", type=int, default=None)
+        parser.add_argument("--nprobe", type=int, default=8)
+
+    def _measure(self, index, queries, k, nprobe=None):
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, k=k, nprobe=nprobe)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return np.percentile(latencies, [50, 95, 99])
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        chunks, dim = options["chunks"], options["dim"]
+        queries = rng.standard_normal((options["queries"], dim), dtype=np.float32)
+
+        with tempfile.TemporaryDirectory() as path:
+            index = VectorIndex(path)
+            started = time.perf_counter()
+            for start in range(0, chunks, 10000):
+                size = min(10000, chunks - start)
+                index.add(rng.standard_normal((size, dim), dtype=np.float32))
+            self.stdout.write(f"Indexed {chunks} x {dim} vectors in {time.perf_counter() - started:.2f}s")
+
+            p50, p95, p99 = self._measure(index, queries, options["k"])
+            self.stdout.write(f"brute-force: p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms")
+
+            started = time.perf_counter()
+            index.build_ivf(nlist=options["nlist"])
+            self.stdout.write(
+                f"Built IVF with {index.meta['nlist']} lists in {time.perf_counter() - started:.2f}s"
+            )
+            p50, p95, p99 = self._measure(index, queries, options["k"], nprobe=options["nprobe"])
+            self.stdout.write(
+                f"ivf (nprobe={options['nprobe']}): p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms"
+            )
@@ -0,0 +1,136 @@
+import csv
+import io
+import time
+import tracemalloc
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from agents.utils.salesforce import SalesforceQueryExecutor
+
+REST_PAGE_SIZE = 2000
+
+
+def _case(i):
+    return {
+        "attributes": {"type": "Case", "url": f"/services/data/v59.0/sobjects/Case/500{i:015d}"},
+        "Id": f"500{i:015d}",
+        "CaseNumber": f"{i:08d}",
+        "Subject": f"Customer issue {i}",
+        "Description": f"Case {i}: " + "the customer reports an intermittent failure " * 4,
+    }
+
+
+class FakeSalesforce:
+    """Serves ``rows`` synthetic cases the way the REST and Bulk 2.0 APIs page them.
+
+    Pages are generated on request, like responses arriving off the wire, so
+    only what the caller keeps counts towards its memory.
+    """
+
+    def __init__(self, rows: int) -> None:
+        self.rows = rows
+        self.calls = Counter()
+
+    def _page(self, offset):
+        end = min(offset + REST_PAGE_SIZE, self.rows)
+        page = {"totalSize": self.rows, "done": end >= self.rows, "records": [_case(i) for i in range(offset, end)]}
+        if not page["done"]:
+            page["nextRecordsUrl"] = f"/services/data/v59.0/query/01gFAKE-{end}"
+        return page
+
+    def query(self, soql, include_deleted=False, **kwargs):
+        self.calls["query"] += 1
+        return self._page(0)
+
+    def query_more(self, next_records_identifier, identifier_is_url=False, include_deleted=False, **kwargs):
+        self.calls["queryMore"] += 1
+        return self._page(int(next_records_identifier.rsplit("-", 1)[1]))
+
+    def query_all(self, soql, include_deleted=False, **kwargs):
+        # Same as simple_salesforce: materialize every page into one list.
+        page = self.query(soql)
+        records = list(page["records"])
+        while not page["done"]:
+            page = self.query_more(page["nextRecordsUrl"], identifier_is_url=True)
+            records.extend(page["records"])
+        return {"totalSize": len(records), "done": True, "records": records}
+
+    @property
+    def bulk2(self):
+        return self
+
+    def __getattr__(self, name):
+        if name[:1].isupper():
+            return _FakeBulkType(self)
+        raise AttributeError(name)
+
+
+class _FakeBulkType:
+    def __init__(self, sf) -> None:
+        self.sf = sf
+
+    def describe(self):
+        return {"fields": [{"name": name, "type": "string"} for name in ("Id", "CaseNumber", "Subject", "Description")]}
+
+    def query(self, soql, max_records=50000, **kwargs):
+        self.sf.calls["bulk job"] += 1
+        fields = ["Id", "CaseNumber", "Subject", "Description"]
+        for start in range(0, self.sf.rows, max_records):
+            self.sf.calls["bulk results"] += 1
+            out = io.StringIO()
+            writer = csv.DictWriter(out, fields, extrasaction="ignore", lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(_case(i) for i in range(start, min(start + max_records, self.sf.rows)))
+            yield out.getvalue()
+
+
+def _summarize(records):
+    """What the account summary does with each record: keep a short line."""
+    count = 0
+    for record in records:
+        count += len(record["Subject"]) > 0
+    return count
+
+
+class Command(BaseCommand):
+    help = "Measure peak memory of reading a large Salesforce result with query_all vs the streaming executor."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--bulk-page-size", type=int, default=10000)
+        parser.add_argument("--max-rows", type=int, default=25)
+
+    def _measure(self, label, sf, func):
+        tracemalloc.start()
+        started = time.perf_counter()
+        count = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{label:>28}: {count} records, peak {peak / 2**20:.1f}MiB, {elapsed:.0f}ms, calls {dict(sf.calls)}"
+        )
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        soql = "SELECT Id, CaseNumber, Subject, Description FROM Case WHERE AccountId = '001FAKE'"
+
+        sf = FakeSalesforce(rows)
+        self._measure("query_all", sf, lambda: _summarize(sf.query_all(soql)["records"]))
+
+        sf = FakeSalesforce(rows)
+        executor = SalesforceQueryExecutor(sf, bulk_threshold=0)
+        self._measure("executor, REST queryMore", sf, lambda: _summarize(executor.iter_records(soql)))
+
+        sf = FakeSalesforce(rows)
+        executor = SalesforceQueryExecutor(sf, bulk_threshold=REST_PAGE_SIZE, bulk_page_size=options["bulk_page_size"])
+        self._measure("executor, Bulk API 2.0", sf, lambda: _summarize(executor.iter_records(soql)))
+
+        sf = FakeSalesforce(rows)
+        executor = SalesforceQueryExecutor(sf, bulk_threshold=REST_PAGE_SIZE)
+        self._measure(
+            f"executor, max_rows={options['max_rows']}",
+            sf,
+            lambda: _summarize(executor.iter_records(soql, max_rows=options["max_rows"])),
+        )
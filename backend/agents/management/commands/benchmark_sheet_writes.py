@@ -0,0 +1,158 @@
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from agents.utils.sheets import A1Range, SheetWriteBuffer, _sheet_key
+
+
+class _Request:
+    def __init__(self, service, method, func):
+        self.service = service
+        self.method = method
+        self.func = func
+
+    def execute(self):
+        self.service.calls[self.method] += 1
+        return self.func()
+
+
+class FakeSheetsService:
+    """In-memory stand-in for the Sheets API that counts calls per method."""
+
+    def __init__(self) -> None:
+        self.calls = Counter()
+        self.grid = defaultdict(dict)
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return _FakeValues(self)
+
+    def batchUpdate(self, spreadsheetId, body):
+        return _Request(self, "spreadsheets.batchUpdate", lambda: {"replies": [{} for _ in body["requests"]]})
+
+    def _write(self, range_name, values):
+        a1 = A1Range.parse(range_name)
+        cells = self.grid[_sheet_key(a1.sheet) or "Sheet1"]
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                if value is not None:
+                    cells[(a1.start_row + i, a1.start_col + j)] = value
+        return sum(len(row) for row in values)
+
+
+class _FakeValues:
+    def __init__(self, service) -> None:
+        self.service = service
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        return _Request(
+            self.service,
+            "values.update",
+            lambda: {"updatedCells": self.service._write(range, body["values"])},
+        )
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            total = sum(self.service._write(item["range"], item["values"]) for item in body["data"])
+            return {"totalUpdatedCells": total}
+
+        return _Request(self.service, "values.batchUpdate", run)
+
+    def append(self, spreadsheetId, range, valueInputOption, body):
+        def run():
+            a1 = A1Range.parse(range)
+            cells = self.service.grid[_sheet_key(a1.sheet) or "Sheet1"]
+            last = max((row for row, _ in cells), default=0)
+            sheet = f"{a1.sheet}!" if a1.sheet else ""
+            self.service._write(f"{sheet}A{last + 1}", body["values"])
+            return {"updates": {"updatedRows": len(body["values"])}}
+
+        return _Request(self.service, "values.append", run)
+
+
+def _row(row, columns):
+    return [f"r{row}c{col}" for col in range(columns)]
+
+
+def row_by_row(sink, rows, columns):
+    for row in range(1, rows + 1):
+        sink.write(f"Sheet1!A{row}:{chr(64 + columns)}{row}", [_row(row, columns)])
+
+
+def cell_by_cell(sink, rows, columns):
+    for row in range(1, rows + 1):
+        for col in range(columns):
+            sink.write(f"Sheet1!{chr(65 + col)}{row}", [[f"r{row}c{col}"]])
+
+
+def append_rows(sink, rows, columns):
+    sink.write(f"Sheet1!A1:{chr(64 + columns)}1", [[f"h{col}" for col in range(columns)]])
+    for row in range(2, rows + 1):
+        sink.append("Sheet1!A1", [_row(row, columns)])
+
+
+def fill_and_fix(sink, rows, columns):
+    row_by_row(sink, rows, columns)
+    # Overlapping corrections of a column and a block the agent wrote earlier.
+    sink.write(f"Sheet1!B1:B{rows}", [[f"fixed{row}"] for row in range(rows)])
+    sink.write("Sheet1!A2:C4", [["x"] * 3] * 3)
+    sink.request({"findReplace": {"find": "x", "replacement": "y", "allSheets": True}})
+
+
+PATTERNS = {
+    "row-by-row": row_by_row,
+    "cell-by-cell": cell_by_cell,
+    "append-rows": append_rows,
+    "fill-and-fix": fill_and_fix,
+}
+
+
+class DirectSink:
+    """Issues one API call per operation, like the unbuffered tools did."""
+
+    def __init__(self, service) -> None:
+        self.service = service
+
+    def write(self, range_name, values):
+        self.service.spreadsheets().values().update(
+            spreadsheetId="bench", range=range_name, valueInputOption="USER_ENTERED", body={"values": values}
+        ).execute()
+
+    def append(self, range_name, values):
+        self.service.spreadsheets().values().append(
+            spreadsheetId="bench", range=range_name, valueInputOption="USER_ENTERED", body={"values": values}
+        ).execute()
+
+    def request(self, *requests):
+        self.service.spreadsheets().batchUpdate(spreadsheetId="bench", body={"requests": requests}).execute()
+
+
+class Command(BaseCommand):
+    help = "Count Sheets API calls for typical fill patterns with and without the write buffer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50)
+        parser.add_argument("--columns", type=int, default=6)
+
+    def handle(self, *args, **options):
+        rows, columns = options["rows"], options["columns"]
+        for name, pattern in PATTERNS.items():
+            direct = FakeSheetsService()
+            pattern(DirectSink(direct), rows, columns)
+
+            buffered = FakeSheetsService()
+            buffer = SheetWriteBuffer(buffered, "bench", max_cells=10**9)
+            started = time.perf_counter()
+            pattern(buffer, rows, columns)
+            buffer.flush()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            status = "ok" if buffered.grid == direct.grid else "MISMATCH"
+            self.stdout.write(
+                f"{name:>13}: direct={sum(direct.calls.values())} calls, "
+                f"buffered={sum(buffered.calls.values())} calls {dict(buffered.calls)} "
+                f"({elapsed:.1f}ms, contents {status})"
+            )
@@ -0,0 +1,17 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agents.utils.checkpoints import DjangoCheckpointSaver
+
+
+class Command(BaseCommand):
+    help = "Delete saved agent graph states of conversations idle for too long."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.AGENT_CHECKPOINT_MAX_AGE_DAYS)
+
+    def handle(self, *args, **options):
+        deleted = DjangoCheckpointSaver.prune(datetime.timedelta(days=options["days"]))
+        self.stdout.write(f"Deleted {deleted} checkpoints older than {options['days']} days")
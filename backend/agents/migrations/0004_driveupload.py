@@ -0,0 +1,92 @@
+# Generated by Django 5.0.4 on 2026-10-19 09:12
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0003_agent_instance_url_alter_agent_state_and_more"),
+        ("integrations", "0003_alter_integration_thirdparty"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DriveUpload",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("file_path", models.CharField(max_length=1024)),
+                ("file_size", models.BigIntegerField()),
+                (
+                    "file_mtime",
+                    models.FloatField(
+                        help_text="Local modification time, part of the file fingerprint"
+                    ),
+                ),
+                ("mimetype", models.CharField(max_length=255)),
+                (
+                    "folder_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("session_uri", models.TextField(blank=True, null=True)),
+                ("bytes_uploaded", models.BigIntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("uploading", "Uploading"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "drive_file_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "throughput",
+                    models.FloatField(
+                        blank=True, help_text="Bytes per second of the last run", null=True
+                    ),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "integration",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="drive_uploads",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["file_path", "file_size", "file_mtime", "folder_id"],
+                        name="agents_driveupload_fprint_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:03
+
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0004_driveupload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentText",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("file_id", models.CharField(max_length=255, unique=True)),
+                ("revision", models.CharField(max_length=255)),
+                ("mimetype", models.CharField(max_length=255)),
+                ("name", models.CharField(blank=True, default="", max_length=1024)),
+                ("text", models.TextField(blank=True, default="")),
+                (
+                    "extraction_time",
+                    models.FloatField(
+                        default=0, help_text="Seconds spent fetching and parsing"
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
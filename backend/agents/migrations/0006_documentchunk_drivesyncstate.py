@@ -0,0 +1,94 @@
+# Generated by Django 5.0.4 on 2026-10-19 11:20
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0005_documenttext"),
+        ("integrations", "0004_integration_refresh_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentChunk",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("file_id", models.CharField(max_length=255)),
+                ("revision", models.CharField(max_length=255)),
+                ("chunk_index", models.PositiveIntegerField()),
+                (
+                    "row",
+                    models.PositiveIntegerField(
+                        help_text="Row of the chunk's vector in the index matrix"
+                    ),
+                ),
+                ("text", models.TextField()),
+                (
+                    "integration",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="document_chunks",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["integration", "row"], name="agents_chunk_row_idx"
+                    ),
+                    models.Index(
+                        fields=["integration", "file_id"], name="agents_chunk_file_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DriveSyncState",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "page_token",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("last_synced_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "integration",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="drive_sync_state",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
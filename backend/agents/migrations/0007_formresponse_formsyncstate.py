@@ -0,0 +1,104 @@
+# Generated by Django 5.0.4 on 2026-10-19 12:45
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0006_documentchunk_drivesyncstate"),
+        ("integrations", "0004_integration_refresh_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FormResponse",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("form_id", models.CharField(max_length=255)),
+                ("response_id", models.CharField(max_length=255)),
+                (
+                    "respondent_email",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("create_time", models.DateTimeField()),
+                ("last_submitted_time", models.DateTimeField()),
+                (
+                    "answers",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Question id to the list of answer values",
+                    ),
+                ),
+                ("total_score", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["form_id", "last_submitted_time"],
+                        name="agents_formresponse_time_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("form_id", "response_id"),
+                        name="agents_formresponse_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="FormSyncState",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("form_id", models.CharField(max_length=255, unique=True)),
+                ("title", models.CharField(blank=True, default="", max_length=1024)),
+                ("last_submitted_time", models.DateTimeField(blank=True, null=True)),
+                ("response_count", models.PositiveIntegerField(default=0)),
+                (
+                    "summary",
+                    models.JSONField(
+                        default=dict, help_text="Question id to answer statistics"
+                    ),
+                ),
+                ("last_synced_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "integration",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="form_sync_states",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:10
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0007_formresponse_formsyncstate"),
+        ("integrations", "0004_integration_refresh_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FormWatch",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("form_id", models.CharField(max_length=255)),
+                ("watch_id", models.CharField(max_length=255)),
+                ("event_type", models.CharField(default="RESPONSES", max_length=50)),
+                ("topic_name", models.CharField(max_length=255)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("ACTIVE", "Active"),
+                            ("SUSPENDED", "Suspended"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="ACTIVE",
+                        max_length=20,
+                    ),
+                ),
+                ("expire_time", models.DateTimeField()),
+                ("renew_at", models.DateTimeField()),
+                ("error", models.TextField(blank=True, default="")),
+                (
+                    "integration",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="form_watches",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("form_id", "watch_id"), name="agents_formwatch_unique"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:40
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0008_formwatch"),
+        ("integrations", "0004_integration_refresh_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KnowledgeArticle",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "knowledge_article_id",
+                    models.CharField(
+                        help_text="KnowledgeArticleId, shared by all versions of an article",
+                        max_length=18,
+                    ),
+                ),
+                (
+                    "version_id",
+                    models.CharField(
+                        help_text="Id of the Knowledge__kav version", max_length=18
+                    ),
+                ),
+                ("title", models.CharField(max_length=255)),
+                ("question", models.TextField(blank=True, default="")),
+                ("answer", models.TextField(blank=True, default="")),
+                ("url_name", models.CharField(blank=True, default="", max_length=255)),
+                ("last_modified", models.DateTimeField()),
+                (
+                    "embedding",
+                    models.BinaryField(
+                        blank=True, help_text="float32 vector, if enabled", null=True
+                    ),
+                ),
+                (
+                    "integration",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knowledge_articles",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("integration", "knowledge_article_id"),
+                        name="agents_knowledge_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="KnowledgeSyncState",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("last_modified", models.DateTimeField(blank=True, null=True)),
+                ("last_synced_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "integration",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knowledge_sync_state",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:10
+
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0009_knowledgearticle_knowledgesyncstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GraphCheckpoint",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "thread_id",
+                    models.CharField(help_text="Conversation the graph state belongs to", max_length=255),
+                ),
+                (
+                    "checkpoint_id",
+                    models.CharField(help_text="Increasing id assigned by LangGraph", max_length=64),
+                ),
+                ("parent_id", models.CharField(blank=True, max_length=64, null=True)),
+                ("checkpoint", models.BinaryField()),
+                ("metadata", models.BinaryField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["created_at"], name="agents_checkpoint_created_idx"),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="graphcheckpoint",
+            constraint=models.UniqueConstraint(
+                fields=("thread_id", "checkpoint_id"), name="agents_checkpoint_unique"
+            ),
+        ),
+    ]
@@ -75,3 +75,251 @@ class Agent(AbstractBaseModel):
         }
         response = requests.post(token_url, data=data)
         return response
+
+
+class DriveUpload(AbstractBaseModel):
+    """A resumable Google Drive upload session.
+
+    The session URI and committed byte offset are saved after every chunk so a
+    crashed worker can pick the upload back up mid-file.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        UPLOADING = "uploading", "Uploading"
+        COMPLETED = "completed", "Completed"
+        FAILED = "failed", "Failed"
+
+    integration = models.ForeignKey(
+        Integration,
+        on_delete=models.CASCADE,
+        related_name="drive_uploads",
+        null=True,
+        blank=True,
+    )
+    file_path = models.CharField(max_length=1024)
+    file_size = models.BigIntegerField()
+    file_mtime = models.FloatField(help_text="Local modification time, part of the file fingerprint")
+    mimetype = models.CharField(max_length=255)
+    folder_id = models.CharField(max_length=255, null=True, blank=True)
+    session_uri = models.TextField(null=True, blank=True)
+    bytes_uploaded = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    drive_file_id = models.CharField(max_length=255, null=True, blank=True)
+    throughput = models.FloatField(null=True, blank=True, help_text="Bytes per second of the last run")
+    error = models.TextField(blank=True, default="")
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["file_path", "file_size", "file_mtime", "folder_id"],
+                name="agents_driveupload_fprint_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.file_path} ({self.status})"
+
+    @property
+    def progress(self) -> float:
+        if not self.file_size:
+            return 1.0
+        return self.bytes_uploaded / self.file_size
+
+
+class DocumentText(AbstractBaseModel):
+    """Plain text extracted from a Drive file, valid for a single revision.
+
+    ``revision`` is the Docs ``revisionId`` for Google Docs, the ``md5Checksum``
+    for binary files and the Drive ``version`` for other native formats.
+    """
+
+    file_id = models.CharField(max_length=255, unique=True)
+    revision = models.CharField(max_length=255)
+    mimetype = models.CharField(max_length=255)
+    name = models.CharField(max_length=1024, blank=True, default="")
+    text = models.TextField(blank=True, default="")
+    extraction_time = models.FloatField(default=0, help_text="Seconds spent fetching and parsing")
+
+    def __str__(self):
+        return f"{self.name or self.file_id}@{self.revision}"
+
+
+class DocumentChunk(AbstractBaseModel):
+    """A chunk of document text and its row in the integration's vector index."""
+
+    integration = models.ForeignKey(
+        Integration, on_delete=models.CASCADE, related_name="document_chunks"
+    )
+    file_id = models.CharField(max_length=255)
+    revision = models.CharField(max_length=255)
+    chunk_index = models.PositiveIntegerField()
+    row = models.PositiveIntegerField(help_text="Row of the chunk's vector in the index matrix")
+    text = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["integration", "row"], name="agents_chunk_row_idx"),
+            models.Index(fields=["integration", "file_id"], name="agents_chunk_file_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.file_id}#{self.chunk_index}"
+
+
+class DriveSyncState(AbstractBaseModel):
+    """Drive changes cursor of an integration, used for incremental syncs."""
+
+    integration = models.OneToOneField(
+        Integration, on_delete=models.CASCADE, related_name="drive_sync_state"
+    )
+    page_token = models.CharField(max_length=255, null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.integration_id}: {self.page_token}"
+
+
+class FormResponse(AbstractBaseModel):
+    """A Google Form response stored locally, with answers keyed by question id."""
+
+    form_id = models.CharField(max_length=255)
+    response_id = models.CharField(max_length=255)
+    respondent_email = models.CharField(max_length=255, blank=True, default="")
+    create_time = models.DateTimeField()
+    last_submitted_time = models.DateTimeField()
+    answers = models.JSONField(default=dict, help_text="Question id to the list of answer values")
+    total_score = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["form_id", "response_id"], name="agents_formresponse_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["form_id", "last_submitted_time"], name="agents_formresponse_time_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.form_id}/{self.response_id}"
+
+
+class FormSyncState(AbstractBaseModel):
+    """Ingestion cursor and precomputed per-question summary of a form's responses."""
+
+    form_id = models.CharField(max_length=255, unique=True)
+    integration = models.ForeignKey(
+        Integration,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="form_sync_states",
+    )
+    title = models.CharField(max_length=1024, blank=True, default="")
+    last_submitted_time = models.DateTimeField(null=True, blank=True)
+    response_count = models.PositiveIntegerField(default=0)
+    summary = models.JSONField(default=dict, help_text="Question id to answer statistics")
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.form_id}: {self.response_count} responses"
+
+
+class FormWatch(AbstractBaseModel):
+    """A Forms API watch that publishes form events to a Pub/Sub topic.
+
+    Watches expire seven days after creation or renewal; ``renew_at`` is when
+    the scheduled renewal is due and identifies the current renewal job.
+    """
+
+    class State(models.TextChoices):
+        ACTIVE = "ACTIVE", "Active"
+        SUSPENDED = "SUSPENDED", "Suspended"
+        FAILED = "FAILED", "Failed"
+
+    integration = models.ForeignKey(
+        Integration, on_delete=models.CASCADE, related_name="form_watches"
+    )
+    form_id = models.CharField(max_length=255)
+    watch_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=50, default="RESPONSES")
+    topic_name = models.CharField(max_length=255)
+    state = models.CharField(max_length=20, choices=State.choices, default=State.ACTIVE)
+    expire_time = models.DateTimeField()
+    renew_at = models.DateTimeField()
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["form_id", "watch_id"], name="agents_formwatch_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.form_id}/{self.watch_id} ({self.event_type})"
+
+
+class KnowledgeArticle(AbstractBaseModel):
+    """Local copy of the online version of a Salesforce Knowledge article."""
+
+    integration = models.ForeignKey(
+        Integration, on_delete=models.CASCADE, related_name="knowledge_articles"
+    )
+    knowledge_article_id = models.CharField(
+        max_length=18, help_text="KnowledgeArticleId, shared by all versions of an article"
+    )
+    version_id = models.CharField(max_length=18, help_text="Id of the Knowledge__kav version")
+    title = models.CharField(max_length=255)
+    question = models.TextField(blank=True, default="")
+    answer = models.TextField(blank=True, default="")
+    url_name = models.CharField(max_length=255, blank=True, default="")
+    last_modified = models.DateTimeField()
+    embedding = models.BinaryField(null=True, blank=True, help_text="float32 vector, if enabled")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["integration", "knowledge_article_id"], name="agents_knowledge_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class KnowledgeSyncState(AbstractBaseModel):
+    """LastModifiedDate watermark of an integration's Knowledge mirror."""
+
+    integration = models.OneToOneField(
+        Integration, on_delete=models.CASCADE, related_name="knowledge_sync_state"
+    )
+    last_modified = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.integration_id}: {self.last_modified}"
+
+
+class GraphCheckpoint(AbstractBaseModel):
+    """A saved LangGraph state of one conversation, see ``DjangoCheckpointSaver``."""
+
+    thread_id = models.CharField(max_length=255, help_text="Conversation the graph state belongs to")
+    checkpoint_id = models.CharField(max_length=64, help_text="Increasing id assigned by LangGraph")
+    parent_id = models.CharField(max_length=64, null=True, blank=True)
+    checkpoint = models.BinaryField()
+    metadata = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["thread_id", "checkpoint_id"], name="agents_checkpoint_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["created_at"], name="agents_checkpoint_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.thread_id}@{self.checkpoint_id}"
@@ -0,0 +1,157 @@
+import logging
+
+import dramatiq
+import requests
+from django.conf import settings
+from django.utils import timezone
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from simple_salesforce.exceptions import SalesforceExpiredSession
+
+from common.redis import get_redis
+from integrations.models import Integration
+
+from .models import FormWatch
+from .utils.form_events import FormWatchManager, release_form_sync
+from .utils.forms import FormResponseIngestor
+from .utils.knowledge import KnowledgeMirror
+from .utils.retrieval import DocumentIndexer, index_lock
+from .utils.salesforce import refresh_salesforce_token, salesforce_client
+
+logger = logging.getLogger(__name__)
+
+SYNC_CHAIN_KEY = "sync-chain:{name}:{integration_id}"
+
+
+def _claim_sync_chain(name, integration_id, interval, renew=False) -> bool:
+    """Mark the self-rescheduling sync ``name`` of an integration as running.
+
+    False if a chain is already running. Each run renews the key before
+    scheduling the next one; it expires when the chain stops, so the sync
+    can be started again.
+    """
+    return bool(
+        get_redis().set(
+            SYNC_CHAIN_KEY.format(name=name, integration_id=integration_id),
+            1,
+            nx=not renew,
+            ex=interval * 2,
+        )
+    )
+
+
+def start_knowledge_sync(integration_id):
+    """Start mirroring the integration's Knowledge articles, unless it already is."""
+    if _claim_sync_chain("knowledge", integration_id, settings.KNOWLEDGE_SYNC_INTERVAL):
+        sync_knowledge.send(integration_id)
+
+
+def start_document_sync(integration_id):
+    """Start syncing Drive changes into the integration's index, unless it already is."""
+    if _claim_sync_chain("documents", integration_id, settings.RETRIEVAL_SYNC_INTERVAL):
+        sync_document_index.send(integration_id)
+
+
+@dramatiq.actor
+def index_documents(integration_id, file_ids):
+    integration = Integration.objects.get(id=integration_id)
+    with index_lock(integration_id):
+        indexer = DocumentIndexer(integration)
+        for file_id in file_ids:
+            try:
+                indexer.index_file(file_id)
+            except Exception:
+                logger.exception("Failed to index Drive file %s", file_id)
+
+
+# The chain is its own retry: a retried run would schedule a second chain
+@dramatiq.actor(max_retries=0)
+def sync_document_index(integration_id, reschedule=True):
+    """Apply Drive changes to the integration's retrieval index, then schedule the next run."""
+    integration = Integration.objects.filter(id=integration_id).first()
+    if integration is None:
+        return
+    try:
+        with index_lock(integration_id):
+            indexer = DocumentIndexer(integration)
+            touched = indexer.sync_changes()
+            logger.info("Synced %d changed files into index of %s", touched, integration_id)
+            if indexer.maybe_compact():
+                logger.info("Compacted index of %s", integration_id)
+    finally:
+        if reschedule:
+            interval = settings.RETRIEVAL_SYNC_INTERVAL
+            _claim_sync_chain("documents", integration_id, interval, renew=True)
+            sync_document_index.send_with_options(args=(integration_id,), delay=interval * 1000)
+
+
+@dramatiq.actor(max_retries=0)
+def sync_knowledge(integration_id, reschedule=True):
+    """Pull Knowledge articles changed since the last sync into the local mirror, then schedule the next run.
+
+    An expired access token is refreshed once; when Salesforce rejects the
+    refresh token too, the chain stops until the user authorizes the agent again.
+    """
+    integration = Integration.objects.filter(id=integration_id).select_related("agent").first()
+    if integration is None:
+        return
+    authorized = True
+    try:
+        try:
+            KnowledgeMirror(salesforce_client(integration), integration).sync()
+        except SalesforceExpiredSession:
+            refresh_salesforce_token(integration)
+            KnowledgeMirror(salesforce_client(integration), integration).sync()
+    except (SalesforceExpiredSession, requests.HTTPError):
+        authorized = False
+        logger.exception("Stopping Knowledge sync of %s: Salesforce rejected its credentials", integration_id)
+    finally:
+        if reschedule and authorized:
+            interval = settings.KNOWLEDGE_SYNC_INTERVAL
+            _claim_sync_chain("knowledge", integration_id, interval, renew=True)
+            sync_knowledge.send_with_options(args=(integration_id,), delay=interval * 1000)
+
+
+@dramatiq.actor
+def sync_form_responses(form_id):
+    """Fetch the responses submitted to a form since its last sync."""
+    release_form_sync(form_id)
+    watch = (
+        FormWatch.objects.filter(form_id=form_id, state=FormWatch.State.ACTIVE)
+        .select_related("integration")
+        .first()
+    )
+    if watch is None:
+        logger.info("No active watch for form %s, skipping event", form_id)
+        return
+    service = build("forms", "v1", credentials=watch.integration.credentials)
+    FormResponseIngestor(service, integration=watch.integration).sync(form_id)
+
+
+def schedule_form_watch_renewal(watch: FormWatch):
+    delay = max((watch.renew_at - timezone.now()).total_seconds(), 0)
+    renew_form_watch.send_with_options(
+        args=(watch.id, watch.renew_at.isoformat()), delay=int(delay * 1000)
+    )
+
+
+@dramatiq.actor
+def renew_form_watch(watch_id, renew_at):
+    """Renew a watch ahead of its 7-day expiry, then schedule the next renewal.
+
+    ``renew_at`` identifies the job: when a watch is renewed some other way
+    its ``renew_at`` moves on and this, now stale, job does nothing.
+    """
+    watch = FormWatch.objects.filter(id=watch_id).select_related("integration").first()
+    if watch is None or watch.renew_at.isoformat() != renew_at:
+        return
+    service = build("forms", "v1", credentials=watch.integration.credentials)
+    try:
+        watch = FormWatchManager(service, watch.integration).renew(watch)
+    except HttpError as error:
+        logger.exception("Failed to renew watch %s on form %s", watch.watch_id, watch.form_id)
+        watch.state = FormWatch.State.FAILED
+        watch.error = str(error)
+        watch.save(update_fields=["state", "error", "updated_at"])
+        return
+    schedule_form_watch_renewal(watch)
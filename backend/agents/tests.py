@@ -1,3 +1,1140 @@
-from django.test import TestCase
+import base64
+import contextvars
+import datetime
+import json
+import operator
+import os
+import re
+import tempfile
+import threading
+from typing import Annotated, TypedDict
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httplib2
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import END, StateGraph
+from simple_salesforce.exceptions import SalesforceError
+
+from accounts.models import User
+from common.models import ThirdParty
+from integrations.models import Integration
+
+from . import tasks
+from .models import DocumentText, DriveUpload, FormResponse, FormWatch, GraphCheckpoint, KnowledgeArticle
+from .utils.aggregation import group_by, pivot
+from .utils.batch import DriveBatchExecutor
+from .utils.checkpoints import DjangoCheckpointSaver, trim_messages
+from .utils.extraction import GOOGLE_DOC, DocumentTextExtractor, document_to_text
+from .utils.form_events import FormWatchManager, LocalFormEventPublisher, parse_push_envelope, release_form_sync
+from .utils.forms import FormResponseIngestor, count_answers, parse_time
+from .utils.knowledge import BM25Index, KnowledgeIndex, KnowledgeMirror, _indexes
+from .utils.retrieval import VectorIndex
+from .utils.salesforce import SalesforceQueryExecutor, SObjectCollectionExecutor
+from .utils.sheets import A1Range, ColumnarTable, SheetReader, SheetWriteBuffer, hold_for_turn, sheet_write_turn
+from .utils.uploads import CHUNK_ALIGNMENT, ResumableUploader
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class A1RangeTests(SimpleTestCase):
+    def test_parses_qualified_range(self):
+        a1 = A1Range.parse("Sheet1!B2:D10")
+        self.assertEqual((a1.sheet, a1.start_col, a1.start_row, a1.end_col, a1.end_row), ("Sheet1", 1, 2, 3, 10))
+        self.assertEqual(a1.to_a1(), "Sheet1!B2:D10")
+
+    def test_single_cell(self):
+        a1 = A1Range.parse("AB12")
+        self.assertEqual((a1.start_col, a1.start_row, a1.end_col, a1.end_row), (27, 12, 27, 12))
+
+    def test_open_ended_columns_and_rows(self):
+        a1 = A1Range.parse("'My Sheet'!A:C")
+        self.assertEqual((a1.sheet, a1.start_row, a1.end_col, a1.end_row), ("'My Sheet'", 1, 2, None))
+        a1 = A1Range.parse("5:100")
+        self.assertEqual((a1.start_col, a1.start_row, a1.end_col, a1.end_row), (0, 5, None, 100))
+        self.assertEqual(a1.to_a1(), "5:100")
+
+    def test_bare_sheet_name_is_the_whole_sheet(self):
+        a1 = A1Range.parse("Sheet1")
+        self.assertEqual((a1.sheet, a1.start_row, a1.end_col, a1.end_row), ("Sheet1", 1, None, None))
+        self.assertEqual(a1.to_a1(), "Sheet1")
+
+    def test_invalid_cell_reference(self):
+        with self.assertRaises(ValueError):
+            A1Range.parse("Sheet1!??")
+
+
+class SheetReaderTests(SimpleTestCase):
+    def setUp(self):
+        header = [["Region", "Amount", "Closed", "Won"]]
+        body = [["North" if i % 2 else "South", i * 10, f"2024-01-{i:02d}", i % 3 == 0] for i in range(1, 12)]
+        self.grid = header + body
+        self.service = mock.MagicMock()
+        self.values = self.service.spreadsheets.return_value.values.return_value
+        self.values.get.side_effect = self.get
+
+    def get(self, spreadsheetId, range, **kwargs):
+        a1 = A1Range.parse(range)
+        rows = self.grid[a1.start_row - 1 : a1.end_row]
+        return mock.Mock(execute=mock.Mock(return_value={"values": rows} if rows else {}))
+
+    def ranges(self):
+        return [call.kwargs["range"] for call in self.values.get.call_args_list]
+
+    def test_reads_in_blocks_until_the_data_ends(self):
+        table = SheetReader(self.service, "sheet-id", block_rows=5).read("Data!A:D")
+        self.assertEqual(self.ranges(), ["Data!A1:D5", "Data!A6:D10", "Data!A11:D15"])
+        self.assertEqual(len(table), 11)
+        self.assertEqual(table.header, ["Region", "Amount", "Closed", "Won"])
+
+    def test_bounded_range_stops_at_its_end(self):
+        rows = list(SheetReader(self.service, "sheet-id", block_rows=4).iter_rows("Data!A2:B6"))
+        self.assertEqual(self.ranges(), ["Data!A2:B5", "Data!A6:B6"])
+        self.assertEqual(len(rows), 5)
+
+    def test_columns_are_typed(self):
+        table = SheetReader(self.service, "sheet-id", block_rows=5).read("Data!A:D")
+        self.assertEqual(table.kinds, ["string", "number", "date", "bool"])
+        self.assertEqual(table.column("amount").dtype, np.float64)
+        self.assertEqual(str(table.column("Closed")[0]), "2024-01-01T00:00:00")
+        self.assertEqual(table.aggregate("Amount", "sum", table.mask("Region", "==", "north")), 360.0)
+        self.assertEqual(table.aggregate("Closed", "max"), "2024-01-11T00:00:00")
+        self.assertEqual(
+            next(table.iter_rows()), {"Region": "North", "Amount": 10, "Closed": "2024-01-01T00:00:00", "Won": False}
+        )
+
+    def test_formatted_numbers_are_parsed(self):
+        table = ColumnarTable.from_blocks(
+            [[["Price"], ["$1,234.50"], ["45%"], ["(3)"], [""]]], value_render_option="FORMATTED_VALUE"
+        )
+        self.assertEqual(table.kinds, ["number"])
+        np.testing.assert_array_equal(table.columns[0], [1234.5, 0.45, -3.0, np.nan])
+
+    def test_blocks_of_different_types_fall_back_to_text(self):
+        table = ColumnarTable.from_blocks([[["Code"], [1], [2]], [[""], ["A7"]]])
+        self.assertEqual(table.kinds, ["string"])
+        self.assertEqual(list(table.columns[0]), ["1", "2", "", "A7"])
+        # Blank blocks keep the type of the others
+        table = ColumnarTable.from_blocks([[["Amount"], [1]], [[""], [""]], [[3]]])
+        self.assertEqual(table.kinds, ["number"])
+
+    def test_unknown_column(self):
+        table = ColumnarTable.from_blocks([[["Name"], ["a"]]])
+        self.assertEqual(table.column_index("A"), 0)
+        with self.assertRaises(KeyError):
+            table.column("Missing")
+
+
+class AggregationTests(SimpleTestCase):
+    def setUp(self):
+        self.table = ColumnarTable.from_blocks(
+            [
+                [
+                    ["Region", "Rep", "Amount", "Closed"],
+                    ["East", "Ann", 10, "2024-01-05"],
+                    ["West", "Bob", 5, "2024-02-01"],
+                    ["East", "Cid", 30, "2024-01-20"],
+                ],
+                # A second block, as SheetReader yields them; the blank amount is skipped
+                [
+                    ["West", "Bob", ""],
+                    ["East", "Ann", 20, "2024-03-01"],
+                ],
+            ]
+        )
+
+    def test_column_kinds(self):
+        self.assertEqual(self.table.kinds, ["string", "string", "number", "date"])
+        self.assertEqual(len(self.table), 5)
+
+    def test_group_by_one_column(self):
+        header, rows = group_by(self.table, ["region"], ["count", "sum:Amount", "mean:Amount", "max:Closed"])
+        self.assertEqual(header, ["Region", "count", "sum:Amount", "mean:Amount", "max:Closed"])
+        self.assertEqual(
+            rows,
+            [
+                ["East", 3, 60, 20, "2024-03-01T00:00:00"],
+                ["West", 2, 5, 5, "2024-02-01T00:00:00"],
+            ],
+        )
+
+    def test_group_by_several_columns(self):
+        header, rows = group_by(self.table, ["Region", "Rep"], ["sum:Amount"])
+        self.assertEqual(header, ["Region", "Rep", "sum:Amount"])
+        self.assertEqual(rows, [["East", "Ann", 30], ["East", "Cid", 30], ["West", "Bob", 5]])
+
+    def test_percentiles_interpolate(self):
+        _, rows = group_by(self.table, ["Region"], ["p50:Amount", "p90:Amount", "median:Amount"])
+        # East amounts are 10, 20, 30: p90 sits 80% of the way from 20 to 30
+        self.assertEqual(rows[0][1:], [20, 28, 20])
+        self.assertEqual(rows[1][1:], [5, 5, 5])
+
+    def test_pivot_sum(self):
+        header, rows = pivot(self.table, "Region", "Rep", "Amount")
+        self.assertEqual(header, ["Region", "Ann", "Bob", "Cid"])
+        self.assertEqual(rows, [["East", 30, None, 30], ["West", None, 5, None]])
+
+    def test_pivot_without_value_counts_rows(self):
+        _, rows = pivot(self.table, "Region", "Rep")
+        self.assertEqual(rows, [["East", 2, None, 1], ["West", None, 2, None]])
+
+
+def sheets_service():
+    service = mock.MagicMock()
+    values = service.spreadsheets.return_value.values.return_value
+    values.batchUpdate.return_value.execute.return_value = {"totalUpdatedCells": 4}
+    values.append.return_value.execute.return_value = {"updates": {"updatedRows": 1}}
+    return service
+
+
+class SheetWriteBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.service = sheets_service()
+        self.values = self.service.spreadsheets.return_value.values.return_value
+        self.buffer = SheetWriteBuffer(self.service, "sheet-id")
+
+    def test_adjacent_writes_are_sent_as_one_range(self):
+        self.buffer.write("Sheet1!A1:B1", [["a", "b"]])
+        self.buffer.write("Sheet1!A2", [["c", "d"]])
+        self.buffer.write("Sheet1!B2", [["D"]])
+        result = self.buffer.flush()
+        self.assertEqual(result["api_calls"], 1)
+        body = self.values.batchUpdate.call_args.kwargs["body"]
+        self.assertEqual(body["data"], [{"range": "Sheet1!A1:B2", "values": [["a", "b"], ["c", "D"]]}])
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_consecutive_appends_are_joined(self):
+        self.buffer.append("Log!A:B", [["1", "x"]], "RAW")
+        self.buffer.append("Log!A:B", [["2", "y"]], "RAW")
+        self.buffer.flush()
+        self.values.append.assert_called_once()
+        self.assertEqual(self.values.append.call_args.kwargs["body"], {"values": [["1", "x"], ["2", "y"]]})
+
+    def test_failed_flush_keeps_unsent_writes(self):
+        self.buffer.write("Sheet1!A1", [["a"]])
+        self.values.batchUpdate.return_value.execute.side_effect = [ConnectionError("down"), {}]
+        with self.assertRaises(ConnectionError):
+            self.buffer.flush()
+        self.assertEqual(len(self.buffer), 1)
+        self.buffer.flush()
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.values.batchUpdate.call_count, 2)
+
+
+class SheetWriteTurnTests(SimpleTestCase):
+    def test_writers_are_flushed_once_when_the_turn_ends(self):
+        writer = mock.Mock()
+        self.assertFalse(hold_for_turn(writer))
+        with sheet_write_turn():
+            self.assertTrue(hold_for_turn(writer))
+            self.assertTrue(hold_for_turn(writer))
+            writer.flush.assert_not_called()
+        writer.flush.assert_called_once_with()
+        self.assertFalse(hold_for_turn(writer))
+
+    def test_writes_of_tool_threads_join_the_turn(self):
+        # LangChain runs tools in threads with a copy of the caller's context
+        writer = mock.Mock()
+        with sheet_write_turn():
+            thread = threading.Thread(target=contextvars.copy_context().run, args=(hold_for_turn, writer))
+            thread.start()
+            thread.join()
+        writer.flush.assert_called_once_with()
+
+    def test_failed_turn_still_sends_its_writes(self):
+        writer, broken = mock.Mock(), mock.Mock()
+        broken.flush.side_effect = ConnectionError("down")
+        with self.assertRaisesMessage(RuntimeError, "agent failed"), self.assertLogs("agents.utils.sheets", "ERROR"):
+            with sheet_write_turn():
+                hold_for_turn(broken)
+                hold_for_turn(writer)
+                raise RuntimeError("agent failed")
+        writer.flush.assert_called_once_with()
+
+
+class VectorIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.index = VectorIndex(self.path)
+
+    def test_search_returns_nearest_live_rows(self):
+        rows = self.index.add(np.eye(3))
+        self.assertEqual(list(rows), [0, 1, 2])
+        hits = self.index.search(np.array([0.1, 1.0, 0.0]), k=2)
+        self.assertEqual([row for row, _ in hits], [1, 0])
+        self.assertAlmostEqual(hits[0][1], 1 / np.sqrt(1.01), places=5)
+
+        self.index.remove([1])
+        self.assertEqual(self.index.size, 2)
+        self.assertEqual([row for row, _ in self.index.search(np.array([0.0, 1.0, 0.0]), k=3)], [0, 2])
+
+    def test_rejects_other_dimensions(self):
+        self.index.add(np.eye(3))
+        with self.assertRaises(ValueError):
+            self.index.add(np.ones((1, 4)))
+
+    def test_grows_past_initial_capacity(self):
+        vectors = np.random.default_rng(1).normal(size=(3000, 8))
+        self.index.add(vectors[:10])
+        self.index.add(vectors[10:])
+        self.assertEqual(self.index.count, 3000)
+        self.assertEqual(self.index.search(vectors[2500], k=1)[0][0], 2500)
+
+    def test_compact_drops_dead_rows(self):
+        self.index.add(np.eye(4))
+        self.index.remove([0, 2])
+        mapping = self.index.compact()
+        self.assertEqual(list(mapping), [-1, 0, -1, 1])
+        self.assertEqual((self.index.count, self.index.size), (2, 2))
+        self.assertEqual(self.index.search(np.array([0.0, 0.0, 0.0, 1.0]), k=1)[0][0], 1)
+        # New rows go after the compacted ones
+        self.assertEqual(list(self.index.add(np.eye(4)[:1])), [2])
+
+    def test_reopened_index_sees_rows_and_later_writes(self):
+        self.index.add(np.eye(3)[:2])
+        reader = VectorIndex(self.path)
+        self.assertEqual(reader.count, 2)
+
+        self.index.add(np.eye(3)[2:])
+        self.index.remove([0])
+        self.index.compact()
+        reader.refresh()
+        self.assertEqual(reader.count, 2)
+        self.assertEqual(reader.search(np.array([0.0, 0.0, 1.0]), k=1)[0][0], 1)
+
+    def test_ivf_search_probes_the_closest_partitions(self):
+        rng = np.random.default_rng(0)
+        centers = np.eye(4, 16) * 10
+        vectors = np.concatenate([center + rng.normal(size=(50, 16)) for center in centers])
+        self.index.add(vectors)
+        query = vectors[120] + rng.normal(scale=0.01, size=16)
+        exact = self.index.search(query, k=5)
+
+        self.index.build_ivf(nlist=4)
+        self.assertEqual(self.index.centroids.shape, (4, 16))
+        self.assertEqual(self.index.search(query, k=5, nprobe=4), exact)
+        # The query's own cluster holds its nearest neighbours
+        hits = self.index.search(query, k=5, nprobe=1)
+        self.assertEqual(hits[0][0], 120)
+        self.assertTrue(all(100 <= row < 150 for row, _ in hits))
+
+        # Rows added after the build are assigned to a partition
+        row = self.index.add(centers[:1])[0]
+        self.assertEqual(self.index.search(centers[0], k=1, nprobe=1)[0][0], row)
+
+    def test_compact_keeps_ivf_assignments(self):
+        rng = np.random.default_rng(0)
+        vectors = np.concatenate([center + rng.normal(size=(20, 8)) for center in np.eye(2, 8) * 10])
+        self.index.add(vectors)
+        self.index.build_ivf(nlist=2)
+        self.index.remove(list(range(0, 40, 2)))
+        mapping = self.index.compact()
+        self.assertEqual(self.index.search(vectors[25], k=1, nprobe=1)[0][0], mapping[25])
+
+
+class BM25IndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = BM25Index(
+            [
+                "Reset your password from the profile page",
+                "Configure email forwarding in mail settings",
+                "Billing cycle: invoices are issued monthly",
+                "Password rules: a password needs twelve characters, and the password expires yearly",
+            ]
+        )
+
+    def test_ranks_documents_containing_the_terms(self):
+        scores = self.index.scores("password reset")
+        self.assertEqual(int(np.argmax(scores)), 0)
+        self.assertEqual(list(np.flatnonzero(scores)), [0, 3])
+
+    def test_term_frequency_saturates_against_length(self):
+        scores = self.index.scores("password")
+        # Three mentions in a long document beat one in a short one, but by less than 3x
+        self.assertGreater(scores[3], scores[0])
+        self.assertLess(scores[3], 3 * scores[0])
+
+    def test_rare_terms_weigh_more(self):
+        index = BM25Index(["apple banana", "apple cherry", "apple durian"])
+        self.assertGreater(index.scores("banana")[0], index.scores("apple")[0])
+
+    def test_unknown_terms_and_empty_corpus(self):
+        self.assertFalse(self.index.scores("kubernetes").any())
+        self.assertEqual(len(BM25Index([]).scores("anything")), 0)
+
+
+class ConversationState(TypedDict):
+    messages: Annotated[list, operator.add]
+
+
+def echo_graph(checkpointer):
+    """A graph that answers with the number of messages it was given."""
+    graph = StateGraph(ConversationState)
+    graph.add_node("echo", lambda state: {"messages": [("ai", f"seen {len(state['messages'])}")]})
+    graph.set_entry_point("echo")
+    graph.add_edge("echo", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+class DjangoCheckpointSaverTests(TestCase):
+    def setUp(self):
+        self.saver = DjangoCheckpointSaver()
+
+    async def test_graph_resumes_the_conversation_in_another_process(self):
+        # The async methods run the queries on the test's thread; the sync
+        # ones are called from LangGraph's pool, which can't see this test's transaction.
+        config = {"configurable": {"thread_id": "t1"}}
+        await echo_graph(self.saver).ainvoke({"messages": [("user", "hi")]}, config)
+        state = await echo_graph(DjangoCheckpointSaver()).ainvoke({"messages": [("user", "again")]}, config)
+        self.assertEqual(state["messages"][-1], ("ai", "seen 3"))
+        state = await echo_graph(DjangoCheckpointSaver()).ainvoke(
+            {"messages": [("user", "hi")]}, {"configurable": {"thread_id": "t2"}}
+        )
+        self.assertEqual(state["messages"][-1], ("ai", "seen 1"))
+
+    def put(self, checkpoint_id, parent_id=None, messages=(), thread_id="t1"):
+        checkpoint = empty_checkpoint()
+        checkpoint["id"] = checkpoint_id
+        checkpoint["channel_values"]["messages"] = list(messages)
+        config = {"configurable": {"thread_id": thread_id, "thread_ts": parent_id}}
+        return self.saver.put(config, checkpoint, {"step": int(checkpoint_id)})
+
+    def test_latest_checkpoint_is_remembered(self):
+        self.put("01")
+        self.put("02", parent_id="01")
+        with self.assertNumQueries(0):
+            saved = self.saver.get_tuple({"configurable": {"thread_id": "t1"}})
+        self.assertEqual(saved.config["configurable"]["thread_ts"], "02")
+        with self.assertNumQueries(1):
+            loaded = DjangoCheckpointSaver().get_tuple({"configurable": {"thread_id": "t1"}})
+        self.assertEqual(loaded.checkpoint["id"], "02")
+        self.assertEqual(loaded.parent_config["configurable"]["thread_ts"], "01")
+        self.assertEqual(loaded.metadata, {"step": 2})
+
+    def test_get_and_list_by_checkpoint(self):
+        for checkpoint_id in ["01", "02", "03"]:
+            self.put(checkpoint_id)
+        config = {"configurable": {"thread_id": "t1", "thread_ts": "02"}}
+        self.assertEqual(self.saver.get_tuple(config).checkpoint["id"], "02")
+        self.assertIsNone(self.saver.get_tuple({"configurable": {"thread_id": "t1", "thread_ts": "09"}}))
+        self.assertIsNone(self.saver.get_tuple({"configurable": {"thread_id": "t2"}}))
+        listed = self.saver.list({"configurable": {"thread_id": "t1"}}, before=config, limit=5)
+        self.assertEqual([saved.checkpoint["id"] for saved in listed], ["01"])
+        listed = self.saver.list({"configurable": {"thread_id": "t1"}}, limit=2)
+        self.assertEqual([saved.checkpoint["id"] for saved in listed], ["03", "02"])
+
+    def test_put_again_overwrites(self):
+        self.put("01", messages=[["user", "a"]])
+        self.put("01", messages=[["user", "b"]])
+        self.assertEqual(GraphCheckpoint.objects.count(), 1)
+        saved = DjangoCheckpointSaver().get_tuple({"configurable": {"thread_id": "t1"}})
+        self.assertEqual(saved.checkpoint["channel_values"]["messages"], [["user", "b"]])
+
+    def test_compact_keeps_the_latest_checkpoint_trimmed(self):
+        # Stored as JSON, so turns come back as lists
+        turns = [["user", "q1"], ["ai", "call"], ["tool", "result"], ["ai", "a1"], ["user", "q2"], ["ai", "a2"]]
+        self.put("01")
+        self.put("02", parent_id="01")
+        self.put("03", parent_id="02", messages=turns)
+        self.put("01", thread_id="t2")
+
+        self.assertEqual(self.saver.compact("t1", max_messages=3), 2)
+        saved = self.saver.get_tuple({"configurable": {"thread_id": "t1"}})
+        # The last three start mid-answer, so the trim starts at the next question
+        self.assertEqual(saved.checkpoint["channel_values"]["messages"], turns[4:])
+        self.assertIsNone(saved.parent_config)
+        self.assertEqual(GraphCheckpoint.objects.filter(thread_id="t2").count(), 1)
+        self.assertEqual(self.saver.compact("missing"), 0)
+
+    def test_prune_deletes_idle_conversations(self):
+        self.put("01")
+        self.put("01", thread_id="t2")
+        GraphCheckpoint.objects.filter(thread_id="t1").update(created_at=timezone.now() - datetime.timedelta(days=31))
+        self.assertEqual(DjangoCheckpointSaver.prune(), 1)
+        self.assertEqual(list(GraphCheckpoint.objects.values_list("thread_id", flat=True)), ["t2"])
+
+    def test_trim_starts_at_a_user_message(self):
+        turns = [("user", "q1"), ("ai", "a1"), ("user", "q2"), ("ai", "call"), ("tool", "result"), ("ai", "a2")]
+        self.assertEqual(trim_messages(turns, 10), turns)
+        self.assertEqual(trim_messages(turns, 4), turns[2:])
+        # No user message in the last two: start at the latest one before them
+        self.assertEqual(trim_messages(turns, 2), turns[2:])
+
+
+class RecordingHttp(HttpMockSequence):
+    """``HttpMockSequence`` that also keeps the requests it answered."""
+
+    def __init__(self, iterable):
+        super().__init__(iterable)
+        self.requests = []
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        self.requests.append((method, uri, {name.lower(): value for name, value in (headers or {}).items()}))
+        return super().request(uri, method, body, headers, *args, **kwargs)
+
+
+def google_service(http, name="drive", version="v3"):
+    """A discovery client for ``name`` answered by ``http``, from the bundled discovery document."""
+    return build(name, version, http=http, static_discovery=True)
+
+
+@override_settings(DRIVE_UPLOAD_NUM_RETRIES=0)
+class ResumableUploaderTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/report.csv"
+        with open(self.path, "wb") as file:
+            file.write(b"x" * (2 * CHUNK_ALIGNMENT + 100))
+        self.size = 2 * CHUNK_ALIGNMENT + 100
+
+    def upload(self, *responses):
+        self.http = RecordingHttp(list(responses))
+        with mock.patch("agents.utils.uploads.build", return_value=google_service(self.http)):
+            return ResumableUploader(None, chunk_size=CHUNK_ALIGNMENT).upload(self.path)
+
+    def content_ranges(self):
+        return [headers.get("content-range") for method, _, headers in self.http.requests if method == "PUT"]
+
+    def interrupted(self, bytes_uploaded):
+        stat = os.stat(self.path)
+        return DriveUpload.objects.create(
+            file_path=self.path,
+            file_size=stat.st_size,
+            file_mtime=stat.st_mtime,
+            mimetype="text/csv",
+            session_uri="https://upload.example/session-1",
+            bytes_uploaded=bytes_uploaded,
+            status=DriveUpload.Status.UPLOADING,
+        )
+
+    def test_chunk_size_is_aligned(self):
+        self.assertEqual(ResumableUploader(None, chunk_size=CHUNK_ALIGNMENT + 1).chunk_size, CHUNK_ALIGNMENT)
+        self.assertEqual(ResumableUploader(None, chunk_size=1).chunk_size, CHUNK_ALIGNMENT)
+
+    def test_progress_is_saved_after_each_chunk(self):
+        with self.assertRaises(HttpError):
+            self.upload(
+                ({"status": "200", "location": "https://upload.example/session-1"}, ""),
+                ({"status": "308", "range": f"bytes=0-{CHUNK_ALIGNMENT - 1}"}, ""),
+                ({"status": "400"}, ""),
+            )
+        upload = DriveUpload.objects.get()
+        self.assertEqual(upload.session_uri, "https://upload.example/session-1")
+        self.assertEqual((upload.status, upload.bytes_uploaded), (DriveUpload.Status.FAILED, CHUNK_ALIGNMENT))
+
+    def test_resumes_from_the_offset_drive_committed(self):
+        # The saved offset is ahead of what Drive persisted before the crash
+        self.interrupted(2 * CHUNK_ALIGNMENT)
+        result = self.upload(
+            ({"status": "308", "range": f"bytes=0-{CHUNK_ALIGNMENT - 1}"}, ""),
+            ({"status": "308", "range": f"bytes=0-{2 * CHUNK_ALIGNMENT - 1}"}, ""),
+            ({"status": "200"}, json.dumps({"id": "file-1"})),
+        )
+        self.assertEqual(
+            self.content_ranges(),
+            [
+                f"bytes */{self.size}",
+                f"bytes {CHUNK_ALIGNMENT}-{2 * CHUNK_ALIGNMENT - 1}/{self.size}",
+                f"bytes {2 * CHUNK_ALIGNMENT}-{self.size - 1}/{self.size}",
+            ],
+        )
+        self.assertEqual((result["file_id"], result["resumed"]), ("file-1", True))
+        upload = DriveUpload.objects.get()
+        self.assertEqual((upload.status, upload.bytes_uploaded), (DriveUpload.Status.COMPLETED, self.size))
+
+    def test_session_already_complete(self):
+        self.interrupted(self.size)
+        result = self.upload(({"status": "200"}, json.dumps({"id": "file-1"})))
+        self.assertEqual(len(self.http.requests), 1)
+        self.assertEqual(result["file_id"], "file-1")
+
+    def test_expired_session_restarts_from_the_beginning(self):
+        self.interrupted(CHUNK_ALIGNMENT)
+        with self.assertLogs("agents.utils.uploads", "INFO"):
+            result = self.upload(
+                ({"status": "404"}, ""),
+                ({"status": "200", "location": "https://upload.example/session-2"}, ""),
+                ({"status": "308", "range": f"bytes=0-{CHUNK_ALIGNMENT - 1}"}, ""),
+                ({"status": "308", "range": f"bytes=0-{2 * CHUNK_ALIGNMENT - 1}"}, ""),
+                ({"status": "200"}, json.dumps({"id": "file-2"})),
+            )
+        self.assertEqual(self.content_ranges()[1], f"bytes 0-{CHUNK_ALIGNMENT - 1}/{self.size}")
+        self.assertEqual(result["file_id"], "file-2")
+        self.assertEqual(DriveUpload.objects.get().session_uri, "https://upload.example/session-2")
+
+    def test_completed_upload_is_not_sent_again(self):
+        upload = self.interrupted(self.size)
+        DriveUpload.objects.filter(id=upload.id).update(status=DriveUpload.Status.COMPLETED, drive_file_id="file-1")
+        result = self.upload()
+        self.assertEqual((result["file_id"], result["resumed"]), ("file-1", False))
+        self.assertEqual(self.http.requests, [])
+
+
+def http_error(status, reason=None):
+    body = {"error": {"code": status, "message": reason or "error", "errors": [{"reason": reason}] if reason else []}}
+    return HttpError(httplib2.Response({"status": status}), json.dumps(body).encode())
+
+
+class FakeBatchService:
+    """Answers batch requests with the next scripted outcome of each key."""
+
+    def __init__(self, outcomes, envelope_errors=()):
+        self.outcomes = {key: list(results) for key, results in outcomes.items()}
+        self.envelope_errors = list(envelope_errors)
+        self.batches = []
+
+    def new_batch_http_request(self, callback):
+        service = self
+
+        class Batch:
+            def __init__(self):
+                self.keys = []
+
+            def add(self, request, request_id):
+                self.keys.append(request_id)
+
+            def execute(self):
+                service.batches.append(self.keys)
+                if service.envelope_errors:
+                    raise service.envelope_errors.pop(0)
+                for key in self.keys:
+                    outcome = service.outcomes[key].pop(0)
+                    if isinstance(outcome, Exception):
+                        callback(key, None, outcome)
+                    else:
+                        callback(key, outcome, None)
+
+        return Batch()
+
+
+@mock.patch("agents.utils.batch.time.sleep")
+class DriveBatchExecutorTests(SimpleTestCase):
+    def execute(self, service, keys, **kwargs):
+        return DriveBatchExecutor(service, **kwargs).execute((key, object()) for key in keys)
+
+    def test_only_failed_calls_are_sent_again(self, sleep):
+        service = FakeBatchService(
+            {
+                "a": [{"id": "a"}],
+                "b": [http_error(429), http_error(503), {"id": "b"}],
+                "c": [http_error(403, "userRateLimitExceeded"), {"id": "c"}],
+                "d": [http_error(404, "notFound")],
+            }
+        )
+        result = self.execute(service, "abcd")
+        self.assertEqual(service.batches, [list("abcd"), ["b", "c"], ["b"]])
+        self.assertEqual(set(result.responses), {"a", "b", "c"})
+        self.assertEqual(list(result.errors), ["d"])
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1.0, 2.0])
+
+    def test_permission_errors_are_not_retried(self, sleep):
+        result = self.execute(FakeBatchService({"a": [http_error(403, "insufficientFilePermissions")]}), "a")
+        self.assertEqual(result.errors["a"].resp.status, 403)
+        sleep.assert_not_called()
+
+    def test_gives_up_after_max_retries(self, sleep):
+        service = FakeBatchService({"a": [http_error(500)] * 3})
+        result = self.execute(service, "a", max_retries=2)
+        self.assertFalse(result.ok)
+        self.assertEqual(len(service.batches), 3)
+        self.assertIn("a", result.to_dict()["failed"])
+
+    def test_splits_into_batches_of_at_most_100(self, sleep):
+        keys = [str(index) for index in range(250)]
+        service = FakeBatchService({key: [{"id": key}] for key in keys})
+        result = self.execute(service, keys, batch_size=500)
+        self.assertEqual([len(batch) for batch in service.batches], [100, 100, 50])
+        self.assertEqual(len(result.responses), 250)
+
+    def test_failed_envelope_resends_the_whole_batch(self, sleep):
+        service = FakeBatchService({"a": [{"id": "a"}], "b": [{"id": "b"}]}, envelope_errors=[http_error(503)])
+        self.assertTrue(self.execute(service, "ab").ok)
+        self.assertEqual(service.batches, [["a", "b"], ["a", "b"]])
+
+        service = FakeBatchService({"a": [{"id": "a"}]}, envelope_errors=[http_error(401)])
+        with self.assertRaises(HttpError):
+            self.execute(service, "a")
+
+
+def paragraph(text):
+    return {"paragraph": {"elements": [{"textRun": {"content": text}}]}}
+
+
+class DocumentTextExtractorTests(TestCase):
+    def setUp(self):
+        self.drive = mock.MagicMock()
+        self.docs = mock.MagicMock()
+        self.extractor = DocumentTextExtractor(None, drive_service=self.drive, docs_service=self.docs)
+
+    def file(self, mimetype, **metadata):
+        self.drive.files.return_value.get.return_value.execute.return_value = {
+            "id": "f1",
+            "name": "Notes",
+            "mimeType": mimetype,
+            **metadata,
+        }
+
+    def doc(self, revision, *texts):
+        self.docs.documents.return_value.get.return_value.execute.side_effect = lambda: (
+            {"revisionId": revision, "body": {"content": [paragraph(text) for text in texts]}}
+        )
+
+    def test_unchanged_document_is_not_fetched_again(self):
+        self.file(GOOGLE_DOC)
+        self.doc("r1", "Hello\n")
+        self.assertEqual(self.extractor.extract("f1"), "Hello")
+        fetches = self.docs.documents.return_value.get.call_count
+
+        self.assertEqual(self.extractor.extract("f1"), "Hello")
+        # Only the revision lookup, not the document body
+        self.assertEqual(self.docs.documents.return_value.get.call_count, fetches + 1)
+        self.assertEqual(self.docs.documents.return_value.get.call_args.kwargs["fields"], "revisionId")
+
+    def test_new_revision_is_extracted_again(self):
+        self.file(GOOGLE_DOC)
+        self.doc("r1", "Old\n")
+        self.extractor.extract("f1")
+        self.doc("r2", "New\n")
+        self.assertEqual(self.extractor.extract_with_revision("f1"), ("New", "r2"))
+        self.assertEqual(DocumentText.objects.get(file_id="f1").revision, "r2")
+
+    def test_files_use_their_checksum_or_version(self):
+        self.file("text/plain", md5Checksum="abc", version="7")
+        with mock.patch.object(self.extractor, "_download", return_value=b"a  \n\n\n\nb") as download:
+            self.assertEqual(self.extractor.extract_with_revision("f1"), ("a\n\nb", "abc"))
+            self.extractor.extract("f1")
+        download.assert_called_once()
+
+        self.file("application/vnd.google-apps.spreadsheet", version="7")
+        with mock.patch.object(self.extractor, "_download", return_value=b"x,y"):
+            self.assertEqual(self.extractor.extract_with_revision("f1"), ("x,y", "v7"))
+
+    def test_unsupported_files(self):
+        self.file("image/png", md5Checksum="abc")
+        with self.assertRaisesMessage(ValueError, "image/png"):
+            self.extractor.extract("f1")
+
+    def test_tables_keep_rows_on_one_line(self):
+        table = {
+            "table": {
+                "tableRows": [
+                    {"tableCells": [{"content": [paragraph("Name\n")]}, {"content": [paragraph("Qty\n")]}]},
+                    {"tableCells": [{"content": [paragraph("Apple\n")]}, {"content": [paragraph("3\n")]}]},
+                ]
+            }
+        }
+        document = {"body": {"content": [paragraph("Stock\n"), table, paragraph("\n\n\nEnd\n")]}}
+        self.assertEqual(document_to_text(document), "Stock\nName | Qty\nApple | 3\n\nEnd")
+
+
+FORM = {
+    "info": {"title": "Feedback"},
+    "items": [
+        {"title": "Team", "questionItem": {"question": {"questionId": "q1", "choiceQuestion": {}}}},
+        {"title": "Score", "questionItem": {"question": {"questionId": "q2", "scaleQuestion": {}}}},
+    ],
+}
+
+
+def form_response(number, team, score, submitted=None):
+    submitted = submitted or f"2024-05-01T10:00:0{number}.123456789Z"
+    return {
+        "responseId": f"r{number}",
+        "createTime": submitted,
+        "lastSubmittedTime": submitted,
+        "answers": {
+            "q1": {"textAnswers": {"answers": [{"value": team}]}},
+            "q2": {"textAnswers": {"answers": [{"value": str(score)}]}},
+        },
+    }
+
+
+class FakeFormsService:
+    """``responses.list`` over an in-memory list, honouring the time filter and page size."""
+
+    def __init__(self, responses):
+        self.stored = responses
+        self.calls = []
+
+    def forms(self):
+        return self
+
+    def get(self, formId):
+        self.calls.append(("get", {}))
+        return mock.Mock(execute=mock.Mock(return_value=FORM))
+
+    def responses(self):
+        return mock.Mock(list=self.list)
+
+    def list(self, formId, pageSize, filter=None, pageToken=None):
+        self.calls.append(("list", {"filter": filter, "pageToken": pageToken}))
+        matching = self.stored
+        if filter:
+            since = parse_time(filter.split(">= ")[1])
+            matching = [response for response in matching if parse_time(response["lastSubmittedTime"]) >= since]
+        start = int(pageToken or 0)
+        page = {"responses": matching[start : start + pageSize]}
+        if start + pageSize < len(matching):
+            page["nextPageToken"] = str(start + pageSize)
+        return mock.Mock(execute=mock.Mock(return_value=page))
+
+
+@override_settings(FORMS_PAGE_SIZE=2, FORMS_SUMMARY_TOP_VALUES=2)
+class FormResponseIngestorTests(TestCase):
+    def setUp(self):
+        self.service = FakeFormsService(
+            [form_response(1, "Sales", 4), form_response(2, "Support", 5), form_response(3, "Sales", 3)]
+        )
+        self.ingestor = FormResponseIngestor(self.service)
+
+    def lists(self):
+        return [params for name, params in self.service.calls if name == "list"]
+
+    def test_first_sync_pages_through_every_response(self):
+        state = self.ingestor.sync("form-1")
+        self.assertEqual([params["pageToken"] for params in self.lists()], [None, "2"])
+        self.assertEqual(state.response_count, 3)
+        self.assertEqual(state.title, "Feedback")
+        self.assertEqual(state.summary["q1"]["counts"], {"Sales": 2, "Support": 1})
+        self.assertEqual(state.summary["q2"]["numeric"]["mean"], 4.0)
+        self.assertEqual(state.last_submitted_time, parse_time("2024-05-01T10:00:03.123456Z"))
+
+    def test_later_syncs_fetch_only_newer_responses(self):
+        self.ingestor.sync("form-1")
+        self.service.calls.clear()
+        state = self.ingestor.sync("form-1")
+        # The newest stored response comes back again but changes nothing
+        self.assertEqual(self.lists(), [{"filter": "timestamp >= 2024-05-01T10:00:03.123456Z", "pageToken": None}])
+        self.assertNotIn("get", [name for name, _ in self.service.calls])
+        self.assertEqual(state.response_count, 3)
+
+        self.service.stored.append(form_response(4, "Support", 2))
+        self.service.stored[0] = form_response(1, "Support", 4, submitted="2024-05-01T10:00:05Z")
+        state = self.ingestor.sync("form-1")
+        self.assertEqual(state.response_count, 4)
+        self.assertEqual(state.summary["q1"]["counts"], {"Support": 3, "Sales": 1})
+        self.assertEqual(FormResponse.objects.get(response_id="r1").answers["q1"], ["Support"])
+
+    def test_count_answers_beyond_the_stored_top_values(self):
+        self.service.stored.append(form_response(4, "Legal", 1))
+        state = self.ingestor.sync("form-1")
+        self.assertTrue(state.summary["q1"]["truncated"])
+        self.assertEqual(count_answers(state, "q1", "sales"), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(count_answers(state, "q1", "Legal"), 1)
+        self.assertEqual(count_answers(state, "q1", "Finance"), 0)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(FORMS_PUSH_TOKEN="secret", FORMS_EVENT_DEBOUNCE=5, FORMS_EVENT_COALESCE_TTL=600)
+class FormEventTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("agents.utils.form_events.get_redis", return_value=fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(tasks.sync_form_responses, "send_with_options")
+        self.queued = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.publisher = LocalFormEventPublisher(self.client)
+
+    def test_a_burst_of_events_queues_one_sync(self):
+        for _ in range(3):
+            self.assertEqual(self.publisher.publish("form-1").status_code, 204)
+        self.publisher.publish("form-2")
+        self.assertEqual(self.queued.call_count, 2)
+        self.assertEqual(self.queued.call_args_list[0].kwargs, {"args": ("form-1",), "delay": 5000})
+
+    def test_events_during_a_sync_queue_another(self):
+        self.publisher.publish("form-1")
+        release_form_sync("form-1")
+        self.publisher.publish("form-1")
+        self.publisher.publish("form-1")
+        self.assertEqual(self.queued.call_count, 2)
+
+    def test_only_response_events_sync(self):
+        self.publisher.publish("form-1", event_type="SCHEMA")
+        self.queued.assert_not_called()
+
+    def test_rejects_a_wrong_token(self):
+        self.assertEqual(LocalFormEventPublisher(self.client, token="wrong").publish("form-1").status_code, 403)
+        self.queued.assert_not_called()
+
+    def test_malformed_messages_are_acknowledged(self):
+        with self.assertLogs("agents.views", "WARNING"):
+            response = self.client.post(
+                "/api/agents/forms/events?token=secret", {"message": {}}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 204)
+
+    def test_event_in_message_data(self):
+        data = base64.b64encode(json.dumps({"formId": "form-1", "eventType": "RESPONSES"}).encode()).decode()
+        event = parse_push_envelope({"message": {"data": data, "messageId": "m1"}})
+        self.assertEqual((event["form_id"], event["event_type"], event["message_id"]), ("form-1", "RESPONSES", "m1"))
+
+
+@override_settings(FORMS_WATCH_RENEW_MARGIN=86400, FORMS_WATCH_TOPIC="projects/p/topics/forms")
+class FormWatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner@example.com", password="password")
+        cls.integration = Integration.objects.create(
+            thirdparty=ThirdParty.GOOGLE_WORKSPACE, access_token="token", refresh_token="", user=user
+        )
+
+    def setUp(self):
+        self.service = mock.MagicMock()
+        self.watches = self.service.forms.return_value.watches.return_value
+        self.watches.create.return_value.execute.return_value = {"id": "w1", "expireTime": "2024-05-08T10:00:00Z"}
+        self.watch = FormWatchManager(self.service, self.integration).create("form-1")
+
+    def test_create_schedules_renewal_before_expiry(self):
+        body = self.watches.create.call_args.kwargs["body"]
+        self.assertEqual(body["watch"]["target"]["topic"]["topicName"], "projects/p/topics/forms")
+        self.assertEqual(self.watch.renew_at, parse_time("2024-05-07T10:00:00Z"))
+        self.assertEqual(self.watch.state, FormWatch.State.ACTIVE)
+
+    def test_renewal_schedules_the_next_one(self):
+        self.watches.renew.return_value.execute.return_value = {"expireTime": "2024-05-14T10:00:00Z"}
+        with mock.patch.object(tasks, "build", return_value=self.service), mock.patch.object(
+            tasks.renew_form_watch, "send_with_options"
+        ) as scheduled:
+            tasks.renew_form_watch.fn(self.watch.id, self.watch.renew_at.isoformat())
+        self.watch.refresh_from_db()
+        self.assertEqual(self.watch.renew_at, parse_time("2024-05-13T10:00:00Z"))
+        self.assertEqual(scheduled.call_args.kwargs["args"], (self.watch.id, self.watch.renew_at.isoformat()))
+
+    def test_stale_renewal_job_does_nothing(self):
+        with mock.patch.object(tasks, "build") as build_service:
+            tasks.renew_form_watch.fn(self.watch.id, "2024-01-01T00:00:00+00:00")
+        build_service.assert_not_called()
+
+    def test_failed_renewal_marks_the_watch(self):
+        self.watches.renew.return_value.execute.side_effect = http_error(404, "notFound")
+        with mock.patch.object(tasks, "build", return_value=self.service), self.assertLogs("agents.tasks", "ERROR"):
+            tasks.renew_form_watch.fn(self.watch.id, self.watch.renew_at.isoformat())
+        self.watch.refresh_from_db()
+        self.assertEqual(self.watch.state, FormWatch.State.FAILED)
+
+
+def knowledge_record(version_id, article_id, title, answer, modified, status="Online"):
+    return {
+        "Id": version_id,
+        "KnowledgeArticleId": article_id,
+        "Title": title,
+        "Question__c": None,
+        "Answer__c": answer,
+        "UrlName": title.lower().replace(" ", "-"),
+        "LastModifiedDate": modified,
+        "PublishStatus": status,
+    }
+
+
+class FakeSalesforce:
+    """``query_all_iter`` over in-memory ``Knowledge__kav`` versions, honouring status and watermark."""
+
+    base_url = "https://example.my.salesforce.com/services/data/v59.0/"
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+        self.search = mock.Mock(return_value={"searchRecords": [knowledge_record("ka9", "kA9", "Live hit", "", "")]})
+
+    def query_all_iter(self, soql):
+        self.queries.append(soql)
+        status = re.search(r"PublishStatus = '(\w+)'", soql).group(1)
+        since = re.search(r"LastModifiedDate >= (\S+)", soql)
+        return [
+            record
+            for record in self.records
+            if record["PublishStatus"] == status
+            and (since is None or record["LastModifiedDate"] >= since.group(1))
+        ]
+
+
+@override_settings(KNOWLEDGE_LANGUAGE="en_US", KNOWLEDGE_EMBEDDINGS=False)
+class KnowledgeMirrorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner@example.com", password="password")
+        cls.integration = Integration.objects.create(
+            thirdparty=ThirdParty.SALESFORCE, access_token="token", refresh_token="", user=user
+        )
+
+    def setUp(self):
+        _indexes.clear()
+        self.addCleanup(_indexes.clear)
+        self.sf = FakeSalesforce(
+            [
+                knowledge_record(
+                    "ka1", "kA1", "Reset a password", "<p>Use the <b>reset</b> link.</p>", "2024-05-01T10:00:00Z"
+                ),
+                knowledge_record(
+                    "ka2", "kA2", "Change billing address", "Open billing settings.", "2024-05-02T10:00:00Z"
+                ),
+            ]
+        )
+        self.mirror = KnowledgeMirror(self.sf, self.integration)
+
+    def test_first_sync_mirrors_online_articles(self):
+        state = self.mirror.sync()
+        self.assertEqual(len(self.sf.queries), 1)
+        self.assertIn("Language = 'en_US'", self.sf.queries[0])
+        self.assertEqual(KnowledgeArticle.objects.get(version_id="ka1").answer, "Use the reset link.")
+        self.assertEqual(state.last_modified.isoformat(), "2024-05-02T10:00:00+00:00")
+
+    def test_later_syncs_apply_new_and_archived_versions(self):
+        self.mirror.sync()
+        self.sf.records += [
+            # A new version of kA1 archives the old one; kA2 is withdrawn
+            knowledge_record("ka1", "kA1", "Reset a password", "", "2024-05-03T10:00:00Z", status="Archived"),
+            knowledge_record("ka3", "kA1", "Reset your password", "Use the reset link.", "2024-05-03T10:00:00Z"),
+            knowledge_record("ka2", "kA2", "Change billing address", "", "2024-05-04T10:00:00Z", status="Archived"),
+        ]
+        state = self.mirror.sync()
+        self.assertIn("LastModifiedDate >= 2024-05-02T10:00:00Z", self.sf.queries[1])
+        self.assertEqual(
+            list(KnowledgeArticle.objects.values_list("knowledge_article_id", "version_id")), [("kA1", "ka3")]
+        )
+        self.assertEqual(state.last_modified.isoformat(), "2024-05-04T10:00:00+00:00")
+
+    def test_search_uses_the_mirror_and_reuses_its_index(self):
+        self.mirror.sync()
+        with mock.patch.object(KnowledgeIndex, "load", wraps=KnowledgeIndex.load) as load:
+            results = self.mirror.search("password reset")
+            self.mirror.search("billing")
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual((results[0]["title"], results[0]["source"]), ("Reset a password", "local"))
+        self.assertEqual(results[0]["url"], "https://example.my.salesforce.com/lightning/r/Knowledge__kav/ka1/view")
+        self.sf.search.assert_not_called()
+
+    def test_search_falls_back_to_salesforce(self):
+        self.assertEqual(self.mirror.search("password")[0]["source"], "salesforce")
+        self.mirror.sync()
+        results = self.mirror.search("kubernetes")
+        self.assertEqual(results[0]["title"], "Live hit")
+        self.assertEqual(self.sf.search.call_count, 2)
+
+
+def rest_page(records, next_url=None):
+    return {
+        "totalSize": 5,
+        "done": next_url is None,
+        "nextRecordsUrl": next_url,
+        "records": [{"attributes": {"type": "Case"}, **record} for record in records],
+    }
+
+
+class SalesforceQueryExecutorTests(SimpleTestCase):
+    def setUp(self):
+        self.sf = mock.Mock()
+        self.sf.query.return_value = rest_page([{"Id": "1"}, {"Id": "2"}], "/next/1")
+        self.sf.query_more.side_effect = [rest_page([{"Id": "3"}, {"Id": "4"}], "/next/2"), rest_page([{"Id": "5"}])]
+
+    def test_small_results_are_paged_through_rest(self):
+        executor = SalesforceQueryExecutor(self.sf, bulk_threshold=10)
+        records = list(executor.iter_records("SELECT Id FROM Case"))
+        self.assertEqual(records, [{"Id": str(n)} for n in range(1, 6)])
+        self.assertEqual([call.args[0] for call in self.sf.query_more.call_args_list], ["/next/1", "/next/2"])
+        self.assertEqual((executor.total_size, executor.used_bulk), (5, False))
+
+    def test_max_rows_stops_fetching_pages(self):
+        executor = SalesforceQueryExecutor(self.sf, bulk_threshold=10)
+        self.assertEqual(len(list(executor.iter_records("SELECT Id FROM Case", max_rows=2))), 2)
+        self.sf.query_more.assert_not_called()
+
+    def test_large_results_stream_through_bulk_with_rest_types(self):
+        self.sf.Case.describe.return_value = {
+            "fields": [
+                {"name": "Id", "type": "id"},
+                {"name": "IsEscalated", "type": "boolean"},
+                {"name": "AccountId", "type": "reference", "relationshipName": "Account", "referenceTo": ["Account"]},
+            ]
+        }
+        self.sf.Account.describe.return_value = {"fields": [{"name": "NumberOfEmployees", "type": "int"}]}
+        self.sf.bulk2.Case.query.return_value = iter(
+            [
+                '"Id","IsEscalated","Account.NumberOfEmployees"\n"1","true","40"\n',
+                '"Id","IsEscalated","Account.NumberOfEmployees"\n"2","false",""\n',
+            ]
+        )
+        executor = SalesforceQueryExecutor(self.sf, bulk_threshold=4, bulk_page_size=1)
+        soql = "SELECT Id, IsEscalated, Account.NumberOfEmployees FROM Case"
+        records = list(executor.iter_records(soql))
+        self.assertTrue(executor.used_bulk)
+        self.assertEqual(
+            records,
+            [
+                {"Id": "1", "IsEscalated": True, "Account": {"NumberOfEmployees": 40}},
+                {"Id": "2", "IsEscalated": False, "Account": None},
+            ],
+        )
+        self.sf.bulk2.Case.query.assert_called_once_with(soql, max_records=1)
+        self.assertEqual(self.sf.Case.describe.call_count, 1)
+
+    def test_queries_bulk_cannot_run_stay_on_rest(self):
+        executor = SalesforceQueryExecutor(self.sf, bulk_threshold=4)
+        list(executor.iter_records("SELECT Status, COUNT(Id) FROM Case GROUP BY Status"))
+        self.assertFalse(executor.used_bulk)
+        # A cap below the threshold is cheaper to page through than a bulk job
+        self.sf.query_more.side_effect = [rest_page([{"Id": "3"}], "/next/2")]
+        list(executor.iter_records("SELECT Id FROM Case", max_rows=3))
+        self.assertFalse(executor.used_bulk)
+        self.sf.bulk2.Case.query.assert_not_called()
+
+
+class SObjectCollectionExecutorTests(SimpleTestCase):
+    def setUp(self):
+        self.sf = mock.Mock()
+        self.sf.restful.side_effect = self.reply
+
+    def reply(self, path, method, data):
+        records = json.loads(data)["records"]
+        return [
+            {"id": record.get("Id") or f"new{index}", "success": record.get("Subject") != "bad", "errors": []}
+            for index, record in enumerate(records)
+        ]
+
+    def test_records_are_sent_200_at_a_time(self):
+        executor = SObjectCollectionExecutor(self.sf)
+        results = executor.create("Case", [{"Subject": f"case {index}"} for index in range(450)])
+        self.assertEqual(executor.api_calls, 3)
+        sizes = [len(json.loads(call.kwargs["data"])["records"]) for call in self.sf.restful.call_args_list]
+        self.assertEqual(sizes, [200, 200, 50])
+        self.assertEqual(len(results), 450)
+        body = json.loads(self.sf.restful.call_args.kwargs["data"])
+        self.assertEqual(body["records"][0], {"attributes": {"type": "Case"}, "Subject": "case 400"})
+        self.assertFalse(body["allOrNone"])
+
+    def test_results_are_per_record(self):
+        records = [{"Id": "500A", "Subject": "bad"}, {"Id": "500B"}]
+        results = SObjectCollectionExecutor(self.sf).update("Case", records)
+        self.assertEqual([(result["id"], result["success"]) for result in results], [("500A", False), ("500B", True)])
+        self.assertEqual(self.sf.restful.call_args.kwargs["method"], "PATCH")
+
+    def test_a_failed_request_fails_its_records(self):
+        executor = SObjectCollectionExecutor(self.sf, batch_size=1)
+        self.sf.restful.side_effect = [
+            SalesforceError("url", 400, "composite/sobjects", b"INVALID_TYPE"),
+            [{"id": "500B", "success": True}],
+        ]
+        with self.assertLogs("agents.utils.salesforce", "WARNING"):
+            results = executor.update("Case", [{"Id": "500A"}, {"Id": "500B"}])
+        self.assertEqual((results[0]["id"], results[0]["success"]), ("500A", False))
+        self.assertIn("INVALID_TYPE", results[0]["errors"][0]["message"])
+        self.assertEqual(results[1], {"id": "500B", "success": True, "errors": []})
+
+    def test_updates_need_ids(self):
+        with self.assertRaisesMessage(ValueError, "[1]"):
+            SObjectCollectionExecutor(self.sf).update("Case", [{"Id": "500A"}, {"Subject": "no id"}])
+        self.sf.restful.assert_not_called()
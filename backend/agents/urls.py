@@ -1,9 +1,12 @@
+from django.urls import path
 from rest_framework import routers
 
-from .views import AgentViewSet
+from .views import AgentViewSet, FormEventView
 
 app_name = "agents"
 
 router = routers.SimpleRouter()
 router.register(r'', AgentViewSet, basename="agents")
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = [
+    path("forms/events", FormEventView.as_view(), name="form-events"),
+] + router.urls
@@ -0,0 +1,190 @@
+import re
+from typing import Any, List, Sequence, Tuple
+
+import numpy as np
+
+from .sheets import BOOL, DATE, EMPTY, NUMBER, STRING, ColumnarTable, _python_value
+
+OPERATIONS = ("count", "count_distinct", "sum", "mean", "min", "max", "median", "std")
+_PERCENTILE_RE = re.compile(r"^p(\d{1,2}(?:\.\d+)?|100)$")
+
+
+def group_codes(table: ColumnarTable, columns: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Assign each row a group number for the given key columns.
+
+    Returns ``(inverse, first)``: the group of every row, and the index of the
+    first row of every group. Groups are numbered in sorted key order.
+    """
+    if len(columns) == 1:
+        # Column codes are already dense and sorted, so they are the groups.
+        codes, count = table.codes(table.column_index(columns[0]))
+        counts = np.bincount(codes, minlength=count)
+        first = np.argsort(codes, kind="stable")[np.cumsum(counts) - counts]
+        return codes, first
+    combined = np.zeros(len(table), dtype=np.int64)
+    for column in columns:
+        codes, count = table.codes(table.column_index(column))
+        combined = combined * count + codes
+        # Re-densify so the mixed-radix key can't overflow with many columns.
+        _, combined = np.unique(combined, return_inverse=True)
+        combined = combined.reshape(-1)
+    _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    return inverse.reshape(-1), first
+
+
+def _valid(kind: str, data: np.ndarray) -> np.ndarray:
+    if kind == STRING:
+        return data != ""
+    if kind == DATE:
+        return ~np.isnat(data)
+    return ~np.isnan(data)
+
+
+def _percentile(operation: str):
+    if operation == "median":
+        return 50.0
+    match = _PERCENTILE_RE.match(operation)
+    return float(match[1]) if match else None
+
+
+def aggregate_groups(
+    kind: str, data: np.ndarray, inverse: np.ndarray, groups: int, operation: str
+) -> np.ndarray:
+    """Reduce ``data`` per group; groups without values get NaN (NaT for dates)."""
+    valid = _valid(kind, data)
+    if operation == "count":
+        return np.bincount(inverse, weights=valid, minlength=groups)
+    if operation == "count_distinct":
+        codes, count = ColumnarTable([""], [kind], [data[valid]]).codes(0)
+        pairs = np.unique(inverse[valid].astype(np.int64) * count + codes)
+        return np.bincount(pairs // max(count, 1), minlength=groups).astype(np.float64)
+
+    percentile = _percentile(operation)
+    if kind == DATE and (operation in ("min", "max") or percentile is not None):
+        seconds = data[valid].astype("int64").astype(np.float64)
+        result = _reduce(seconds, inverse[valid], groups, operation, percentile)
+        dates = np.full(groups, np.datetime64("NaT"), dtype="datetime64[s]")
+        present = ~np.isnan(result)
+        dates[present] = result[present].astype("int64").astype("datetime64[s]")
+        return dates
+    if kind not in (NUMBER, BOOL, EMPTY):
+        raise ValueError(f"{operation} needs a numeric column")
+    return _reduce(data[valid], inverse[valid], groups, operation, percentile)
+
+
+def _reduce(values, inverse, groups, operation, percentile) -> np.ndarray:
+    counts = np.bincount(inverse, minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if operation == "sum":
+            sums = np.bincount(inverse, weights=values, minlength=groups)
+            return np.where(counts > 0, sums, np.nan)
+        if operation == "mean":
+            return np.bincount(inverse, weights=values, minlength=groups) / counts
+        if operation == "std":
+            sums = np.bincount(inverse, weights=values, minlength=groups)
+            squares = np.bincount(inverse, weights=values * values, minlength=groups)
+            mean = sums / counts
+            return np.sqrt(np.maximum(squares / counts - mean * mean, 0))
+        if operation not in ("min", "max") and percentile is None:
+            raise ValueError(
+                f"Unsupported operation {operation!r}. Use one of {', '.join(OPERATIONS)} or pNN."
+            )
+
+        # Order-based reductions: sort by (group, value) once, then index into
+        # each group's contiguous slice.
+        order = np.argsort(values)
+        # A stable sort of integer keys is a radix sort, cheaper than lexsort.
+        order = order[np.argsort(inverse[order], kind="stable")]
+        ordered = values[order]
+        offsets = np.cumsum(counts) - counts
+        result = np.full(groups, np.nan)
+        present = counts > 0
+        if operation == "min":
+            result[present] = ordered[offsets[present]]
+        elif operation == "max":
+            result[present] = ordered[offsets[present] + counts[present] - 1]
+        else:
+            position = offsets[present] + percentile / 100 * (counts[present] - 1)
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            result[present] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+        return result
+
+
+def parse_aggregation(spec: str) -> Tuple[str, str]:
+    """Split ``"sum:Amount"`` into ``("sum", "Amount")``; a bare ``"count"`` counts rows."""
+    operation, _, column = spec.partition(":")
+    return operation.strip().lower(), column.strip()
+
+
+def _output(kind: str, operation: str, values: np.ndarray) -> List[Any]:
+    if operation in ("count", "count_distinct"):
+        return [int(value) for value in values]
+    return [_python_value(kind if kind == DATE else NUMBER, value) for value in values]
+
+
+def group_by(
+    table: ColumnarTable, by: Sequence[str], aggregations: Sequence[str]
+) -> Tuple[List[str], List[List[Any]]]:
+    """Group rows by the ``by`` columns and compute ``aggregations`` for each group.
+
+    Returns a header and one row per group, sorted by the group keys.
+    """
+    inverse, first = group_codes(table, by)
+    groups = len(first)
+    header = [table.header[table.column_index(column)] for column in by]
+    columns = [
+        [_python_value(table.kinds[index], table.columns[index][i]) for i in first]
+        for index in (table.column_index(column) for column in by)
+    ]
+    for spec in aggregations:
+        operation, column = parse_aggregation(spec)
+        if column:
+            index = table.column_index(column)
+            kind, data = table.kinds[index], table.columns[index]
+            header.append(f"{operation}:{table.header[index]}")
+        else:
+            kind, data = NUMBER, np.zeros(len(table))
+            header.append(operation)
+        columns.append(_output(kind, operation, aggregate_groups(kind, data, inverse, groups, operation)))
+    return header, [list(row) for row in zip(*columns)]
+
+
+def pivot(
+    table: ColumnarTable, rows: str, columns: str, value: str = None, operation: str = "sum"
+) -> Tuple[List[str], List[List[Any]]]:
+    """Cross-tabulate ``value`` by ``rows`` x ``columns``; without a value, count rows.
+
+    Returns a header (the row key name followed by the column keys) and one
+    row per distinct ``rows`` key. Empty cells are None.
+    """
+    row_inverse, row_first = group_codes(table, [rows])
+    col_inverse, col_first = group_codes(table, [columns])
+    cells = row_inverse * len(col_first) + col_inverse
+    groups = len(row_first) * len(col_first)
+
+    if value:
+        index = table.column_index(value)
+        kind, data = table.kinds[index], table.columns[index]
+    else:
+        kind, data, operation = NUMBER, np.zeros(len(table)), "count"
+    result = aggregate_groups(kind, data, cells, groups, operation)
+    if operation in ("count", "count_distinct"):
+        # Distinguish "no rows" from a zero count so the matrix stays sparse.
+        present = np.bincount(cells, minlength=groups) > 0
+        result = np.where(present, result, np.nan)
+        kind = NUMBER
+    matrix = result.reshape(len(row_first), len(col_first))
+
+    row_index = table.column_index(rows)
+    col_index = table.column_index(columns)
+    header = [table.header[row_index]] + [
+        str(_python_value(table.kinds[col_index], table.columns[col_index][i])) for i in col_first
+    ]
+    output_kind = DATE if kind == DATE else NUMBER
+    body = [
+        [_python_value(table.kinds[row_index], table.columns[row_index][i])]
+        + [_python_value(output_kind, cell) for cell in matrix[r]]
+        for r, i in enumerate(row_first)
+    ]
+    return header, body
@@ -0,0 +1,124 @@
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+logger = logging.getLogger(__name__)
+
+# Google's batch endpoint accepts at most 100 calls per batch request.
+MAX_BATCH_SIZE = 100
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RETRYABLE_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "backendError")
+
+
+def is_retryable(error: Exception) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403:
+        details = error.error_details if isinstance(error.error_details, list) else []
+        return any(
+            isinstance(detail, dict) and detail.get("reason") in RETRYABLE_REASONS
+            for detail in details
+        )
+    return False
+
+
+class BatchResult:
+    """Outcome of a batch run, keyed by the caller's request keys."""
+
+    def __init__(self) -> None:
+        self.responses: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> Dict:
+        return {
+            "succeeded": self.responses,
+            "failed": {key: str(error) for key, error in self.errors.items()},
+        }
+
+
+class DriveBatchExecutor:
+    """Runs Drive API calls through batch requests of up to 100 calls each.
+
+    Sub-requests that fail with a rate limit or server error are collected and
+    re-sent in a fresh batch with exponential backoff; other failures are
+    reported per key in the returned ``BatchResult``.
+    """
+
+    def __init__(
+        self,
+        service,
+        batch_size: int = MAX_BATCH_SIZE,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+    ) -> None:
+        self.service = service
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def execute(self, requests: Iterable[Tuple[str, HttpRequest]]) -> BatchResult:
+        """Execute ``(key, request)`` pairs and return their results by key."""
+        result = BatchResult()
+        pending = list(requests)
+        attempt = 0
+        while pending:
+            retry = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start : start + self.batch_size]
+                retry.extend(self._execute_batch(chunk, result))
+
+            if not retry:
+                break
+            if attempt >= self.max_retries:
+                for key, _, error in retry:
+                    result.errors[key] = error
+                break
+
+            delay = self.backoff * (2**attempt)
+            logger.info("Retrying %d Drive calls in %.1fs", len(retry), delay)
+            time.sleep(delay)
+            attempt += 1
+            pending = [(key, request) for key, request, _ in retry]
+        return result
+
+    def _execute_batch(
+        self, chunk: List[Tuple[str, HttpRequest]], result: BatchResult
+    ) -> List[Tuple[str, HttpRequest, Exception]]:
+        requests = dict(chunk)
+        retry = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                result.responses[request_id] = response
+                result.errors.pop(request_id, None)
+            elif is_retryable(exception):
+                retry.append((request_id, requests[request_id], exception))
+            else:
+                result.errors[request_id] = exception
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for key, request in chunk:
+            batch.add(request, request_id=key)
+        try:
+            batch.execute()
+        except HttpError as error:
+            # The batch envelope itself failed; none of its calls ran.
+            if not is_retryable(error):
+                raise
+            return [(key, request, error) for key, request in chunk]
+        return retry
+
+    def map(self, build_request, items: Iterable[str]) -> BatchResult:
+        """Build one request per item with ``build_request(item)`` and run them."""
+        return self.execute((item, build_request(item)) for item in items)
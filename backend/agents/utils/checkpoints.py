@@ -0,0 +1,187 @@
+import datetime
+import functools
+import logging
+from typing import Dict, Iterator, List, Optional
+
+import tiktoken
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple
+
+from agents.models import GraphCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+def _config(thread_id: str, checkpoint_id: Optional[str]) -> Optional[RunnableConfig]:
+    if not checkpoint_id:
+        return None
+    # LangGraph 0.0.x calls the checkpoint id "thread_ts".
+    return {"configurable": {"thread_id": thread_id, "thread_ts": checkpoint_id}}
+
+
+class DjangoCheckpointSaver(BaseCheckpointSaver):
+    """LangGraph checkpoints stored as ``GraphCheckpoint`` rows.
+
+    A graph compiled with this saver and invoked with a ``thread_id`` resumes
+    from the conversation's last state, so a turn only has to send the new
+    message. Each checkpoint is written with a single upsert. The latest
+    checkpoint of a thread is remembered by the saver, so the lookup a run
+    starts with costs one query, however often it is repeated.
+
+    ``compact`` drops all but the latest checkpoint of a thread and trims its
+    messages; ``prune`` deletes conversations that have been idle too long.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._latest: Dict[str, CheckpointTuple] = {}
+
+    def _tuple(self, row: GraphCheckpoint) -> CheckpointTuple:
+        return CheckpointTuple(
+            _config(row.thread_id, row.checkpoint_id),
+            self.serde.loads(bytes(row.checkpoint)),
+            self.serde.loads(bytes(row.metadata)) if row.metadata is not None else {},
+            _config(row.thread_id, row.parent_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_id = config["configurable"].get("thread_ts")
+        rows = GraphCheckpoint.objects.filter(thread_id=thread_id)
+        if checkpoint_id:
+            row = rows.filter(checkpoint_id=checkpoint_id).first()
+            return self._tuple(row) if row is not None else None
+
+        if thread_id in self._latest:
+            return self._latest[thread_id]
+        row = rows.order_by("-checkpoint_id").first()
+        saved = self._tuple(row) if row is not None else None
+        if saved is not None:
+            self._latest[thread_id] = saved
+        return saved
+
+    def list(
+        self,
+        config: RunnableConfig,
+        *,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        rows = GraphCheckpoint.objects.filter(thread_id=str(config["configurable"]["thread_id"]))
+        if before is not None:
+            rows = rows.filter(checkpoint_id__lt=before["configurable"]["thread_ts"])
+        rows = rows.order_by("-checkpoint_id")
+        if limit:
+            rows = rows[:limit]
+        for row in rows.iterator():
+            yield self._tuple(row)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata) -> RunnableConfig:
+        thread_id = str(config["configurable"]["thread_id"])
+        parent_id = config["configurable"].get("thread_ts")
+        GraphCheckpoint.objects.bulk_create(
+            [
+                GraphCheckpoint(
+                    thread_id=thread_id,
+                    checkpoint_id=checkpoint["id"],
+                    parent_id=parent_id,
+                    checkpoint=self.serde.dumps(checkpoint),
+                    metadata=self.serde.dumps(metadata),
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["thread_id", "checkpoint_id"],
+            update_fields=["parent_id", "checkpoint", "metadata", "updated_at"],
+        )
+        saved = _config(thread_id, checkpoint["id"])
+        self._latest[thread_id] = CheckpointTuple(saved, checkpoint, metadata, _config(thread_id, parent_id))
+        return saved
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await sync_to_async(self.get_tuple)(config)
+
+    async def alist(self, config: RunnableConfig, *, before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        for saved in await sync_to_async(lambda: list(self.list(config, before=before, limit=limit)))():
+            yield saved
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata) -> RunnableConfig:
+        return await sync_to_async(self.put)(config, checkpoint, metadata)
+
+    def compact(self, thread_id: str, max_messages: int = None) -> int:
+        """Keep only the thread's latest checkpoint, with at most ``max_messages`` messages.
+
+        Returns the number of checkpoints removed.
+        """
+        max_messages = settings.AGENT_CHECKPOINT_MAX_MESSAGES if max_messages is None else max_messages
+        latest = GraphCheckpoint.objects.filter(thread_id=thread_id).order_by("-checkpoint_id").first()
+        if latest is None:
+            return 0
+        removed, _ = GraphCheckpoint.objects.filter(
+            thread_id=thread_id, checkpoint_id__lt=latest.checkpoint_id
+        ).delete()
+
+        checkpoint = self.serde.loads(bytes(latest.checkpoint))
+        messages = checkpoint["channel_values"].get("messages")
+        trimmed = trim_messages(messages, max_messages) if messages and max_messages else messages
+        if latest.parent_id is not None or trimmed is not messages:
+            checkpoint["channel_values"]["messages"] = trimmed
+            latest.parent_id = None
+            latest.checkpoint = self.serde.dumps(checkpoint)
+            latest.save(update_fields=["parent_id", "checkpoint", "updated_at"])
+        self._latest.pop(thread_id, None)
+        return removed
+
+    @staticmethod
+    def prune(max_age: datetime.timedelta = None) -> int:
+        """Delete checkpoints older than ``max_age``; returns how many."""
+        if max_age is None:
+            max_age = datetime.timedelta(days=settings.AGENT_CHECKPOINT_MAX_AGE_DAYS)
+        deleted, _ = GraphCheckpoint.objects.filter(created_at__lt=timezone.now() - max_age).delete()
+        return deleted
+
+
+def _is_user_message(message) -> bool:
+    # Graphs whose messages channel is a plain list keep inputs as ("user", text) tuples.
+    if isinstance(message, (tuple, list)):
+        return message[0] in ("user", "human")
+    return isinstance(message, HumanMessage)
+
+
+def trim_messages(messages: List[BaseMessage], max_messages: int) -> List[BaseMessage]:
+    """About the last ``max_messages`` messages, starting at a user message.
+
+    Starting at a user message keeps tool results together with the call
+    that asked for them, which the model API requires. If the last
+    ``max_messages`` hold no user message, the trim starts at the latest one.
+    """
+    if len(messages) <= max_messages:
+        return messages
+    window = len(messages) - max_messages
+    for start in list(range(window, len(messages))) + list(range(window - 1, -1, -1)):
+        if _is_user_message(messages[start]):
+            return messages[start:] if start else messages
+    return messages
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The encoding is downloaded on first use; measuring must not break a reply.
+        logger.warning("tiktoken encoding unavailable, estimating tokens from length")
+        return None
+
+
+def count_tokens(turns) -> int:
+    """Approximate prompt tokens of ``(role, content)`` turns."""
+    encoding = _encoding()
+    # Each message costs a few tokens of framing besides its content.
+    return sum(
+        (len(encoding.encode(content)) if encoding is not None else len(content) // 4) + 4
+        for _, content in turns
+    )
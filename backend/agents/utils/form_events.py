@@ -0,0 +1,147 @@
+import base64
+import json
+import logging
+import uuid
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.urls import reverse
+
+from common.redis import get_redis
+from integrations.models import Integration
+
+from ..models import FormWatch
+from .forms import parse_time
+
+logger = logging.getLogger(__name__)
+
+PENDING_SYNC_KEY = "forms:pending-sync:{form_id}"
+
+
+def parse_push_envelope(body: Dict) -> Dict:
+    """Extract the form event from a Pub/Sub push request body.
+
+    Forms puts the event in the message attributes (``formId``, ``watchId``,
+    ``eventType``); ``data`` is empty, so it is only decoded when present.
+    """
+    message = body["message"]
+    attributes = message.get("attributes") or {}
+    data = message.get("data")
+    if data and not attributes.get("formId"):
+        attributes = {**json.loads(base64.b64decode(data)), **attributes}
+    return {
+        "form_id": attributes["formId"],
+        "watch_id": attributes.get("watchId", ""),
+        "event_type": attributes.get("eventType", ""),
+        "message_id": message.get("messageId") or message.get("message_id", ""),
+    }
+
+
+def claim_form_sync(form_id: str) -> bool:
+    """Mark a sync of ``form_id`` as pending; False if one is already queued.
+
+    Pub/Sub delivers at least once and a busy form emits an event per
+    response, so every notification that arrives while a sync is queued is
+    folded into it. The key expires in case the queued sync is lost.
+    """
+    return bool(
+        get_redis().set(
+            PENDING_SYNC_KEY.format(form_id=form_id),
+            1,
+            nx=True,
+            ex=settings.FORMS_EVENT_COALESCE_TTL,
+        )
+    )
+
+
+def release_form_sync(form_id: str):
+    """Called as a sync starts, so events arriving during it queue another one."""
+    get_redis().delete(PENDING_SYNC_KEY.format(form_id=form_id))
+
+
+class FormWatchManager:
+    """Creates, renews and deletes Forms watches and mirrors them in ``FormWatch``."""
+
+    def __init__(self, service, integration: Integration) -> None:
+        self.service = service
+        self.integration = integration
+
+    def _renew_at(self, expire_time):
+        return expire_time - timedelta(seconds=settings.FORMS_WATCH_RENEW_MARGIN)
+
+    def create(self, form_id: str, topic_name: str = None, event_type: str = "RESPONSES") -> FormWatch:
+        topic_name = topic_name or settings.FORMS_WATCH_TOPIC
+        body = {
+            "watch": {
+                "target": {"topic": {"topicName": topic_name}},
+                "eventType": event_type,
+            }
+        }
+        result = self.service.forms().watches().create(formId=form_id, body=body).execute()
+        expire_time = parse_time(result["expireTime"])
+        watch, _ = FormWatch.objects.update_or_create(
+            form_id=form_id,
+            watch_id=result["id"],
+            defaults={
+                "integration": self.integration,
+                "event_type": result.get("eventType", event_type),
+                "topic_name": topic_name,
+                "state": result.get("state", FormWatch.State.ACTIVE),
+                "expire_time": expire_time,
+                "renew_at": self._renew_at(expire_time),
+                "error": result.get("errorType", ""),
+            },
+        )
+        return watch
+
+    def renew(self, watch: FormWatch) -> FormWatch:
+        result = (
+            self.service.forms()
+            .watches()
+            .renew(formId=watch.form_id, watchId=watch.watch_id)
+            .execute()
+        )
+        watch.expire_time = parse_time(result["expireTime"])
+        watch.renew_at = self._renew_at(watch.expire_time)
+        watch.state = result.get("state", FormWatch.State.ACTIVE)
+        watch.error = result.get("errorType", "")
+        watch.save(update_fields=["expire_time", "renew_at", "state", "error", "updated_at"])
+        return watch
+
+    def delete(self, watch: FormWatch):
+        self.service.forms().watches().delete(formId=watch.form_id, watchId=watch.watch_id).execute()
+        watch.delete()
+
+
+class LocalFormEventPublisher:
+    """Stands in for Pub/Sub in tests and local development.
+
+    Posts push envelopes shaped like the ones Pub/Sub sends for Forms watch
+    notifications to the events endpoint through a Django test client.
+    """
+
+    def __init__(self, client=None, token: Optional[str] = None) -> None:
+        if client is None:
+            from django.test import Client
+
+            client = Client()
+        self.client = client
+        self.token = token if token is not None else settings.FORMS_PUSH_TOKEN
+
+    def envelope(self, form_id: str, watch_id: str = "local-watch", event_type: str = "RESPONSES") -> Dict:
+        return {
+            "message": {
+                "attributes": {"formId": form_id, "watchId": watch_id, "eventType": event_type},
+                "messageId": uuid.uuid4().hex,
+            },
+            "subscription": "projects/local/subscriptions/forms-events",
+        }
+
+    def publish(self, form_id: str, watch_id: str = "local-watch", event_type: str = "RESPONSES"):
+        path = f"{reverse('agents:form-events')}?token={self.token}"
+        return self.client.post(
+            path,
+            data=json.dumps(self.envelope(form_id, watch_id, event_type)),
+            content_type="application/json",
+        )
@@ -0,0 +1,249 @@
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from integrations.models import Integration
+
+from ..models import FormResponse, FormSyncState
+from .sheets import factorize
+
+logger = logging.getLogger(__name__)
+
+# responses.list accepts at most 5000 responses per page.
+MAX_PAGE_SIZE = 5000
+
+_FRACTION_RE = re.compile(r"\.(\d{6})\d+")
+
+
+def parse_time(value: str) -> datetime:
+    # The API may return nanosecond precision; datetime keeps microseconds.
+    return parse_datetime(_FRACTION_RE.sub(r".\1", value))
+
+
+def format_time(value: datetime) -> str:
+    return value.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def form_questions(form: Dict) -> Dict[str, Dict]:
+    """Map question ids to their title and type, including grid rows."""
+    questions = {}
+    for item in form.get("items", []):
+        title = item.get("title", "")
+        if "questionItem" in item:
+            question = item["questionItem"]["question"]
+            kind = next((key for key in question if key.endswith("Question")), "question")
+            questions[question["questionId"]] = {"title": title, "type": kind}
+        elif "questionGroupItem" in item:
+            for question in item["questionGroupItem"].get("questions", []):
+                row = question.get("rowQuestion", {}).get("title", "")
+                questions[question["questionId"]] = {
+                    "title": f"{title} [{row}]" if row else title,
+                    "type": "gridQuestion",
+                }
+    return questions
+
+
+def response_answers(response: Dict) -> Dict[str, List[str]]:
+    answers = {}
+    for question_id, answer in response.get("answers", {}).items():
+        if "textAnswers" in answer:
+            values = [value.get("value", "") for value in answer["textAnswers"].get("answers", [])]
+        elif "fileUploadAnswers" in answer:
+            values = [
+                value.get("fileName", value.get("fileId", ""))
+                for value in answer["fileUploadAnswers"].get("answers", [])
+            ]
+        else:
+            values = []
+        answers[question_id] = values
+    return answers
+
+
+def summarize_answers(
+    questions: Dict[str, Dict], rows: Iterable[Dict[str, List[str]]], top_values: int
+) -> Dict[str, Dict]:
+    """Per-question answer statistics, computed one question column at a time.
+
+    Every question gets the number of responses that answered it and the
+    counts of its most common values; numeric answers (scales, ratings,
+    numbers typed as text) also get min, max, mean and median.
+    """
+    columns: Dict[str, List[str]] = {question_id: [] for question_id in questions}
+    answered = dict.fromkeys(questions, 0)
+    for answers in rows:
+        for question_id, values in answers.items():
+            columns.setdefault(question_id, []).extend(values)
+            answered[question_id] = answered.get(question_id, 0) + 1
+
+    summary = {}
+    for question_id, values in columns.items():
+        question = questions.get(question_id, {"title": question_id, "type": "question"})
+        uniques, codes = factorize(values)
+        counts = np.bincount(codes, minlength=len(uniques))
+        order = np.argsort(-counts, kind="stable")[:top_values]
+        stats = {
+            "title": question["title"],
+            "type": question["type"],
+            "answered": answered.get(question_id, 0),
+            "distinct": len(uniques),
+            "counts": {uniques[i]: int(counts[i]) for i in order},
+            "truncated": len(uniques) > top_values,
+        }
+        try:
+            numbers = np.array(values, dtype=np.float64)
+        except ValueError:
+            numbers = None
+        if numbers is not None and len(numbers):
+            stats["numeric"] = {
+                "min": float(numbers.min()),
+                "max": float(numbers.max()),
+                "mean": float(numbers.mean()),
+                "median": float(np.median(numbers)),
+            }
+        summary[question_id] = stats
+    return summary
+
+
+def find_question(summary: Dict[str, Dict], question: str) -> Optional[str]:
+    """Resolve a question id, exact title or unique title fragment to its id."""
+    if question in summary:
+        return question
+    lowered = question.strip().lower()
+    exact = [qid for qid, stats in summary.items() if stats["title"].lower() == lowered]
+    if exact:
+        return exact[0]
+    partial = [qid for qid, stats in summary.items() if lowered in stats["title"].lower()]
+    return partial[0] if len(partial) == 1 else None
+
+
+class FormResponseIngestor:
+    """Mirrors a form's responses into ``FormResponse`` rows.
+
+    The first sync pages through every response; later syncs ask the API only
+    for responses submitted since the stored ``last_submitted_time``. After
+    each sync that changed anything the per-question summary in
+    ``FormSyncState`` is recomputed, so counting questions never hit the API.
+    """
+
+    def __init__(self, service, integration: Optional[Integration] = None, page_size: int = None) -> None:
+        self.service = service
+        self.integration = integration
+        self.page_size = min(page_size or settings.FORMS_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    def iter_responses(self, form_id: str, since: Optional[datetime] = None) -> Iterable[Dict]:
+        params = {"formId": form_id, "pageSize": self.page_size}
+        if since is not None:
+            # ">=" rather than ">": a response submitted in the same instant as
+            # the last one we stored must not be skipped; upserts dedupe it.
+            params["filter"] = f"timestamp >= {format_time(since)}"
+        page_token = None
+        while True:
+            if page_token:
+                params["pageToken"] = page_token
+            result = self.service.forms().responses().list(**params).execute()
+            yield from result.get("responses", [])
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return
+
+    def sync(self, form_id: str) -> FormSyncState:
+        state, _ = FormSyncState.objects.get_or_create(
+            form_id=form_id, defaults={"integration": self.integration}
+        )
+        changed = 0
+        batch = []
+        latest = state.last_submitted_time
+        for response in self.iter_responses(form_id, since=state.last_submitted_time):
+            submitted = parse_time(response["lastSubmittedTime"])
+            latest = submitted if latest is None else max(latest, submitted)
+            batch.append(
+                FormResponse(
+                    form_id=form_id,
+                    response_id=response["responseId"],
+                    respondent_email=response.get("respondentEmail", ""),
+                    create_time=parse_time(response["createTime"]),
+                    last_submitted_time=submitted,
+                    answers=response_answers(response),
+                    total_score=response.get("totalScore"),
+                )
+            )
+            if len(batch) >= self.page_size:
+                changed += self._save(batch)
+                batch = []
+        changed += self._save(batch)
+
+        if changed or not state.summary:
+            form = self.service.forms().get(formId=form_id).execute()
+            state.title = form.get("info", {}).get("title", "")
+            state.summary = summarize_answers(
+                form_questions(form),
+                FormResponse.objects.filter(form_id=form_id)
+                .values_list("answers", flat=True)
+                .iterator(chunk_size=2000),
+                settings.FORMS_SUMMARY_TOP_VALUES,
+            )
+            state.response_count = FormResponse.objects.filter(form_id=form_id).count()
+        state.last_submitted_time = latest
+        state.last_synced_at = timezone.now()
+        state.save()
+        logger.info(
+            "Synced form %s: %d new or updated of %d responses",
+            form_id,
+            changed,
+            state.response_count,
+        )
+        return state
+
+    def _save(self, batch: List[FormResponse]) -> int:
+        if not batch:
+            return 0
+        stored = dict(
+            FormResponse.objects.filter(
+                form_id=batch[0].form_id,
+                response_id__in=[response.response_id for response in batch],
+            ).values_list("response_id", "last_submitted_time")
+        )
+        # The inclusive time filter returns the newest stored response again.
+        batch = [
+            response
+            for response in batch
+            if stored.get(response.response_id) != response.last_submitted_time
+        ]
+        if not batch:
+            return 0
+        FormResponse.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["form_id", "response_id"],
+            update_fields=[
+                "respondent_email",
+                "last_submitted_time",
+                "answers",
+                "total_score",
+                "updated_at",
+            ],
+        )
+        return len(batch)
+
+
+def count_answers(state: FormSyncState, question_id: str, answer: str) -> int:
+    """Number of responses that gave ``answer`` (case-insensitive) to a question."""
+    stats = state.summary[question_id]
+    lowered = answer.strip().lower()
+    matches = [value for value in stats["counts"] if value.lower() == lowered]
+    if matches or not stats["truncated"]:
+        return sum(stats["counts"][value] for value in matches)
+    # Rare values fall outside the stored top counts; scan the local copy.
+    return sum(
+        1
+        for answers in FormResponse.objects.filter(form_id=state.form_id)
+        .values_list("answers", flat=True)
+        .iterator(chunk_size=2000)
+        if any(value.lower() == lowered for value in answers.get(question_id, []))
+    )
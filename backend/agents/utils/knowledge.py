@@ -0,0 +1,288 @@
+import html
+import logging
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.html import strip_tags
+
+from integrations.models import Integration
+
+from ..models import KnowledgeArticle, KnowledgeSyncState
+from .retrieval import EmbeddingFunction, _normalize, _top_k, get_embedding_function
+from .salesforce import escape_sosl, format_soql_datetime
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("Id", "KnowledgeArticleId", "Title", "Question__c", "Answer__c", "UrlName", "LastModifiedDate")
+BATCH_SIZE = 500
+# Reciprocal rank fusion constant; damps the influence of the very top ranks.
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Per-process indexes keyed by integration id, with the sync they were built from.
+_indexes: Dict[str, Tuple[object, "KnowledgeIndex"]] = {}
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def plain_text(value: Optional[str]) -> str:
+    """Rich text fields come back as HTML; keep the text only."""
+    return html.unescape(strip_tags(value or "")).strip()
+
+
+def article_text(title: str, question: str, answer: str) -> str:
+    # The title is repeated so that title matches outweigh body matches.
+    return f"{title}\n{title}\n{question}\n{answer}"
+
+
+def article_url(base_url: str, version_id: str) -> str:
+    return f"{base_url}/lightning/r/Knowledge__kav/{version_id}/view"
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory inverted index.
+
+    Postings are stored CSR-style: the documents containing term ``t`` are
+    ``docs[offsets[t]:offsets[t + 1]]``, next to their precomputed term weights,
+    so scoring a query is one vectorized add per query term.
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.2, b: float = 0.75) -> None:
+        count = len(documents)
+        self.vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids = [], []
+        lengths = np.zeros(count, dtype=np.float64)
+        for doc, text in enumerate(documents):
+            tokens = tokenize(text)
+            lengths[doc] = len(tokens)
+            term_ids.extend(self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens)
+            doc_ids.extend([doc] * len(tokens))
+
+        self.size = count
+        pairs, frequencies = np.unique(
+            np.asarray(term_ids, dtype=np.int64) * max(count, 1) + np.asarray(doc_ids, dtype=np.int64),
+            return_counts=True,
+        )
+        terms = pairs // max(count, 1)
+        self.docs = pairs % max(count, 1)
+        document_frequency = np.bincount(terms, minlength=len(self.vocabulary))
+        self.offsets = np.concatenate([[0], np.cumsum(document_frequency)])
+        self.idf = np.log1p((count - document_frequency + 0.5) / (document_frequency + 0.5))
+        average = lengths.mean() if count and lengths.mean() else 1.0
+        norms = k1 * (1 - b + b * lengths / average)
+        self.weights = frequencies * (k1 + 1) / (frequencies + norms[self.docs])
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float64)
+        for token in set(tokenize(query)):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            postings = slice(self.offsets[term], self.offsets[term + 1])
+            # A term lists each document once, so plain fancy-index add is safe.
+            scores[self.docs[postings]] += self.idf[term] * self.weights[postings]
+        return scores
+
+
+class KnowledgeIndex:
+    """BM25 and, when every article has an embedding, vector search over a mirror."""
+
+    def __init__(self, ids: List[str], documents: List[str], embeddings: List[Optional[bytes]]) -> None:
+        self.ids = ids
+        self.lexical = BM25Index(documents)
+        self.vectors = None
+        if ids and all(embeddings):
+            self.vectors = _normalize(np.stack([np.frombuffer(e, dtype=np.float32) for e in embeddings]))
+
+    @classmethod
+    def load(cls, integration: Integration) -> "KnowledgeIndex":
+        rows = KnowledgeArticle.objects.filter(integration=integration).values_list(
+            "id", "title", "question", "answer", "embedding"
+        )
+        ids, documents, embeddings = [], [], []
+        for pk, title, question, answer, embedding in rows.iterator(chunk_size=2000):
+            ids.append(pk)
+            documents.append(article_text(title, question, answer))
+            embeddings.append(bytes(embedding) if embedding is not None else None)
+        return cls(ids, documents, embeddings)
+
+    def search(self, query: str, k: int = 5, embed: EmbeddingFunction = None) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(article pk, score)`` pairs; empty when nothing matches."""
+        lexical = self.lexical.scores(query)
+        if self.vectors is None or embed is None:
+            return [(self.ids[i], float(lexical[i])) for i in _top_k(lexical, k) if lexical[i] > 0]
+
+        semantic = self.vectors @ _normalize(embed([query]))[0]
+        matched = (lexical > 0) | (semantic >= settings.KNOWLEDGE_MIN_SIMILARITY)
+        fused = np.zeros(len(self.ids), dtype=np.float64)
+        for scores in (lexical, semantic):
+            ranks = np.empty(len(scores), dtype=np.float64)
+            ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+            fused += 1.0 / (RRF_K + ranks + 1)
+        fused[~matched] = -np.inf
+        return [(self.ids[i], float(fused[i])) for i in _top_k(fused, k) if np.isfinite(fused[i])]
+
+
+def get_index(integration: Integration, state: KnowledgeSyncState) -> KnowledgeIndex:
+    """The integration's index, rebuilt only after the mirror has synced again."""
+    cached = _indexes.get(integration.id)
+    if cached is None or cached[0] != state.last_synced_at:
+        cached = (state.last_synced_at, KnowledgeIndex.load(integration))
+        _indexes[integration.id] = cached
+    return cached[1]
+
+
+class KnowledgeMirror:
+    """Keeps a local copy of an org's online ``Knowledge__kav`` articles.
+
+    Each sync asks Salesforce only for article versions modified since the
+    stored ``LastModifiedDate`` watermark: newly online versions replace the
+    local row of their article, and articles whose local version was archived
+    are dropped. Searches run against the local copy and fall back to a live
+    SOSL search when it has nothing relevant.
+    """
+
+    def __init__(self, sf, integration: Integration, embedding_function: EmbeddingFunction = None) -> None:
+        self.sf = sf
+        self.integration = integration
+        if embedding_function is None and settings.KNOWLEDGE_EMBEDDINGS:
+            embedding_function = get_embedding_function()
+        self.embed = embedding_function
+
+    @property
+    def base_url(self) -> str:
+        return self.sf.base_url.split("/services")[0]
+
+    def _soql(self, status: str, since=None) -> str:
+        clauses = [f"PublishStatus = '{status}'"]
+        if settings.KNOWLEDGE_LANGUAGE:
+            clauses.append(f"Language = '{settings.KNOWLEDGE_LANGUAGE}'")
+        if since is not None:
+            # ">=" so versions modified in the same second as the watermark are
+            # not missed; upserts make the overlap harmless.
+            clauses.append(f"LastModifiedDate >= {format_soql_datetime(since)}")
+        return (
+            f"SELECT {', '.join(FIELDS)} FROM Knowledge__kav "
+            f"WHERE {' AND '.join(clauses)} ORDER BY LastModifiedDate"
+        )
+
+    def sync(self) -> KnowledgeSyncState:
+        state, _ = KnowledgeSyncState.objects.get_or_create(integration=self.integration)
+        since = latest = state.last_modified
+
+        changed, batch = 0, []
+        for record in self.sf.query_all_iter(self._soql("Online", since)):
+            modified = parse_datetime(record["LastModifiedDate"])
+            latest = modified if latest is None else max(latest, modified)
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                changed += self._save(batch)
+                batch = []
+        changed += self._save(batch)
+
+        removed = 0
+        if since is not None:
+            archived = []
+            for record in self.sf.query_all_iter(self._soql("Archived", since)):
+                latest = max(latest, parse_datetime(record["LastModifiedDate"]))
+                archived.append(record["Id"])
+            # Publishing a new version archives the old one; only rows still
+            # holding an archived version belong to withdrawn articles.
+            for start in range(0, len(archived), BATCH_SIZE):
+                removed += KnowledgeArticle.objects.filter(
+                    integration=self.integration, version_id__in=archived[start : start + BATCH_SIZE]
+                ).delete()[0]
+
+        state.last_modified = latest
+        state.last_synced_at = timezone.now()
+        state.save()
+        logger.info(
+            "Synced Knowledge of %s: %d new or updated, %d removed", self.integration.id, changed, removed
+        )
+        return state
+
+    def _save(self, records: List[Dict]) -> int:
+        if not records:
+            return 0
+        articles = [
+            KnowledgeArticle(
+                integration=self.integration,
+                knowledge_article_id=record["KnowledgeArticleId"],
+                version_id=record["Id"],
+                title=record["Title"] or "",
+                question=plain_text(record.get("Question__c")),
+                answer=plain_text(record.get("Answer__c")),
+                url_name=record.get("UrlName") or "",
+                last_modified=parse_datetime(record["LastModifiedDate"]),
+            )
+            for record in records
+        ]
+        if self.embed is not None:
+            vectors = self.embed([article_text(a.title, a.question, a.answer) for a in articles])
+            for article, vector in zip(articles, np.asarray(vectors, dtype=np.float32)):
+                article.embedding = vector.tobytes()
+        KnowledgeArticle.objects.bulk_create(
+            articles,
+            update_conflicts=True,
+            unique_fields=["integration", "knowledge_article_id"],
+            update_fields=[
+                "version_id",
+                "title",
+                "question",
+                "answer",
+                "url_name",
+                "last_modified",
+                "embedding",
+                "updated_at",
+            ],
+        )
+        return len(articles)
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """Articles relevant to ``query``, from the mirror when it has any."""
+        state = KnowledgeSyncState.objects.filter(
+            integration=self.integration, last_synced_at__isnull=False
+        ).first()
+        if state is not None:
+            hits = get_index(self.integration, state).search(query, k=k, embed=self.embed)
+            if hits:
+                articles = KnowledgeArticle.objects.in_bulk([pk for pk, _ in hits])
+                return [
+                    {
+                        "title": articles[pk].title,
+                        "question": articles[pk].question,
+                        "answer": articles[pk].answer,
+                        "url": article_url(self.base_url, articles[pk].version_id),
+                        "score": round(score, 4),
+                        "source": "local",
+                    }
+                    for pk, score in hits
+                    if pk in articles
+                ]
+        return self.search_live(query, k=k)
+
+    def search_live(self, query: str, k: int = 5) -> List[Dict]:
+        search_string = (
+            f"FIND {{{escape_sosl(query)}}} IN ALL FIELDS RETURNING "
+            f"Knowledge__kav(Id, Title, Question__c, Answer__c, UrlName WHERE PublishStatus = 'Online') "
+            f"LIMIT {int(k)}"
+        )
+        result = self.sf.search(search_string)
+        return [
+            {
+                "title": record["Title"],
+                "question": plain_text(record.get("Question__c")),
+                "answer": plain_text(record.get("Answer__c")),
+                "url": article_url(self.base_url, record["Id"]),
+                "score": None,
+                "source": "salesforce",
+            }
+            for record in result.get("searchRecords", [])
+        ]
@@ -0,0 +1,476 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from common.redis import get_redis
+from integrations.models import Integration
+
+from ..models import DocumentChunk, DriveSyncState
+from .extraction import (
+    EXPORT_MIMETYPES,
+    GOOGLE_DOC,
+    PDF,
+    DocumentTextExtractor,
+)
+
+logger = logging.getLogger(__name__)
+
+EmbeddingFunction = Callable[[List[str]], np.ndarray]
+
+INDEXABLE_MIMETYPES = {GOOGLE_DOC, PDF, *EXPORT_MIMETYPES}
+
+INDEX_LOCK_KEY = "retrieval:lock:{integration_id}"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def hashing_embedding(texts: List[str], dim: int = None) -> np.ndarray:
+    """Local embedding by feature-hashing word unigrams and bigrams.
+
+    Needs no provider or network access; good enough for keyword-heavy lookups
+    and for development.
+    """
+    dim = dim or settings.RETRIEVAL_EMBEDDING_DIM
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [" ".join(pair) for pair in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vectors[i, bucket] += sign
+    return vectors
+
+
+def openai_embedding(texts: List[str]) -> np.ndarray:
+    from langchain_openai import OpenAIEmbeddings
+
+    embeddings = OpenAIEmbeddings(
+        model=settings.RETRIEVAL_EMBEDDING_MODEL, openai_api_key=settings.OPENAI_API_KEY
+    )
+    return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def get_embedding_function() -> EmbeddingFunction:
+    return import_string(settings.RETRIEVAL_EMBEDDING_FUNCTION)
+
+
+def chunk_text(text: str, chunk_size: int = None, chunk_overlap: int = None) -> List[str]:
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or settings.RETRIEVAL_CHUNK_SIZE,
+        chunk_overlap=chunk_overlap or settings.RETRIEVAL_CHUNK_OVERLAP,
+    )
+    return splitter.split_text(text)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _kmeans(data: np.ndarray, k: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over unit vectors; returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=k)
+        filled = counts > 0
+        # Empty clusters keep their previous centroid.
+        centroids[filled] = _normalize(sums[filled])
+    return centroids
+
+
+class VectorIndex:
+    """Unit-normalized float32 vectors in a memory-mapped ``.npy`` matrix.
+
+    Rows are append-only; deleting marks a row dead in the ``alive`` mask and
+    ``compact`` rewrites the matrix without them. Search is an exact dot product
+    over all live rows, or, once ``build_ivf`` has partitioned the rows around
+    k-means centroids, over the rows of the ``nprobe`` closest partitions.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        self.meta = {"dim": None, "count": 0, "capacity": 0, "nlist": 0}
+        self._meta_seen = self._meta_stamp()
+        if self._meta_seen is not None:
+            self.meta.update(json.loads(self._file("meta.json").read_text()))
+        self._vectors = self._alive = self._assignments = self._centroids = None
+        self._lists = None
+
+    def _meta_stamp(self) -> Optional[Tuple[int, int]]:
+        # meta.json is replaced, never rewritten, so each save gets a new inode;
+        # mtime alone can repeat within the filesystem's timestamp granularity.
+        try:
+            stat = self._file("meta.json").stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def refresh(self):
+        """Reopen the index if another process wrote to it since it was opened."""
+        if self._meta_stamp() != self._meta_seen:
+            self._load()
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.meta["dim"]
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    @property
+    def size(self) -> int:
+        """Number of live rows."""
+        return int(self.alive[: self.count].sum()) if self.count else 0
+
+    def _save_meta(self):
+        tmp = self._file("meta.json.tmp")
+        tmp.write_text(json.dumps(self.meta))
+        os.replace(tmp, self._file("meta.json"))
+        self._meta_seen = self._meta_stamp()
+
+    def _open(self, name: str, dtype, shape) -> np.ndarray:
+        file = self._file(name)
+        if file.exists():
+            return np.load(file, mmap_mode="r+")
+        return np.lib.format.open_memmap(file, mode="w+", dtype=dtype, shape=shape)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._vectors is None:
+            self._vectors = self._open(
+                "vectors.npy", np.float32, (self.meta["capacity"], self.dim)
+            )
+        return self._vectors
+
+    @property
+    def alive(self) -> np.ndarray:
+        if self._alive is None:
+            self._alive = self._open("alive.npy", np.bool_, (self.meta["capacity"],))
+        return self._alive
+
+    @property
+    def assignments(self) -> np.ndarray:
+        if self._assignments is None:
+            self._assignments = self._open("assignments.npy", np.int32, (self.meta["capacity"],))
+        return self._assignments
+
+    @property
+    def centroids(self) -> Optional[np.ndarray]:
+        if self._centroids is None and self.meta["nlist"]:
+            self._centroids = np.load(self._file("centroids.npy"))
+        return self._centroids
+
+    def _grow(self, name: str, old: np.ndarray, dtype, shape) -> np.ndarray:
+        tmp = self._file(name + ".tmp")
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+        if old is not None and self.count:
+            grown[: self.count] = old[: self.count]
+        grown.flush()
+        del grown
+        os.replace(tmp, self._file(name))
+        return np.load(self._file(name), mmap_mode="r+")
+
+    def _ensure_capacity(self, required: int):
+        capacity = self.meta["capacity"]
+        if required <= capacity:
+            return
+        capacity = max(required, capacity * 2, 1024)
+        old_vectors = self.vectors if self.meta["capacity"] else None
+        old_alive = self.alive if self.meta["capacity"] else None
+        old_assignments = self.assignments if self.meta["capacity"] else None
+        self._vectors = self._grow("vectors.npy", old_vectors, np.float32, (capacity, self.dim))
+        self._alive = self._grow("alive.npy", old_alive, np.bool_, (capacity,))
+        self._assignments = self._grow("assignments.npy", old_assignments, np.int32, (capacity,))
+        self.meta["capacity"] = capacity
+        self._save_meta()
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Append vectors and return their row numbers."""
+        vectors = _normalize(vectors)
+        if self.dim is None:
+            self.meta["dim"] = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}.")
+
+        start = self.count
+        end = start + len(vectors)
+        self._ensure_capacity(end)
+        self.vectors[start:end] = vectors
+        self.alive[start:end] = True
+        if self.centroids is not None:
+            self.assignments[start:end] = np.argmax(vectors @ self.centroids.T, axis=1)
+        self.vectors.flush()
+        self.alive.flush()
+        self.assignments.flush()
+        # Rows become visible to readers only once the count is published.
+        self.meta["count"] = end
+        self._save_meta()
+        return np.arange(start, end)
+
+    def remove(self, rows: Sequence[int]):
+        if len(rows) == 0:
+            return
+        self.alive[np.asarray(rows, dtype=np.int64)] = False
+        self.alive.flush()
+
+    def search(self, query: np.ndarray, k: int = 5, nprobe: int = None) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(row, cosine similarity)`` pairs, best first."""
+        if not self.count:
+            return []
+        query = _normalize(query)[0]
+        if self.centroids is not None:
+            rows = self._probe(query, nprobe or settings.RETRIEVAL_IVF_NPROBE)
+            rows = rows[self.alive[rows]]
+            scores = self.vectors[rows] @ query
+        else:
+            # Score the whole matrix in place rather than gathering live rows.
+            rows = None
+            scores = self.vectors[: self.count] @ query
+            scores[~self.alive[: self.count]] = -np.inf
+        return [
+            (int(i if rows is None else rows[i]), float(scores[i]))
+            for i in _top_k(scores, k)
+            if np.isfinite(scores[i])
+        ]
+
+    def _probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        if self._lists is None or self._lists[0] != self.count:
+            assignments = self.assignments[: self.count]
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.concatenate(
+                [[0], np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))]
+            )
+            self._lists = (self.count, order, offsets)
+        _, order, offsets = self._lists
+        probe = _top_k(self.centroids @ query, nprobe)
+        return np.sort(np.concatenate([order[offsets[c] : offsets[c + 1]] for c in probe]))
+
+    def build_ivf(self, nlist: int = None, n_iter: int = 10, sample_size: int = 50000):
+        """Partition the live rows into ``nlist`` k-means clusters."""
+        live = np.flatnonzero(self.alive[: self.count])
+        nlist = nlist or max(1, int(np.sqrt(len(live))))
+        if len(live) < nlist:
+            return
+        rng = np.random.default_rng(0)
+        sample = live if len(live) <= sample_size else rng.choice(live, sample_size, replace=False)
+        centroids = _kmeans(np.asarray(self.vectors[np.sort(sample)]), nlist, n_iter=n_iter)
+
+        for start in range(0, self.count, 10000):
+            block = self.vectors[start : start + 10000]
+            self.assignments[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        self.assignments.flush()
+        np.save(self._file("centroids.npy"), centroids)
+        self._centroids = centroids
+        self._lists = None
+        self.meta["nlist"] = nlist
+        self._save_meta()
+
+    def compact(self) -> np.ndarray:
+        """Drop dead rows; returns an array mapping old rows to new rows (-1 if dropped)."""
+        live = np.flatnonzero(self.alive[: self.count])
+        mapping = np.full(self.count, -1, dtype=np.int64)
+        mapping[live] = np.arange(len(live))
+        self.vectors[: len(live)] = self.vectors[live]
+        self.assignments[: len(live)] = self.assignments[live]
+        self.alive[: len(live)] = True
+        self.alive[len(live) : self.count] = False
+        self.vectors.flush()
+        self.assignments.flush()
+        self.alive.flush()
+        self.meta["count"] = len(live)
+        self._lists = None
+        self._save_meta()
+        return mapping
+
+
+def index_path(integration: Integration) -> Path:
+    return Path(settings.RETRIEVAL_INDEX_DIR) / str(integration.id)
+
+
+def index_lock(integration_id):
+    """Redis lock held while writing an integration's index.
+
+    ``add`` and ``compact`` rewrite the memory-mapped files and ``meta.json``
+    in place, so the workers indexing and syncing an integration take turns.
+    Open the ``DocumentIndexer`` after acquiring it, so it sees the last write.
+    """
+    return get_redis().lock(
+        INDEX_LOCK_KEY.format(integration_id=integration_id),
+        timeout=settings.RETRIEVAL_LOCK_TIMEOUT,
+        blocking_timeout=settings.RETRIEVAL_LOCK_TIMEOUT,
+    )
+
+
+class DocumentIndexer:
+    """Keeps an integration's vector index in step with its Drive documents."""
+
+    def __init__(
+        self,
+        integration: Integration,
+        creds: Credentials = None,
+        embedding_function: EmbeddingFunction = None,
+        drive_service=None,
+    ) -> None:
+        self.integration = integration
+        creds = creds or integration.credentials
+        self.drive = drive_service or build("drive", "v3", credentials=creds)
+        self.extractor = DocumentTextExtractor(creds, drive_service=self.drive)
+        self.embed = embedding_function or get_embedding_function()
+        self.index = VectorIndex(index_path(integration))
+
+    def _chunks(self):
+        return DocumentChunk.objects.filter(integration=self.integration)
+
+    def index_file(self, file_id: str) -> int:
+        """(Re)index a file if its revision changed; returns the number of chunks added."""
+        metadata, revision = self.extractor.get_revision(file_id)
+        indexed = self._chunks().filter(file_id=file_id).values_list("revision", flat=True).first()
+        if indexed == revision:
+            return 0
+
+        text, revision = self.extractor.extract_with_revision(file_id, known=(metadata, revision))
+        self.remove_file(file_id)
+        chunks = chunk_text(text)
+        if not chunks:
+            return 0
+        rows = self.index.add(self.embed(chunks))
+        DocumentChunk.objects.bulk_create(
+            [
+                DocumentChunk(
+                    integration=self.integration,
+                    file_id=file_id,
+                    revision=revision,
+                    chunk_index=i,
+                    row=int(row),
+                    text=chunk,
+                )
+                for i, (row, chunk) in enumerate(zip(rows, chunks))
+            ]
+        )
+        self._maybe_build_ivf()
+        return len(chunks)
+
+    def remove_file(self, file_id: str):
+        chunks = self._chunks().filter(file_id=file_id)
+        self.index.remove(list(chunks.values_list("row", flat=True)))
+        chunks.delete()
+
+    def compact(self):
+        """Reclaim the rows of removed chunks and renumber the remaining ones."""
+        mapping = self.index.compact()
+        chunks = list(self._chunks().only("id", "row"))
+        for chunk in chunks:
+            chunk.row = int(mapping[chunk.row])
+        DocumentChunk.objects.bulk_update(chunks, ["row"], batch_size=1000)
+
+    def maybe_compact(self) -> bool:
+        """Compact once dead rows reach ``RETRIEVAL_COMPACT_THRESHOLD`` of the index."""
+        count = self.index.count
+        if not count or (count - self.index.size) / count < settings.RETRIEVAL_COMPACT_THRESHOLD:
+            return False
+        self.compact()
+        return True
+
+    def _maybe_build_ivf(self):
+        threshold = settings.RETRIEVAL_IVF_THRESHOLD
+        if threshold and self.index.centroids is None and self.index.size >= threshold:
+            self.index.build_ivf()
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        # The agent's indexer outlives the writes and compactions of the workers
+        self.index.refresh()
+        hits = self.index.search(self.embed([query]), k=k)
+        if not hits:
+            return []
+        chunks = {
+            chunk.row: chunk
+            for chunk in self._chunks().filter(row__in=[row for row, _ in hits])
+        }
+        return [
+            {
+                "file_id": chunks[row].file_id,
+                "chunk": chunks[row].chunk_index,
+                "score": round(score, 4),
+                "text": chunks[row].text,
+            }
+            for row, score in hits
+            if row in chunks
+        ]
+
+    def sync_changes(self) -> int:
+        """Apply Drive changes since the last sync; returns the number of files touched."""
+        state, _ = DriveSyncState.objects.get_or_create(integration=self.integration)
+        if not state.page_token:
+            state.page_token = self.drive.changes().getStartPageToken().execute()["startPageToken"]
+            state.last_synced_at = timezone.now()
+            state.save()
+            return 0
+
+        touched = 0
+        page_token = state.page_token
+        while page_token is not None:
+            response = (
+                self.drive.changes()
+                .list(
+                    pageToken=page_token,
+                    spaces="drive",
+                    fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(mimeType, trashed))",
+                )
+                .execute()
+            )
+            for change in response.get("changes", []):
+                file = change.get("file") or {}
+                try:
+                    if change.get("removed") or file.get("trashed"):
+                        self.remove_file(change["fileId"])
+                    elif file.get("mimeType") in INDEXABLE_MIMETYPES:
+                        self.index_file(change["fileId"])
+                    else:
+                        continue
+                    touched += 1
+                except Exception:
+                    logger.exception("Failed to index Drive file %s", change.get("fileId"))
+            if "newStartPageToken" in response:
+                state.page_token = response["newStartPageToken"]
+            page_token = response.get("nextPageToken")
+
+        state.last_synced_at = timezone.now()
+        state.save()
+        return touched
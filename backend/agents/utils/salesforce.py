@@ -0,0 +1,295 @@
+import csv
+import io
+import itertools
+import json
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urljoin
+
+import requests
+from django.conf import settings
+from simple_salesforce import Salesforce
+from simple_salesforce.exceptions import SalesforceError
+
+from integrations.models import Integration
+
+logger = logging.getLogger(__name__)
+
+# sObject Collections accept at most 200 records per request.
+MAX_COLLECTION_SIZE = 200
+
+# Friendly names agents use for Case fields.
+CASE_FIELDS = {
+    "subject": "Subject",
+    "description": "Description",
+    "status": "Status",
+    "priority": "Priority",
+    "origin": "Origin",
+}
+
+_SOSL_RESERVED_RE = re.compile(r"""([?&|!{}\[\]()^~*:\\"'+\-])""")
+_SOQL_QUOTED_RE = re.compile(r"([\\'])")
+_FROM_RE = re.compile(r"\bFROM\s+(\w+)", re.IGNORECASE)
+# Bulk API 2.0 rejects parent-child subqueries, aggregates and OFFSET.
+_BULK_UNSUPPORTED_RE = re.compile(r"\(\s*SELECT\b|\bGROUP\s+BY\b|\bOFFSET\b|\bCOUNT\s*\(", re.IGNORECASE)
+
+
+def salesforce_client(integration: Integration) -> Salesforce:
+    """Connect with the integration's OAuth access token.
+
+    The instance URL is the one the agent was created with; the token is the
+    one stored when the OAuth callback completed.
+    """
+    return Salesforce(
+        instance_url=integration.agent.instance_url,
+        session_id=integration.access_token,
+        version=settings.SALESFORCE_API_VERSION,
+    )
+
+
+def refresh_salesforce_token(integration: Integration) -> None:
+    """Replace the integration's expired access token using its refresh token.
+
+    Raises ``requests.HTTPError`` when Salesforce rejects the refresh token,
+    e.g. because the user revoked the app; the refresh token itself stays valid
+    until then, so only the access token is stored.
+    """
+    response = requests.post(
+        urljoin(integration.agent.instance_url, "/services/oauth2/token"),
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": integration.refresh_token,
+            "client_id": settings.SALESFORCE_CLIENT_ID,
+            "client_secret": settings.SALESFORCE_CLIENT_SECRET,
+        },
+    )
+    response.raise_for_status()
+    integration.access_token = response.json()["access_token"]
+    integration.save(update_fields=["access_token", "updated_at"])
+
+
+def record_url(sf: Salesforce, sobject: str, record_id: str) -> str:
+    """Lightning URL of a record, built from the connection's instance URL."""
+    return f"{sf.base_url.split('/services')[0]}/lightning/r/{sobject}/{record_id}/view"
+
+
+def escape_sosl(term: str) -> str:
+    """Escape SOSL reserved characters so user text can go inside ``FIND {...}``."""
+    return _SOSL_RESERVED_RE.sub(r"\\\1", term)
+
+
+def escape_soql(value: str) -> str:
+    """Escape a value for use inside a quoted SOQL string literal."""
+    return _SOQL_QUOTED_RE.sub(r"\\\1", value)
+
+
+def format_soql_datetime(value: datetime) -> str:
+    """Render an aware datetime as an (unquoted) SOQL dateTime literal."""
+    return value.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() == "true"
+
+
+# Bulk API 2.0 CSV cells are strings; these field types are numbers or booleans in REST results.
+_BULK_TYPES: Dict[Optional[str], Callable[[str], Any]] = {
+    "boolean": _parse_bool,
+    "int": int,
+    "double": float,
+    "currency": float,
+    "percent": float,
+}
+
+
+def _nest_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Nest the dotted columns of a Bulk API row like a REST record.
+
+    ``{"Account.Name": "Acme"}`` becomes ``{"Account": {"Name": "Acme"}}``,
+    and, as in REST results, a relationship whose fields are all null is null.
+    """
+    record: Dict[str, Any] = {}
+    for path, value in row.items():
+        *relationships, leaf = path.split(".")
+        target = record
+        for relationship in relationships:
+            target = target.setdefault(relationship, {})
+        target[leaf] = value
+    return {field: _null_if_empty(value) for field, value in record.items()}
+
+
+def _null_if_empty(value):
+    if not isinstance(value, dict):
+        return value
+    value = {field: _null_if_empty(nested) for field, nested in value.items()}
+    return None if all(nested is None for nested in value.values()) else value
+
+
+class SalesforceQueryExecutor:
+    """Streams SOQL results one record at a time, never holding more than a page.
+
+    Every query starts as a REST ``query``; its first page reports the total
+    size. Small results are then followed page by page with ``queryMore``.
+    Results larger than ``bulk_threshold`` are re-run as a Bulk API 2.0 job,
+    whose CSV result pages are parsed as they are downloaded into records
+    shaped like REST ones: relationship columns nested and numbers and
+    booleans typed, using one describe call per object. ``max_rows``
+    stops iteration (and further API calls) once that many records were
+    yielded, and keeps capped queries on the REST path.
+    """
+
+    def __init__(self, sf, bulk_threshold: int = None, bulk_page_size: int = None) -> None:
+        self.sf = sf
+        self.bulk_threshold = bulk_threshold if bulk_threshold is not None else settings.SALESFORCE_BULK_THRESHOLD
+        self.bulk_page_size = bulk_page_size or settings.SALESFORCE_BULK_PAGE_SIZE
+        self.total_size: Optional[int] = None
+        self.used_bulk = False
+
+    def _bulk_supported(self, soql: str) -> bool:
+        return bool(_FROM_RE.search(soql)) and not _BULK_UNSUPPORTED_RE.search(soql)
+
+    def iter_records(self, soql: str, max_rows: int = None, include_deleted: bool = False) -> Iterator[Dict]:
+        result = self.sf.query(soql, include_deleted=include_deleted)
+        self.total_size = result["totalSize"]
+        self.used_bulk = (
+            bool(self.bulk_threshold)
+            and self.total_size > self.bulk_threshold
+            and (max_rows is None or max_rows > self.bulk_threshold)
+            and self._bulk_supported(soql)
+        )
+        if self.used_bulk:
+            logger.info("Streaming %d records through Bulk API 2.0", self.total_size)
+            records = self._iter_bulk(soql, include_deleted)
+        else:
+            records = self._iter_rest(result, include_deleted)
+        # Only the generator may keep a page alive, or the first one would
+        # stay in memory for the whole iteration.
+        del result
+
+        # islice stops without asking for another record, which could cost a page.
+        yield from records if max_rows is None else itertools.islice(records, max_rows)
+
+    def _iter_rest(self, result: Dict, include_deleted: bool) -> Iterator[Dict]:
+        while True:
+            for record in result["records"]:
+                record.pop("attributes", None)
+                yield record
+            if result["done"]:
+                return
+            # Rebinding drops the previous page before the next one arrives.
+            result = self.sf.query_more(
+                result["nextRecordsUrl"], identifier_is_url=True, include_deleted=include_deleted
+            )
+
+    def _iter_bulk(self, soql: str, include_deleted: bool) -> Iterator[Dict]:
+        name = _FROM_RE.search(soql)[1]
+        sobject = getattr(self.sf.bulk2, name)
+        query = sobject.query_all if include_deleted else sobject.query
+        converters = None
+        for page in query(soql, max_records=self.bulk_page_size):
+            reader = csv.DictReader(io.StringIO(page))
+            if converters is None:
+                converters = self._bulk_converters(name, reader.fieldnames or [])
+            for row in reader:
+                yield _nest_record(
+                    {
+                        field: converters[field](value) if value != "" else None
+                        for field, value in row.items()
+                    }
+                )
+
+    def _bulk_converters(self, sobject: str, fields: List[str]) -> Dict[str, Callable[[str], Any]]:
+        """Parse CSV cells into the JSON types the REST API returns, by field type.
+
+        ``Account.Name`` is typed by following ``Account`` to the object it
+        references (the first one, for polymorphic lookups). Fields that
+        cannot be described stay strings.
+        """
+        describes: Dict[str, Dict[str, Dict]] = {}
+
+        def describe(name: str) -> Dict[str, Dict]:
+            if name not in describes:
+                try:
+                    fields = getattr(self.sf, name).describe()["fields"]
+                except SalesforceError:
+                    logger.warning("Could not describe %s; its Bulk API fields stay strings", name)
+                    fields = []
+                describes[name] = {field["name"].lower(): field for field in fields}
+                describes[name].update(
+                    {
+                        f"{field['relationshipName'].lower()}.": field
+                        for field in fields
+                        if field.get("relationshipName") and field.get("referenceTo")
+                    }
+                )
+            return describes[name]
+
+        converters = {}
+        for path in fields:
+            name, field = sobject, None
+            *relationships, leaf = path.split(".")
+            for relationship in relationships:
+                reference = describe(name).get(f"{relationship.lower()}.")
+                if reference is None:
+                    break
+                name = reference["referenceTo"][0]
+            else:
+                field = describe(name).get(leaf.lower())
+            converters[path] = _BULK_TYPES.get(field["type"] if field else None, str)
+        return converters
+
+
+class SObjectCollectionExecutor:
+    """Creates and updates records through sObject Collections requests.
+
+    Records are sent in requests of up to 200, so N writes cost N/200 API
+    calls instead of N. With ``all_or_none`` off, each record succeeds or
+    fails on its own; results come back one per input record, in order, as
+    ``{"id", "success", "errors"}`` dicts. A request that fails as a whole
+    marks every record in it as failed with the request's error.
+    """
+
+    def __init__(self, sf, batch_size: int = MAX_COLLECTION_SIZE, all_or_none: bool = False) -> None:
+        self.sf = sf
+        self.batch_size = min(batch_size, MAX_COLLECTION_SIZE)
+        self.all_or_none = all_or_none
+        self.api_calls = 0
+
+    def create(self, sobject: str, records: List[Dict]) -> List[Dict]:
+        return self._execute("POST", sobject, records)
+
+    def update(self, sobject: str, records: List[Dict]) -> List[Dict]:
+        """Update records; each needs its ``Id``."""
+        missing = [i for i, record in enumerate(records) if not record.get("Id")]
+        if missing:
+            raise ValueError(f"Records at positions {missing} have no Id to update.")
+        return self._execute("PATCH", sobject, records)
+
+    def _execute(self, method: str, sobject: str, records: List[Dict]) -> List[Dict]:
+        results = []
+        for start in range(0, len(records), self.batch_size):
+            chunk = records[start : start + self.batch_size]
+            body = {
+                "allOrNone": self.all_or_none,
+                "records": [{"attributes": {"type": sobject}, **record} for record in chunk],
+            }
+            self.api_calls += 1
+            try:
+                replies = self.sf.restful("composite/sobjects", method=method, data=json.dumps(body))
+            except SalesforceError as error:
+                logger.warning("sObject Collections %s of %d %s failed: %s", method, len(chunk), sobject, error)
+                replies = [
+                    {"id": record.get("Id"), "success": False, "errors": [{"message": str(error)}]}
+                    for record in chunk
+                ]
+            results.extend(
+                {
+                    "id": reply.get("id") or record.get("Id"),
+                    "success": bool(reply.get("success")),
+                    "errors": reply.get("errors") or [],
+                }
+                for record, reply in zip(chunk, replies)
+            )
+        return results
@@ -0,0 +1,730 @@
+import contextlib
+import contextvars
+import logging
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dateutil import parser as date_parser
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NUMBER = "number"
+BOOL = "bool"
+DATE = "date"
+STRING = "string"
+EMPTY = "empty"
+
+_A1_RE = re.compile(
+    r"^(?:(?P<sheet>'(?:[^']|'')+'|[^!]+)!)?"
+    r"(?P<start_col>[A-Za-z]*)(?P<start_row>\d*)"
+    r"(?::(?P<end_col>[A-Za-z]*)(?P<end_row>\d*))?$"
+)
+_NUMBER_RE = re.compile(r"^\(?[-+]?[$€£¥₦]?\s*(\d{1,3}(,\d{3})+|\d*)(\.\d+)?([eE][-+]?\d+)?\s*%?\)?$")
+_DATE_RE = re.compile(
+    r"\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b",
+    re.IGNORECASE,
+)
+
+
+def column_to_index(column: str) -> int:
+    index = 0
+    for char in column.upper():
+        index = index * 26 + ord(char) - ord("A") + 1
+    return index - 1
+
+
+def index_to_column(index: int) -> str:
+    column = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        column = chr(ord("A") + remainder) + column
+    return column
+
+
+class A1Range:
+    """A parsed A1 range; rows are 1-based, columns 0-based, open ends are None."""
+
+    def __init__(self, sheet, start_col, start_row, end_col, end_row) -> None:
+        self.sheet = sheet
+        self.start_col = start_col
+        self.start_row = start_row
+        self.end_col = end_col
+        self.end_row = end_row
+
+    @classmethod
+    def parse(cls, range_name: str) -> "A1Range":
+        match = _A1_RE.match(range_name.strip())
+        if (
+            match is None
+            or len(match["start_col"]) > 3
+            or (not match["start_col"] and not match["start_row"])
+        ):
+            if "!" in range_name:
+                raise ValueError(f"Invalid A1 range: {range_name}")
+            # No cell reference at all: the whole input is a sheet name.
+            return cls(range_name.strip(), 0, 1, None, None)
+        start_col = column_to_index(match["start_col"]) if match["start_col"] else 0
+        start_row = int(match["start_row"]) if match["start_row"] else 1
+        if match["end_col"] is None and match["end_row"] is None:
+            # A single cell, e.g. "B2".
+            end_col = start_col if match["start_col"] else None
+            end_row = start_row if match["start_row"] else None
+        else:
+            end_col = column_to_index(match["end_col"]) if match["end_col"] else None
+            end_row = int(match["end_row"]) if match["end_row"] else None
+        return cls(match["sheet"], start_col, start_row, end_col, end_row)
+
+    def to_a1(self) -> str:
+        if self.sheet and self.end_col is None and self.end_row is None and self.start_row == 1:
+            # The whole sheet, as parsed from a bare sheet name
+            return self.sheet
+        if self.end_col is None:
+            # Open-ended columns can only be expressed as a row range ("5:100");
+            # readers trim the columns left of start_col themselves.
+            a1 = f"{self.start_row}:{self.end_row}"
+        else:
+            start = f"{index_to_column(self.start_col)}{self.start_row}"
+            end = index_to_column(self.end_col) + ("" if self.end_row is None else str(self.end_row))
+            a1 = f"{start}:{end}"
+        return f"{self.sheet}!{a1}" if self.sheet else a1
+
+    def rows(self, start_row: int, end_row: int) -> "A1Range":
+        return A1Range(self.sheet, self.start_col, start_row, self.end_col, end_row)
+
+    def __repr__(self) -> str:
+        return f"A1Range({self.to_a1()})"
+
+
+def _parse_number(value: str) -> Optional[float]:
+    text = value.strip()
+    if not text or not _NUMBER_RE.match(text) or not any(c.isdigit() for c in text):
+        return None
+    negative = text.startswith("(") and text.endswith(")")
+    percent = text.endswith("%") or text.endswith("%)")
+    cleaned = re.sub(r"[()$€£¥₦,%\s]", "", text)
+    try:
+        number = float(cleaned)
+    except ValueError:
+        return None
+    if percent:
+        number /= 100
+    return -number if negative else number
+
+
+def factorize(values: Sequence[Any]) -> Tuple[List[Any], np.ndarray]:
+    """Return the distinct values in first-seen order and each value's index into them.
+
+    A dict pass is much faster than ``np.unique`` on object arrays, which has
+    to sort every string.
+    """
+    lookup: Dict[Any, int] = {}
+    codes = np.fromiter(
+        (lookup.setdefault(value, len(lookup)) for value in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+    return list(lookup), codes
+
+
+def _parse_dates(values: np.ndarray) -> Optional[np.ndarray]:
+    """Parse a column of date strings, or return None if any value is not a date."""
+    uniques, inverse = factorize(values)
+    parsed = np.empty(len(uniques), dtype="datetime64[s]")
+    for i, value in enumerate(uniques):
+        if value == "":
+            parsed[i] = np.datetime64("NaT")
+            continue
+        if not _DATE_RE.search(value):
+            return None
+        try:
+            parsed[i] = np.datetime64(date_parser.parse(value).replace(tzinfo=None), "s")
+        except (ValueError, OverflowError):
+            return None
+    return parsed[inverse]
+
+
+def _convert_column(values: List[Any], value_render_option: str) -> Tuple[str, np.ndarray]:
+    """Infer a column's type and convert it to a typed array."""
+    non_empty = [value for value in values if value != "" and value is not None]
+    if not non_empty:
+        return EMPTY, np.full(len(values), np.nan)
+
+    if all(isinstance(value, bool) for value in non_empty):
+        return BOOL, np.array(
+            [np.nan if value in ("", None) else float(value) for value in values]
+        )
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in non_empty):
+        return NUMBER, np.array(
+            [np.nan if value in ("", None) else value for value in values], dtype=np.float64
+        )
+
+    strings = np.array(["" if value is None else str(value) for value in values], dtype=object)
+    if value_render_option == "FORMATTED_VALUE":
+        # Numbers arrive formatted, e.g. "1,234.50", "$12" or "45%". With
+        # UNFORMATTED_VALUE a numeric-looking string is a genuine text cell.
+        numbers = [_parse_number(value) if value else np.nan for value in strings]
+        if all(number is not None for number in numbers):
+            return NUMBER, np.array(numbers, dtype=np.float64)
+    # With dateTimeRenderOption=FORMATTED_STRING dates arrive as text.
+    dates = _parse_dates(strings)
+    if dates is not None:
+        return DATE, dates
+    return STRING, strings
+
+
+def _to_strings(kind: str, array: np.ndarray) -> np.ndarray:
+    if kind == STRING:
+        return array
+    if kind == DATE:
+        return np.array(["" if np.isnat(v) else str(v) for v in array], dtype=object)
+    return np.array(["" if np.isnan(v) else f"{v:g}" for v in array], dtype=object)
+
+
+def _merge_blocks(blocks: List[Tuple[str, np.ndarray]]) -> Tuple[str, np.ndarray]:
+    kinds = {kind for kind, _ in blocks} - {EMPTY}
+    if not kinds:
+        return EMPTY, np.concatenate([array for _, array in blocks])
+    if len(kinds) == 1:
+        kind = kinds.pop()
+        if kind == STRING:
+            empty = lambda n: np.full(n, "", dtype=object)
+        elif kind == DATE:
+            empty = lambda n: np.full(n, np.datetime64("NaT"), dtype="datetime64[s]")
+        else:
+            empty = lambda n: np.full(n, np.nan)
+        return kind, np.concatenate(
+            [empty(len(array)) if k == EMPTY else array for k, array in blocks]
+        )
+    if kinds <= {NUMBER, BOOL}:
+        return NUMBER, np.concatenate([array for _, array in blocks])
+    # Mixed types across blocks fall back to strings.
+    return STRING, np.concatenate(
+        [np.full(len(a), "", dtype=object) if k == EMPTY else _to_strings(k, a) for k, a in blocks]
+    )
+
+
+class ColumnarTable:
+    """Typed columns of a sheet range: float64 numbers, datetime64 dates, object strings."""
+
+    def __init__(self, header: List[str], kinds: List[str], columns: List[np.ndarray], start_col: int = 0) -> None:
+        self.header = header
+        self.kinds = kinds
+        self.columns = columns
+        self.start_col = start_col
+        self._codes: Dict[int, Tuple[np.ndarray, int]] = {}
+
+    @classmethod
+    def from_blocks(
+        cls,
+        blocks: Sequence[List[List[Any]]],
+        header: bool = True,
+        value_render_option: str = "UNFORMATTED_VALUE",
+        start_col: int = 0,
+    ) -> "ColumnarTable":
+        names = None
+        width = 0
+        typed_blocks: List[List[Tuple[str, np.ndarray]]] = []
+        for rows in blocks:
+            if header and names is None and rows:
+                names = [str(name) for name in rows[0]]
+                rows = rows[1:]
+            if not rows:
+                continue
+            width = max(width, max(len(row) for row in rows))
+            typed_blocks.append([
+                _convert_column(
+                    [row[i] if i < len(row) else "" for row in rows], value_render_option
+                )
+                for i in range(width)
+            ])
+
+        names = names or []
+        width = max(width, len(names))
+        names += [index_to_column(start_col + i) for i in range(len(names), width)]
+        kinds, columns = [], []
+        for i in range(width):
+            parts = [
+                block[i] if i < len(block) else (EMPTY, np.full(len(block[0][1]), np.nan))
+                for block in typed_blocks
+            ]
+            kind, column = _merge_blocks(parts) if parts else (EMPTY, np.empty(0))
+            kinds.append(kind)
+            columns.append(column)
+        return cls(names, kinds, columns, start_col=start_col)
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def column_index(self, column: str) -> int:
+        """Find a column by header name (case-insensitive) or by its letter."""
+        lowered = [name.lower() for name in self.header]
+        if column.lower() in lowered:
+            return lowered.index(column.lower())
+        if column.isalpha():
+            index = column_to_index(column) - self.start_col
+            if 0 <= index < len(self.columns):
+                return index
+        raise KeyError(f"Unknown column {column!r}. Columns: {', '.join(self.header)}")
+
+    def column(self, column: str) -> np.ndarray:
+        return self.columns[self.column_index(column)]
+
+    def codes(self, index: int) -> Tuple[np.ndarray, int]:
+        """Dense integer codes for a column, ordered like its sorted values."""
+        if index not in self._codes:
+            kind, data = self.kinds[index], self.columns[index]
+            if kind == STRING:
+                uniques, codes = factorize(data)
+                rank = np.empty(len(uniques), dtype=np.int64)
+                rank[np.argsort(np.array(uniques, dtype=str), kind="stable")] = np.arange(len(uniques))
+                self._codes[index] = (rank[codes], len(uniques))
+            else:
+                if kind == DATE:
+                    data = data.astype("int64")
+                uniques, codes = np.unique(data, return_inverse=True)
+                self._codes[index] = (codes.reshape(-1), len(uniques))
+        return self._codes[index]
+
+    def filter(self, mask: np.ndarray) -> "ColumnarTable":
+        return ColumnarTable(
+            self.header, self.kinds, [column[mask] for column in self.columns], self.start_col
+        )
+
+    def iter_rows(self, mask: np.ndarray = None) -> Iterator[Dict[str, Any]]:
+        indices = range(len(self)) if mask is None else np.flatnonzero(mask)
+        for i in indices:
+            yield {name: _python_value(kind, column[i]) for name, kind, column in zip(self.header, self.kinds, self.columns)}
+
+    def mask(self, column: str, op: str, value: Any) -> np.ndarray:
+        index = self.column_index(column)
+        kind, data = self.kinds[index], self.columns[index]
+        if op == "contains":
+            needle = str(value).lower()
+            return np.array([needle in str(v).lower() for v in _to_strings(kind, data)], dtype=bool)
+        if kind in (NUMBER, BOOL, EMPTY):
+            if isinstance(value, str) and value.lower() in ("true", "false"):
+                value = float(value.lower() == "true")
+            value = float(value) if not isinstance(value, (int, float)) else value
+        elif kind == DATE:
+            value = np.datetime64(date_parser.parse(str(value)).replace(tzinfo=None), "s")
+        else:
+            data = np.array([str(v).lower() for v in data], dtype=object)
+            value = str(value).lower()
+        operations = {
+            "==": np.equal,
+            "!=": np.not_equal,
+            ">": np.greater,
+            ">=": np.greater_equal,
+            "<": np.less,
+            "<=": np.less_equal,
+        }
+        if op not in operations:
+            raise ValueError(f"Unsupported operator {op!r}")
+        return np.asarray(operations[op](data, value), dtype=bool)
+
+    def aggregate(self, column: str, operation: str, mask: np.ndarray = None) -> Any:
+        index = self.column_index(column)
+        kind, data = self.kinds[index], self.columns[index]
+        if mask is not None:
+            data = data[mask]
+        if operation == "count":
+            if kind == STRING:
+                return int(np.count_nonzero(data != ""))
+            if kind == DATE:
+                return int(np.count_nonzero(~np.isnat(data)))
+            return int(np.count_nonzero(~np.isnan(data)))
+        if operation == "count_distinct":
+            strings = _to_strings(kind, data)
+            return int(len(np.unique(strings[strings != ""])))
+        if kind == DATE and operation in ("min", "max"):
+            valid = data[~np.isnat(data)]
+            return str(getattr(valid, operation)()) if len(valid) else None
+        if kind not in (NUMBER, BOOL):
+            raise ValueError(f"Column {self.header[index]!r} is not numeric")
+        functions = {
+            "sum": np.nansum,
+            "mean": np.nanmean,
+            "median": np.nanmedian,
+            "min": np.nanmin,
+            "max": np.nanmax,
+            "std": np.nanstd,
+        }
+        if operation not in functions:
+            raise ValueError(f"Unsupported operation {operation!r}")
+        if np.all(np.isnan(data)):
+            return None
+        return float(functions[operation](data))
+
+    def describe(self, preview_rows: int = 5) -> Dict:
+        return {
+            "rows": len(self),
+            "columns": [
+                {"name": name, "type": kind} for name, kind in zip(self.header, self.kinds)
+            ],
+            "preview": [list(row.values()) for _, row in zip(range(preview_rows), self.iter_rows())],
+        }
+
+
+def _python_value(kind: str, value: Any) -> Any:
+    if kind == DATE:
+        return None if np.isnat(value) else str(value)
+    if kind in (NUMBER, BOOL, EMPTY):
+        if np.isnan(value):
+            return None
+        if kind == BOOL:
+            return bool(value)
+        return int(value) if float(value).is_integer() else float(value)
+    return value
+
+
+class SheetReader:
+    """Pages through large ranges in row blocks instead of one huge ``values.get``."""
+
+    def __init__(
+        self,
+        service,
+        spreadsheet_id: str,
+        value_render_option: str = "UNFORMATTED_VALUE",
+        date_time_render_option: str = "FORMATTED_STRING",
+        block_rows: int = None,
+        buffer: "SheetWriteBuffer" = None,
+    ) -> None:
+        self.service = service
+        self.spreadsheet_id = spreadsheet_id
+        self.value_render_option = value_render_option
+        self.date_time_render_option = date_time_render_option
+        self.block_rows = block_rows or settings.SHEETS_READ_BLOCK_ROWS
+        # Pending writes are overlaid on what the API returns (read-your-writes).
+        self.buffer = buffer
+
+    def _get(self, a1: A1Range) -> List[List[Any]]:
+        rows = (
+            self.service.spreadsheets()
+            .values()
+            .get(
+                spreadsheetId=self.spreadsheet_id,
+                range=a1.to_a1(),
+                valueRenderOption=self.value_render_option,
+                dateTimeRenderOption=self.date_time_render_option,
+            )
+            .execute()
+            .get("values", [])
+        )
+        if a1.end_col is None and a1.start_col:
+            rows = [row[a1.start_col :] for row in rows]
+        return rows
+
+    def iter_blocks(self, range_name: str) -> Iterator[List[List[Any]]]:
+        a1 = A1Range.parse(range_name)
+        if self.buffer is not None and self.buffer.requires_flush(a1.sheet):
+            self.buffer.flush()
+        last_pending = self.buffer.last_row(a1.sheet) if self.buffer is not None else 0
+        row = a1.start_row
+        while a1.end_row is None or row <= a1.end_row:
+            end = row + self.block_rows - 1
+            if a1.end_row is not None:
+                end = min(end, a1.end_row)
+            block = a1.rows(row, end)
+            rows = self._get(block)
+            exhausted = len(rows) < end - row + 1
+            if self.buffer is not None:
+                rows = self.buffer.overlay(block, rows, self.value_render_option)
+            if rows:
+                yield rows
+            # Trailing empty rows are omitted, so a short block means the data ended.
+            if exhausted and end >= last_pending:
+                return
+            row = end + 1
+
+    def iter_rows(self, range_name: str) -> Iterator[List[Any]]:
+        for rows in self.iter_blocks(range_name):
+            yield from rows
+
+    def read(self, range_name: str, header: bool = True) -> ColumnarTable:
+        return ColumnarTable.from_blocks(
+            self.iter_blocks(range_name),
+            header=header,
+            value_render_option=self.value_render_option,
+            start_col=A1Range.parse(range_name).start_col,
+        )
+
+
+def _sheet_key(sheet: Optional[str]) -> Optional[str]:
+    if sheet and sheet.startswith("'") and sheet.endswith("'"):
+        return sheet[1:-1].replace("''", "'")
+    return sheet
+
+
+def _quote_sheet(sheet: Optional[str]) -> Optional[str]:
+    if sheet is None or re.fullmatch(r"[A-Za-z0-9_]+", sheet):
+        return sheet
+    return "'" + sheet.replace("'", "''") + "'"
+
+
+def _merge_rectangles(cells: Dict[int, Dict[int, Tuple[Any, str]]]) -> List[Tuple[str, int, int, int, int]]:
+    """Cover the written cells of one sheet with as few rectangles as possible.
+
+    Each row is split into runs of adjacent columns sharing a value input
+    option, and runs spanning the same columns on consecutive rows are stacked.
+    Returns ``(option, start_row, end_row, start_col, end_col)`` tuples.
+    """
+    open_rects: Dict[Tuple[str, int, int], List[int]] = {}
+    rectangles = []
+    for row in sorted(cells):
+        columns = cells[row]
+        runs = []
+        for col in sorted(columns):
+            option = columns[col][1]
+            if runs and runs[-1][2] == col - 1 and runs[-1][0] == option:
+                runs[-1][2] = col
+            else:
+                runs.append([option, col, col])
+        current = {}
+        for option, start_col, end_col in runs:
+            key = (option, start_col, end_col)
+            rect = open_rects.get(key)
+            if rect is not None and rect[1] == row - 1:
+                rect[1] = row
+            else:
+                rect = [row, row]
+                rectangles.append((key, rect))
+            current[key] = rect
+        open_rects = current
+    return [
+        (option, rect[0], rect[1], start_col, end_col)
+        for (option, start_col, end_col), rect in rectangles
+    ]
+
+
+class SheetWriteBuffer:
+    """Collects writes to one spreadsheet and sends them in as few calls as possible.
+
+    Range writes are kept as a sparse cell map, so adjacent and overlapping
+    writes collapse (the last write to a cell wins) and are flushed as one
+    ``values.batchUpdate`` of merged rectangles. Consecutive appends to the same
+    range are concatenated into one ``values.append`` and structural requests
+    into one ``spreadsheets.batchUpdate``. Operations of different kinds are
+    flushed in the order they were made.
+    """
+
+    VALUES = "values"
+    APPEND = "append"
+    REQUESTS = "requests"
+
+    def __init__(self, service, spreadsheet_id: str, max_cells: int = None) -> None:
+        self.service = service
+        self.spreadsheet_id = spreadsheet_id
+        self.max_cells = max_cells or settings.SHEETS_WRITE_BUFFER_MAX_CELLS
+        self.api_calls = 0
+        self._segments: List[List] = []
+        self._pending_cells = 0
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    @property
+    def pending_cells(self) -> int:
+        return self._pending_cells
+
+    def _segment(self, kind: str, factory):
+        if not self._segments or self._segments[-1][0] != kind:
+            self._segments.append([kind, factory()])
+        return self._segments[-1][1]
+
+    def write(self, range_name: str, values: List[List[Any]], value_input_option: str = "USER_ENTERED"):
+        """Queue ``values`` (rows) to be written starting at the top-left of ``range_name``."""
+        a1 = A1Range.parse(range_name)
+        sheets = self._segment(self.VALUES, lambda: defaultdict(lambda: defaultdict(dict)))
+        cells = sheets[_sheet_key(a1.sheet)]
+        for i, row in enumerate(values):
+            columns = cells[a1.start_row + i]
+            for j, value in enumerate(row):
+                columns[a1.start_col + j] = (value, value_input_option)
+                self._pending_cells += 1
+        self._maybe_flush()
+
+    def append(self, range_name: str, values: List[List[Any]], value_input_option: str = "USER_ENTERED"):
+        """Queue rows to be appended after the table found in ``range_name``."""
+        appends = self._segment(self.APPEND, list)
+        if appends and appends[-1][0] == range_name and appends[-1][1] == value_input_option:
+            appends[-1][2].extend(values)
+        else:
+            appends.append((range_name, value_input_option, list(values)))
+        self._pending_cells += sum(len(row) for row in values)
+        self._maybe_flush()
+
+    def request(self, *requests: Dict):
+        """Queue ``spreadsheets.batchUpdate`` requests."""
+        self._segment(self.REQUESTS, list).extend(requests)
+
+    def _maybe_flush(self):
+        if self._pending_cells >= self.max_cells:
+            self.flush()
+
+    def requires_flush(self, sheet: Optional[str]) -> bool:
+        """Whether pending writes must be sent before ``sheet`` can be read.
+
+        Cell writes can be overlaid on a read; appends and structural requests
+        change where rows land, so those are flushed first. So is a read whose
+        sheet is named differently from pending writes (e.g. qualified vs not),
+        since it may be the same sheet.
+        """
+        key = _sheet_key(sheet)
+        for kind, payload in self._segments:
+            if kind != self.VALUES:
+                return True
+            for written in payload:
+                if written != key and (written is None or key is None):
+                    return True
+        return False
+
+    def _cells(self, sheet: Optional[str]) -> Dict[int, Dict[int, Tuple[Any, str]]]:
+        key = _sheet_key(sheet)
+        for kind, payload in self._segments:
+            if kind == self.VALUES and key in payload:
+                return payload[key]
+        return {}
+
+    def last_row(self, sheet: Optional[str]) -> int:
+        cells = self._cells(sheet)
+        return max(cells) if cells else 0
+
+    def overlay(self, a1: A1Range, rows: List[List[Any]], value_render_option: str) -> List[List[Any]]:
+        """Apply pending cell writes inside ``a1`` to rows returned by the API."""
+        cells = self._cells(a1.sheet)
+        if not cells:
+            return rows
+        rows = [list(row) for row in rows]
+        for row in range(a1.start_row, a1.end_row + 1):
+            for col, (value, option) in cells.get(row, {}).items():
+                if value is None or col < a1.start_col or (a1.end_col is not None and col > a1.end_col):
+                    continue
+                if option == "USER_ENTERED" and value_render_option != "FORMATTED_VALUE" and isinstance(value, str):
+                    # The sheet will parse user-entered numbers; formulas stay as text.
+                    number = None if value.startswith("=") else _parse_number(value)
+                    value = value if number is None else number
+                i, j = row - a1.start_row, col - a1.start_col
+                while len(rows) <= i:
+                    rows.append([])
+                if len(rows[i]) <= j:
+                    rows[i].extend([""] * (j + 1 - len(rows[i])))
+                rows[i][j] = value
+        return rows
+
+    def flush(self) -> Dict:
+        """Send every pending write and return the API responses.
+
+        Writes leave the buffer once sent, so when a call fails the writes
+        after it stay queued for the next flush.
+        """
+        result = {"api_calls": 0, "updated_cells": 0, "appended_rows": 0, "replies": []}
+        try:
+            while self._segments:
+                kind, payload = self._segments[0]
+                if kind == self.VALUES:
+                    self._flush_values(payload, result)
+                elif kind == self.APPEND:
+                    self._flush_appends(payload, result)
+                else:
+                    self._flush_requests(payload, result)
+                self._segments.pop(0)
+            self._pending_cells = 0
+        finally:
+            self.api_calls += result["api_calls"]
+        if result["api_calls"]:
+            logger.info(
+                "Flushed writes to %s in %d API calls", self.spreadsheet_id, result["api_calls"]
+            )
+        return result
+
+    def _flush_values(self, sheets, result: Dict):
+        data: Dict[str, List[Dict]] = defaultdict(list)
+        for sheet, cells in sheets.items():
+            for option, start_row, end_row, start_col, end_col in _merge_rectangles(cells):
+                a1 = A1Range(_quote_sheet(sheet), start_col, start_row, end_col, end_row)
+                values = [
+                    [cells[row][col][0] for col in range(start_col, end_col + 1)]
+                    for row in range(start_row, end_row + 1)
+                ]
+                data[option].append({"range": a1.to_a1(), "values": values})
+        for option, ranges in data.items():
+            response = (
+                self.service.spreadsheets()
+                .values()
+                .batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={"valueInputOption": option, "data": ranges},
+                )
+                .execute()
+            )
+            result["api_calls"] += 1
+            result["updated_cells"] += response.get("totalUpdatedCells", 0)
+
+    def _flush_appends(self, appends, result: Dict):
+        # Appends are not idempotent: drop each one as soon as it is sent
+        while appends:
+            range_name, option, values = appends[0]
+            response = (
+                self.service.spreadsheets()
+                .values()
+                .append(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=range_name,
+                    valueInputOption=option,
+                    body={"values": values},
+                )
+                .execute()
+            )
+            appends.pop(0)
+            result["api_calls"] += 1
+            result["appended_rows"] += response.get("updates", {}).get("updatedRows", 0)
+
+    def _flush_requests(self, requests, result: Dict):
+        response = (
+            self.service.spreadsheets()
+            .batchUpdate(spreadsheetId=self.spreadsheet_id, body={"requests": requests})
+            .execute()
+        )
+        result["api_calls"] += 1
+        result["replies"].extend(response.get("replies", []))
+
+
+# Toolkits holding Sheets writes until the current agent turn ends, see sheet_write_turn.
+_turn_writers: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("sheet_turn_writers", default=None)
+
+
+def hold_for_turn(writer) -> bool:
+    """Register ``writer`` to be flushed when the current turn ends; False outside a turn."""
+    writers = _turn_writers.get()
+    if writers is None:
+        return False
+    if not any(held is writer for held in writers):
+        writers.append(writer)
+    return True
+
+
+@contextlib.contextmanager
+def sheet_write_turn():
+    """Buffer the Sheets writes of an agent turn and send them when it ends.
+
+    Inside the block, write tools of a ``GoogleSheetTools`` queue their writes
+    instead of sending them, so the writes of every tool call in the turn are
+    batched together. On exit each toolkit with queued writes is flushed, even
+    when the turn failed, since the tool calls that made them completed. A
+    flush that fails is logged and its writes stay queued.
+    """
+    token = _turn_writers.set([])
+    try:
+        yield
+    finally:
+        writers = _turn_writers.get()
+        _turn_writers.reset(token)
+        for writer in writers:
+            try:
+                writer.flush()
+            except Exception:
+                logger.exception("Flushing the Sheets writes of an agent turn failed")
@@ -4,9 +4,9 @@ import email
 from enum import Enum
 import io
 import uuid
-from httplib2 import Http
 from typing import Any, Dict, List, Optional, Type, Union
 from django.conf import settings
+from django.utils import timezone
 from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -21,7 +21,30 @@ from langchain_core.callbacks import CallbackManagerForToolRun
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.http import MediaIoBaseDownload
+
+from integrations.models import Integration
+
+from ..models import FormSyncState, FormWatch
+from ..tasks import index_documents as index_documents_task
+from ..tasks import schedule_form_watch_renewal
+from .batch import DriveBatchExecutor
+from .extraction import DocumentTextExtractor
+from .form_events import FormWatchManager
+from .forms import FormResponseIngestor, count_answers, find_question
+from .knowledge import KnowledgeMirror
+from .aggregation import group_by, pivot
+from .retrieval import DocumentIndexer
+from .salesforce import (
+    CASE_FIELDS,
+    SalesforceQueryExecutor,
+    SObjectCollectionExecutor,
+    escape_soql,
+    record_url,
+    salesforce_client,
+)
+from .sheets import ColumnarTable, SheetReader, SheetWriteBuffer, hold_for_turn
+from .uploads import ResumableUploader
 
 
 class Resource(str, Enum):
@@ -438,14 +461,13 @@ class GoogleCalenderTools:
 class GoogleDocTools:
     def __init__(self, creds: Credentials) -> None:
         self.service = build("docs", "v1", credentials=creds)
+        self.extractor = DocumentTextExtractor(creds, docs_service=self.service)
 
     @tool
-    def retrieve_document(self, document_id: int):
-        """Retrieve a document in google doc"""
-        # Retrieve the documents contents from the Docs service.
-        document = self.service.documents().get(documentId=document_id).execute()
-        # to_json = json.dumps(document, indent=4, sort_keys=True)
-        return document
+    def retrieve_document(self, document_id: str):
+        """Retrieve the plain text content of a document in google doc"""
+        # Unchanged documents are served from the extraction cache.
+        return self.extractor.extract(document_id)
     
     def get_tools(self) -> List:
         """Get the tools in the toolkit."""
@@ -455,8 +477,41 @@ class GoogleDocTools:
 
 
 class GoogleDriveTools:
-    def __init__(self, creds: Credentials) -> None:
+    def __init__(self, creds: Credentials, integration: Integration = None) -> None:
         self.service = build("drive", "v3", credentials=creds)
+        self.uploader = ResumableUploader(creds, integration=integration)
+        self.batch = DriveBatchExecutor(self.service)
+        self.extractor = DocumentTextExtractor(creds, drive_service=self.service)
+        self.indexer = (
+            DocumentIndexer(integration, creds=creds, drive_service=self.service)
+            if integration is not None
+            else None
+        )
+
+    @tool
+    def search_documents(self, query: str, k: int = 5):
+        """Search the content of the user's indexed Drive files and Docs
+        Args:
+            query: What to look for, in natural language
+            k: Number of matching passages to return
+        Returns : The best matching passages with their file IDs
+        """
+
+        if self.indexer is None:
+            return "Document search is not available for this agent."
+        return self.indexer.search(query, k=k)
+
+    @tool
+    def index_documents(self, file_ids: List[str]):
+        """Add Drive files or Docs to the searchable document index
+        Args:
+            file_ids: IDs of the files to index
+        """
+
+        if self.indexer is None:
+            return "Document search is not available for this agent."
+        index_documents_task.send(self.indexer.integration.id, file_ids)
+        return f"Indexing {len(file_ids)} files."
 
     @tool
     def get_file_list(self, page_size=10):
@@ -638,37 +693,38 @@ class GoogleDriveTools:
         return response.get("files")
 
     @tool
-    def upload_to_folder(self, file_name: str, mimetype: str, folder_id=None):
-        """Insert a file in the application data folder and prints file Id.
+    def upload_to_folder(self, file_name: str, mimetype: str = None, folder_id=None):
+        """Upload a file to a Drive folder (the application data folder by default).
+        Interrupted uploads resume from the last committed chunk.
         Args:
             file_name: file name
-            mimetype: file mimetype
+            mimetype: file mimetype, guessed from the file name when omitted
             folder_id: Id of the folder
 
-        Returns : ID's of the inserted files
+        Returns : ID of the inserted file
         """
 
         try:
-            # pylint: disable=maybe-no-member
-            if folder_id:
-                parent_folder = [folder_id]
-            else:
-                parent_folder = ["appDataFolder"]
-
-            file_metadata = {"name": file_name, "parents": parent_folder}
-            media = MediaFileUpload(file_name, mimetype=mimetype, resumable=True)
-            file = (
-                self.service.files()
-                .create(body=file_metadata, media_body=media, fields="id")
-                .execute()
-            )
-            print(f'File ID: {file.get("id")}')
-            return file.get("id")
+            result = self.uploader.upload(file_name, mimetype=mimetype, folder_id=folder_id)
+            print(f'File ID: {result.get("file_id")}')
+            return result.get("file_id")
 
         except HttpError as error:
             print(f"An error occurred: {error}")
             return None
 
+    @tool
+    def upload_files_to_folder(self, file_names: List[str], folder_id=None):
+        """Upload several files to a Drive folder in parallel.
+        Args:
+            file_names: names of the files to upload
+            folder_id: Id of the folder
+
+        Returns : One entry per file with its ID, status and throughput (bytes/s)
+        """
+
+        return self.uploader.upload_many(file_names, folder_id=folder_id)
+
     @tool
     def share_file(self, real_file_id, real_user, real_domain):
         """Batch permission modification.
@@ -680,47 +736,35 @@ class GoogleDriveTools:
         """
 
         try:
-            # create drive api client
-            ids = []
-            file_id = real_file_id
-
-            def callback(request_id, response, exception):
-                if exception:
-                    # Handle error
-                    print(exception)
-                else:
-                    print(f"Request_Id: {request_id}")
-                    print(f'Permission Id: {response.get("id")}')
-                    ids.append(response.get("id"))
-
-            batch = self.service.new_batch_http_request(callback=callback)
             user_permission = {
                 "type": "user",
                 "role": "writer",
-                "emailAddress": "user@example.com",
+                "emailAddress": real_user,
             }
-            user_permission["emailAddress"] = real_user
-            batch.add(
-                self.service.permissions().create(
-                    fileId=file_id,
-                    body=user_permission,
-                    fields="id",
-                )
-            )
             domain_permission = {
                 "type": "domain",
                 "role": "reader",
-                "domain": "example.com",
+                "domain": real_domain,
             }
-            domain_permission["domain"] = real_domain
-            batch.add(
-                self.service.permissions().create(
-                    fileId=file_id,
-                    body=domain_permission,
-                    fields="id",
-                )
+            result = self.batch.execute(
+                [
+                    (
+                        "user",
+                        self.service.permissions().create(
+                            fileId=real_file_id, body=user_permission, fields="id"
+                        ),
+                    ),
+                    (
+                        "domain",
+                        self.service.permissions().create(
+                            fileId=real_file_id, body=domain_permission, fields="id"
+                        ),
+                    ),
+                ]
             )
-            batch.execute()
+            for key, error in result.errors.items():
+                print(f"An error occurred sharing with {key}: {error}")
+            ids = [response.get("id") for response in result.responses.values()]
 
         except HttpError as error:
             print(f"An error occurred: {error}")
@@ -728,6 +772,44 @@ class GoogleDriveTools:
 
         return ids
 
+    @tool
+    def bulk_share_files(
+        self,
+        file_ids: List[str],
+        email_address: str = None,
+        role: str = "reader",
+        type: str = "user",
+        domain: str = None,
+    ):
+        """Share many files at once, e.g. "share these 200 files with bob@example.com".
+        Args:
+            file_ids: IDs of the files to share
+            email_address: User or group email to share with (for type "user" or "group")
+            role: "reader", "commenter" or "writer"
+            type: "user", "group", "domain" or "anyone"
+            domain: Domain to share with (for type "domain")
+        Returns : Permission IDs of the shared files and errors of the failed ones
+        """
+
+        permission = {"type": type, "role": role}
+        if email_address:
+            permission["emailAddress"] = email_address
+        if domain:
+            permission["domain"] = domain
+
+        options = {"fields": "id"}
+        if type in ("user", "group"):
+            # One notification email per file would flood the recipient.
+            options["sendNotificationEmail"] = False
+
+        result = self.batch.map(
+            lambda file_id: self.service.permissions().create(
+                fileId=file_id, body=permission, **options
+            ),
+            dict.fromkeys(file_ids),
+        )
+        return result.to_dict()
+
     @tool
     def search_file(self, mimetype="image/jpeg"):
         """Search file in drive location
@@ -796,6 +878,68 @@ class GoogleDriveTools:
             print(f"An error occurred: {error}")
             return None
 
+    def _list_file_parents(self, query: str) -> Dict[str, List[str]]:
+        parents = {}
+        page_token = None
+        while True:
+            response = (
+                self.service.files()
+                .list(
+                    q=query,
+                    spaces="drive",
+                    fields="nextPageToken, files(id, parents)",
+                    pageSize=1000,
+                    pageToken=page_token,
+                )
+                .execute()
+            )
+            for file in response.get("files", []):
+                parents[file["id"]] = file.get("parents", [])
+            page_token = response.get("nextPageToken", None)
+            if page_token is None:
+                return parents
+
+    @tool
+    def bulk_move_files(self, folder_id: str, file_ids: List[str] = None, query: str = None):
+        """Move many files into a folder, e.g. "move all matching files to Reports".
+        Args:
+            folder_id: Id of the destination folder
+            file_ids: IDs of the files to move
+            query: Drive search query selecting the files to move instead of file_ids,
+                e.g. "name contains 'invoice' and trashed = false"
+        Returns : New parent IDs of the moved files and errors of the failed ones
+        """
+
+        if query:
+            try:
+                parents = self._list_file_parents(query)
+            except HttpError as error:
+                return {"succeeded": {}, "failed": {"query": str(error)}}
+            errors = {}
+        else:
+            lookup = self.batch.map(
+                lambda file_id: self.service.files().get(fileId=file_id, fields="parents"),
+                dict.fromkeys(file_ids or []),
+            )
+            parents = {
+                file_id: response.get("parents", [])
+                for file_id, response in lookup.responses.items()
+            }
+            errors = {file_id: str(error) for file_id, error in lookup.errors.items()}
+
+        result = self.batch.map(
+            lambda file_id: self.service.files().update(
+                fileId=file_id,
+                addParents=folder_id,
+                removeParents=",".join(parents[file_id]),
+                fields="id, parents",
+            ),
+            [file_id for file_id, current in parents.items() if folder_id not in current],
+        )
+        output = result.to_dict()
+        output["failed"].update(errors)
+        return output
+
     @tool
     def export_pdf(self, real_file_id):
         """Download a Document file in PDF format.
@@ -825,6 +969,20 @@ class GoogleDriveTools:
 
         return file.getvalue()
 
+    @tool
+    def extract_text(self, file_id: str):
+        """Get the plain text content of a Doc, Sheet, Slides, PDF or text file
+        Args:
+            file_id: ID of the file
+        Returns : The file's text
+        """
+
+        try:
+            return self.extractor.extract(file_id)
+        except (HttpError, ValueError) as error:
+            print(f"An error occurred: {error}")
+            return None
+
     @tool
     def download_file(self, real_file_id):
         """Downloads a file
@@ -860,7 +1018,7 @@ class GoogleDriveTools:
         """
 
         try:
-            copied_file = {"title": "my_copy"}
+            copied_file = {"name": title}
             results = (
                 self.service.files()
                 .copy(fileId=origin_file_id, body=copied_file)
@@ -899,6 +1057,45 @@ class GoogleDriveTools:
             print(f"An error occurred: {error}")
             return None
 
+    @tool
+    def bulk_duplicate_files(self, file_ids: List[str], folder_id: str = None):
+        """Duplicate many files at once
+        Args:
+            file_ids: IDs of the files to duplicate
+            folder_id: Id of the folder to place the copies in, defaults to the originals' folder
+        Returns : IDs of the copies and errors of the failed ones
+        """
+
+        body = {"parents": [folder_id]} if folder_id else {}
+        result = self.batch.map(
+            lambda file_id: self.service.files().copy(
+                fileId=file_id, body=body, fields="id, name"
+            ),
+            dict.fromkeys(file_ids),
+        )
+        return result.to_dict()
+
+    @tool
+    def create_folders(self, names: List[str], parent_id: str = None):
+        """Create several folders at once
+        Args:
+            names: The names of the folders
+            parent_id: Id of the folder to create them in
+        Returns : Folder IDs by name and errors of the failed ones
+        """
+
+        def build_request(name):
+            file_metadata = {
+                "name": name,
+                "mimeType": "application/vnd.google-apps.folder",
+            }
+            if parent_id:
+                file_metadata["parents"] = [parent_id]
+            return self.service.files().create(body=file_metadata, fields="id")
+
+        result = self.batch.map(build_request, dict.fromkeys(names))
+        return result.to_dict()
+
     @tool
     def create_team_drive(self, name: str):
         """Create a drive for team.
@@ -992,28 +1189,89 @@ class GoogleDriveTools:
     def get_tools(self) -> List:
         """Get the tools in the toolkit."""
         return [
+            self.bulk_duplicate_files,
+            self.bulk_move_files,
+            self.bulk_share_files,
             self.create_drive,
             self.create_folder,
+            self.create_folders,
             self.download_file,
             self.create_team_drive,
             self.export_pdf,
+            self.extract_text,
             self.duplicate_file,
             self.fetch_appdata_folder,
             self.fetch_changes,
             self.get_file_list,
+            self.index_documents,
             self.list_appdata,
             self.move_file_to_folder,
             self.recover_drives,
+            self.search_documents,
             self.search_file,
             self.share_file,
-            self.upload_to_folder
+            self.upload_to_folder,
+            self.upload_files_to_folder,
         ]
 
 
 # SCOPES = ["https://www.googleapis.com/auth/drive"]
 class GoogleSheetTools:
-    def __init__(self, creds: Credentials) -> None:
+    def __init__(self, creds: Credentials, buffer_writes: bool = False) -> None:
         self.service = build("sheets", "v4", credentials=creds)
+        # Tables already read in this session, keyed by (spreadsheet_id, range_name).
+        self._tables: Dict[tuple, ColumnarTable] = {}
+        # Writes are collected per spreadsheet. Inside sheet_write_turn (every
+        # agent run) they are sent when the turn ends; otherwise when the tool
+        # call ends or, with buffer_writes, on flush() or sheet_flush_writes.
+        self.buffer_writes = buffer_writes
+        self._buffers: Dict[str, SheetWriteBuffer] = {}
+
+    def _read_table(self, spreadsheet_id, range_name, refresh=False) -> ColumnarTable:
+        key = (spreadsheet_id, range_name)
+        if refresh or key not in self._tables:
+            reader = SheetReader(
+                self.service, spreadsheet_id, buffer=self._buffers.get(spreadsheet_id)
+            )
+            self._tables[key] = reader.read(range_name)
+        return self._tables[key]
+
+    def _buffer(self, spreadsheet_id) -> SheetWriteBuffer:
+        for key in [key for key in self._tables if key[0] == spreadsheet_id]:
+            del self._tables[key]
+        if spreadsheet_id not in self._buffers:
+            self._buffers[spreadsheet_id] = SheetWriteBuffer(self.service, spreadsheet_id)
+        return self._buffers[spreadsheet_id]
+
+    def _queued(self, spreadsheet_id) -> Dict:
+        if not (self.buffer_writes or hold_for_turn(self)):
+            return self.flush(spreadsheet_id)[spreadsheet_id]
+        buffer = self._buffers[spreadsheet_id]
+        return {"queued": True, "pending_cells": buffer.pending_cells}
+
+    def flush(self, spreadsheet_id=None) -> Dict:
+        """Send buffered writes; ``sheet_write_turn`` calls this when the agent turn ends."""
+        ids = [spreadsheet_id] if spreadsheet_id else list(self._buffers)
+        return {
+            spreadsheet: self._buffers[spreadsheet].flush()
+            for spreadsheet in ids
+            if spreadsheet in self._buffers
+        }
+
+    def _summarize(self, table: ColumnarTable, range_name) -> Dict:
+        if len(table) <= settings.SHEETS_INLINE_ROWS:
+            return {
+                "range": range_name,
+                "header": table.header,
+                "values": [list(row.values()) for row in table.iter_rows()],
+            }
+        summary = table.describe(settings.SHEETS_PREVIEW_ROWS)
+        summary["range"] = range_name
+        summary["hint"] = (
+            "The range is too large to return in full. Use sheet_aggregate or "
+            "sheet_filter_rows to query it."
+        )
+        return summary
 
     @tool
     def create_sheet(self, title):
@@ -1041,7 +1299,8 @@ class GoogleSheetTools:
         self, spreadsheet_id, range_name, value_input_option, values
     ):
         """
-        Creates the batch_update the user has access to.
+        Append rows after the table in a range. Consecutive appends to a range
+        are sent as one.
 
         Args:
             spreadsheet_id: Google sheet ID
@@ -1050,78 +1309,110 @@ class GoogleSheetTools:
             values: New sheet values e.g [["F", "B"], ["C", "D"]]
         """
         try:
-            values = [
-                [
-                    # Cell values ...
-                ],
-                # Additional rows ...
-            ]
-            body = {"values": values}
-            result = (
-                self.service.spreadsheets()
-                .values()
-                .append(
-                    spreadsheetId=spreadsheet_id,
-                    range=range_name,
-                    valueInputOption=value_input_option,
-                    body=body,
-                )
-                .execute()
-            )
-            print(result)
-            print(f"{(result.get('updates').get('updatedCells'))} cells appended.")
-            return result
-
+            self._buffer(spreadsheet_id).append(range_name, values, value_input_option)
+            return self._queued(spreadsheet_id)
         except HttpError as error:
             print(f"An error occurred: {error}")
             return None
 
     @tool
     def sheet_get_values(self, spreadsheet_id, range_name):
-        """Get sheet values
+        """Get sheet values. Small ranges are returned in full; large ones as a
+        summary of their columns and types with a few preview rows.
         Args:
             spreadsheet_id: Google sheet ID
-            range_name: Sheet range name
+            range_name: Sheet range name e.g "Sheet1!A1:D", the first row is the header
         """
         try:
-            result = (
-                self.service.spreadsheets()
-                .values()
-                .get(spreadsheetId=spreadsheet_id, range=range_name)
-                .execute()
-            )
-            rows = result.get("values", [])
-            print(f"{len(rows)} rows retrieved")
-            return result
+            table = self._read_table(spreadsheet_id, range_name, refresh=True)
+            print(f"{len(table)} rows retrieved")
+            return self._summarize(table, range_name)
         except HttpError as error:
             print(f"An error occurred: {error}")
             return error
 
     @tool
-    def sheet_batch_get_values(self, spreadsheet_id, range_names="A1:C2"):
+    def sheet_batch_get_values(self, spreadsheet_id, range_names: List[str]):
         """
         Get sheet batch values
         Args:
             spreadsheet_id: Google sheet ID
-            range_names: Google sheet ranges names
+            range_names: Google sheet ranges names e.g ["Sheet1!A1:C", "Sheet2!A1:B"]
         """
         try:
-            range_names = [
-                # Range names ...
-            ]
-            result = (
-                self.service.spreadsheets()
-                .values()
-                .batchGet(spreadsheetId=spreadsheet_id, ranges=range_names)
-                .execute()
-            )
-            ranges = result.get("valueRanges", [])
-            print(f"{len(ranges)} ranges retrieved")
+            result = {}
+            for range_name in range_names:
+                table = self._read_table(spreadsheet_id, range_name, refresh=True)
+                result[range_name] = self._summarize(table, range_name)
+            print(f"{len(result)} ranges retrieved")
             return result
         except HttpError as error:
             print(f"An error occurred: {error}")
             return error
 
+    @tool
+    def sheet_aggregate(
+        self,
+        spreadsheet_id,
+        range_name,
+        column,
+        operation,
+        where_column=None,
+        where_op="==",
+        where_value=None,
+    ):
+        """
+        Compute an aggregate over a sheet column, optionally filtered by another column,
+        e.g. "sum column C where B = X". The sheet is read once and queried locally.
+        Args:
+            spreadsheet_id: Google sheet ID
+            range_name: Sheet range name e.g "Sheet1!A1:D", the first row is the header
+            column: Header name or column letter to aggregate
+            operation: One of count, count_distinct, sum, mean, median, min, max, std
+            where_column: Optional header name or column letter to filter on
+            where_op: Filter operator, one of ==, !=, >, >=, <, <=, contains
+            where_value: Value to compare where_column against
+        Returns: The aggregate and the number of rows it covers
+        """
+        try:
+            table = self._read_table(spreadsheet_id, range_name)
+            mask = None
+            if where_column is not None:
+                mask = table.mask(where_column, where_op, where_value)
+            return {
+                "column": column,
+                "operation": operation,
+                "value": table.aggregate(column, operation, mask),
+                "rows": len(table) if mask is None else int(mask.sum()),
+            }
+        except (HttpError, KeyError, ValueError) as error:
+            print(f"An error occurred: {error}")
+            return str(error)
+
+    @tool
+    def sheet_filter_rows(
+        self, spreadsheet_id, range_name, where_column, where_op, where_value, limit=20
+    ):
+        """
+        Return the sheet rows matching a condition, read locally from the sheet.
+        Args:
+            spreadsheet_id: Google sheet ID
+            range_name: Sheet range name e.g "Sheet1!A1:D", the first row is the header
+            where_column: Header name or column letter to filter on
+            where_op: Filter operator, one of ==, !=, >, >=, <, <=, contains
+            where_value: Value to compare where_column against
+            limit: Maximum number of rows to return
+        Returns: The number of matching rows and up to `limit` of them
+        """
+        try:
+            table = self._read_table(spreadsheet_id, range_name)
+            mask = table.mask(where_column, where_op, where_value)
+            rows = [row for _, row in zip(range(int(limit)), table.iter_rows(mask))]
+            return {"matches": int(mask.sum()), "rows": rows}
+        except (HttpError, KeyError, ValueError) as error:
+            print(f"An error occurred: {error}")
+            return str(error)
+
     @tool
     def sheets_batch_update(self, spreadsheet_id, title, find, replacement):
         """
@@ -1132,42 +1423,25 @@ class GoogleSheetTools:
             find: Sheet text to replace
             replacement: Replacement for "find" text
         """
-
         try:
-            requests = []
-            # Change the spreadsheet's title.
-            requests.append(
+            self._buffer(spreadsheet_id).request(
+                # Change the spreadsheet's title.
                 {
                     "updateSpreadsheetProperties": {
                         "properties": {"title": title},
                         "fields": "title",
                     }
-                }
-            )
-            # Find and replace text
-            requests.append(
+                },
+                # Find and replace text
                 {
                     "findReplace": {
                         "find": find,
                         "replacement": replacement,
                         "allSheets": True,
                     }
-                }
-            )
-            # Add additional requests (operations) ...
-
-            body = {"requests": requests}
-            response = (
-                self.service.spreadsheets()
-                .batchUpdate(spreadsheetId=spreadsheet_id, body=body)
-                .execute()
-            )
-            find_replace_response = response.get("replies")[1].get("findReplace")
-            print(
-                f"{find_replace_response.get('occurrencesChanged')} replacements made."
+                },
             )
-            return response
-
+            return self._queued(spreadsheet_id)
         except HttpError as error:
             print(f"An error occurred: {error}")
             return error
@@ -1175,161 +1449,133 @@ class GoogleSheetTools:
     @tool
     def update_values(self, spreadsheet_id, range_name, value_input_option, values):
         """
-        Update sheet values
+        Update sheet values. Reads already see the written values, even when
+        the writes are still buffered.
         Args:
             spreadsheet_id: Google sheet ID
             range_name: Sheet range name e.g "A1:C2"
             value_input_option: Sheet value input option e.g "USER_ENTERED"
-            _values: New updated values e.g [["A", "B"], ["C", "D"]]
+            values: New updated values e.g [["A", "B"], ["C", "D"]]
         """
         try:
-            values = [
-                [
-                    # Cell values ...
-                ],
-                # Additional rows ...
-            ]
-            body = {"values": values}
-            result = (
-                self.service.spreadsheets()
-                .values()
-                .update(
-                    spreadsheetId=spreadsheet_id,
-                    range=range_name,
-                    valueInputOption=value_input_option,
-                    body=body,
-                )
-                .execute()
-            )
-            print(f"{result.get('updatedCells')} cells updated.")
-            return result
+            self._buffer(spreadsheet_id).write(range_name, values, value_input_option)
+            return self._queued(spreadsheet_id)
         except HttpError as error:
             print(f"An error occurred: {error}")
             return error
 
     @tool
-    def batch_update_values(
-        self, spreadsheet_id, range_name, value_input_option, values
-    ):
+    def batch_update_values(self, spreadsheet_id, value_input_option, data: List[Dict]):
         """
         Batch update sheet values
         Args:
             spreadsheet_id: Google sheet ID
-            range_name: Sheet range name e.g "A1:C2"
             value_input_option: Sheet value input option e.g "USER_ENTERED"
-            _values: New updated values e.g [["A", "B"], ["C", "D"]]
+            data: Ranges and their values e.g [{"range": "A1:B2", "values": [["A", "B"], ["C", "D"]]}]
         """
         try:
-            # values = [
-            #     [
-            #         # Cell values ...
-            #     ],
-            #     # Additional rows
-            # ]
-            data = [
-                {"range": range_name, "values": values},
-                # Additional ranges to update ...
-            ]
-            body = {"valueInputOption": value_input_option, "data": data}
-            result = (
-                self.service.spreadsheets()
-                .values()
-                .batchUpdate(spreadsheetId=spreadsheet_id, body=body)
-                .execute()
-            )
-            print(f"{(result.get('totalUpdatedCells'))} cells updated.")
-            return result
+            buffer = self._buffer(spreadsheet_id)
+            for item in data:
+                buffer.write(item["range"], item["values"], value_input_option)
+            return self._queued(spreadsheet_id)
         except HttpError as error:
             print(f"An error occurred: {error}")
             return error
 
     @tool
-    def pivot_tables(self, spreadsheet_id):
+    def sheet_flush_writes(self, spreadsheet_id):
         """
-        Creates a pivot table from sheet
+        Send the queued writes for a spreadsheet now. Writes are otherwise sent
+        together when your turn ends; flush first when a write's outcome matters
+        to your answer, e.g. to report errors or where appended rows landed.
         Args:
             spreadsheet_id: Google sheet ID
+        Returns: The number of API calls made and cells updated
         """
         try:
-            body = {"requests": [{"addSheet": {}}, {"addSheet": {}}]}
-            batch_update_response = (
-                self.service.spreadsheets()
-                .batchUpdate(spreadsheetId=spreadsheet_id, body=body)
-                .execute()
-            )
-            source_sheet_id = (
-                batch_update_response.get("replies")[0]
-                .get("addSheet")
-                .get("properties")
-                .get("sheetId")
-            )
-            target_sheet_id = (
-                batch_update_response.get("replies")[1]
-                .get("addSheet")
-                .get("properties")
-                .get("sheetId")
-            )
-            requests = []
-            requests.append(
-                {
-                    "updateCells": {
-                        "rows": {
-                            "values": [
-                                {
-                                    "pivotTable": {
-                                        "source": {
-                                            "sheetId": source_sheet_id,
-                                            "startRowIndex": 0,
-                                            "startColumnIndex": 0,
-                                            "endRowIndex": 20,
-                                            "endColumnIndex": 7,
-                                        },
-                                        "rows": [
-                                            {
-                                                "sourceColumnOffset": 1,
-                                                "showTotals": True,
-                                                "sortOrder": "ASCENDING",
-                                            },
-                                        ],
-                                        "columns": [
-                                            {
-                                                "sourceColumnOffset": 4,
-                                                "sortOrder": "ASCENDING",
-                                                "showTotals": True,
-                                            }
-                                        ],
-                                        "values": [
-                                            {
-                                                "summarizeFunction": "COUNTA",
-                                                "sourceColumnOffset": 4,
-                                            }
-                                        ],
-                                        "valueLayout": "HORIZONTAL",
-                                    }
-                                }
-                            ]
-                        },
-                        "start": {
-                            "sheetId": target_sheet_id,
-                            "rowIndex": 0,
-                            "columnIndex": 0,
-                        },
-                        "fields": "pivotTable",
-                    }
-                }
-            )
-            body = {"requests": requests}
-            response = (
-                self.service.spreadsheets()
-                .batchUpdate(spreadsheetId=spreadsheet_id, body=body)
-                .execute()
-            )
-            return response
-
+            return self.flush(spreadsheet_id).get(spreadsheet_id, {"api_calls": 0})
         except HttpError as error:
             print(f"An error occurred: {error}")
             return error
-    
+
+    def _aggregation_result(self, spreadsheet_id, header, rows, write_to_range) -> Dict:
+        result = {"header": header, "rows": rows[: settings.SHEETS_INLINE_ROWS], "groups": len(rows)}
+        if len(rows) > settings.SHEETS_INLINE_ROWS:
+            result["hint"] = f"Only the first {settings.SHEETS_INLINE_ROWS} groups are shown."
+        if write_to_range:
+            # The whole result goes out as a single values.batchUpdate.
+            self._buffer(spreadsheet_id).write(write_to_range, [header] + rows, "RAW")
+            result["written"] = self.flush(spreadsheet_id)[spreadsheet_id]
+        return result
+
+    @tool
+    def sheet_group_by(
+        self,
+        spreadsheet_id,
+        range_name,
+        group_by_columns: List[str],
+        aggregations: List[str],
+        where_column=None,
+        where_op="==",
+        where_value=None,
+        write_to_range=None,
+    ):
+        """
+        Group sheet rows by one or more columns and aggregate each group locally,
+        without creating sheets or pivot tables in the spreadsheet.
+        Args:
+            spreadsheet_id: Google sheet ID
+            range_name: Source range e.g "Sheet1!A1:F", the first row is the header
+            group_by_columns: Header names or column letters to group by e.g ["Region"]
+            aggregations: "operation:column" pairs e.g ["sum:Amount", "p90:Amount", "count"].
+                Operations: count, count_distinct, sum, mean, min, max, median, std, pNN (percentile)
+            where_column: Optional header name or column letter to filter on first
+            where_op: Filter operator, one of ==, !=, >, >=, <, <=, contains
+            where_value: Value to compare where_column against
+            write_to_range: Optional top-left cell to write the result to e.g "Summary!A1"
+        Returns: The result header and one row per group
+        """
+        try:
+            table = self._read_table(spreadsheet_id, range_name)
+            if where_column is not None:
+                table = table.filter(table.mask(where_column, where_op, where_value))
+            header, rows = group_by(table, group_by_columns, aggregations)
+            return self._aggregation_result(spreadsheet_id, header, rows, write_to_range)
+        except (HttpError, KeyError, ValueError) as error:
+            print(f"An error occurred: {error}")
+            return str(error)
+
+    @tool
+    def pivot_tables(
+        self,
+        spreadsheet_id,
+        range_name,
+        rows,
+        columns,
+        values=None,
+        operation="sum",
+        write_to_range=None,
+    ):
+        """
+        Creates a pivot table from sheet data, computed locally.
+        Args:
+            spreadsheet_id: Google sheet ID
+            range_name: Source range e.g "Sheet1!A1:F", the first row is the header
+            rows: Header name or column letter whose values become the pivot rows
+            columns: Header name or column letter whose values become the pivot columns
+            values: Header name or column letter to aggregate; counts rows when omitted
+            operation: count, count_distinct, sum, mean, min, max, median, std or pNN (percentile)
+            write_to_range: Optional top-left cell to write the pivot to e.g "Pivot!A1"
+        Returns: The pivot header and one row per distinct `rows` value
+        """
+        try:
+            table = self._read_table(spreadsheet_id, range_name)
+            header, body = pivot(table, rows, columns, values, operation)
+            return self._aggregation_result(spreadsheet_id, header, body, write_to_range)
+        except (HttpError, KeyError, ValueError) as error:
+            print(f"An error occurred: {error}")
+            return str(error)
+
     def get_tools(self) -> List:
         """Get the tools in the toolkit."""
         return [
@@ -1337,22 +1583,32 @@ class GoogleSheetTools:
             self.sheet_append_values,
             self.sheet_get_values,
             self.sheet_batch_get_values,
+            self.sheet_aggregate,
+            self.sheet_filter_rows,
             self.sheets_batch_update,
             self.update_values,
             self.batch_update_values,
+            self.sheet_flush_writes,
+            self.sheet_group_by,
             self.pivot_tables
         ]
 
 
 class GoogleFormTools:
-    def __init__(self, creds: Credentials) -> None:
-        self.service = build(
-            "forms",
-            "v1",
-            http=creds.authorize(Http()),
-            discoveryServiceUrl=settings.DISCOVERY_DOC,
-            static_discovery=False,
-        )
+    def __init__(self, creds: Credentials, integration: Optional[Integration] = None) -> None:
+        self.service = build("forms", "v1", credentials=creds)
+        self.integration = integration
+        self.ingestor = FormResponseIngestor(self.service, integration=integration)
+
+    def _sync_state(self, form_id) -> FormSyncState:
+        # Forms with an active watch are kept current by pushed events.
+        watched = FormWatch.objects.filter(
+            form_id=form_id, state=FormWatch.State.ACTIVE, expire_time__gt=timezone.now()
+        ).exists()
+        state = FormSyncState.objects.filter(form_id=form_id).first() if watched else None
+        if state is None or state.last_synced_at is None:
+            state = self.ingestor.sync(form_id)
+        return state
 
     @tool
     def create_form(self, name: str):
@@ -1396,13 +1652,43 @@ class GoogleFormTools:
 
     @tool
     def retrieve_all_form_responses(self, form_id):
-        """Retrieve all Google form responses
+        """Sync all Google form responses and summarize the answers to each question
         Args:
             form_id: Google form ID
+        Returns: The response count and, per question, how often each answer was given
         """
         try:
-            result = self.service.forms().responses().list(formId=form_id).execute()
-            print(result)
+            state = self._sync_state(form_id)
+            return {
+                "title": state.title,
+                "responses": state.response_count,
+                "last_submitted_time": state.last_submitted_time,
+                "questions": state.summary,
+            }
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            return None
+
+    @tool
+    def count_form_answers(self, form_id, question, answer=None):
+        """Count the responses to a form question, or how many gave a specific answer,
+        e.g. "how many said Yes to question X"
+        Args:
+            form_id: Google form ID
+            question: Question title, part of the title, or question ID
+            answer: Optional answer to count, matched case-insensitively
+        """
+        try:
+            state = self._sync_state(form_id)
+            question_id = find_question(state.summary, question)
+            if question_id is None:
+                titles = [stats["title"] for stats in state.summary.values()]
+                return f"No single question matches {question!r}. Questions: {titles}"
+            stats = state.summary[question_id]
+            result = {"question": stats["title"], "answered": stats["answered"]}
+            if answer is not None:
+                result["answer"] = answer
+                result["count"] = count_answers(state, question_id, answer)
             return result
         except HttpError as error:
             print(f"An error occurred: {error}")
@@ -1487,31 +1773,26 @@ class GoogleFormTools:
             return None
 
     @tool
-    def create_form_watch(self, form_id, watch_topic_path):
-        """Create google watch for a google form
+    def create_form_watch(self, form_id, watch_topic_path=None):
+        """Create google watch for a google form, so new responses are pushed and
+        synced automatically. The watch is renewed before it expires.
         Args:
             form_id: Google form ID
-            watch_topic_path: Google watch topic path
+            watch_topic_path: Optional Pub/Sub topic path, defaults to the configured topic
         """
+        if self.integration is None:
+            return "Form watches need a connected integration."
         try:
-            watch = {
-                "watch": {
-                    "target": {"topic": {"topicName": watch_topic_path}},
-                    "eventType": "RESPONSES",
-                }
-            }
-
-            form_id = "<YOUR_FORM_ID>"
-
-            # Print JSON response after form watch creation
-            result = (
-                self.service.forms()
-                .watches()
-                .create(formId=form_id, body=watch)
-                .execute()
+            watch = FormWatchManager(self.service, self.integration).create(
+                form_id, topic_name=watch_topic_path
             )
-            print(result)
-            return result
+            schedule_form_watch_renewal(watch)
+            return {
+                "watch_id": watch.watch_id,
+                "event_type": watch.event_type,
+                "state": watch.state,
+                "expire_time": watch.expire_time,
+            }
         except HttpError as error:
             print(f"An error occurred: {error}")
             return None
@@ -1539,15 +1820,19 @@ class GoogleFormTools:
             watch_id: Google watch ID
         """
         try:
-            # Print JSON response after renewing a form watch
-            result = (
-                self.service.forms()
-                .watches()
-                .renew(formId=form_id, watchId=watch_id)
-                .execute()
-            )
-            print(result)
-            return result
+            watch = FormWatch.objects.filter(form_id=form_id, watch_id=watch_id).first()
+            if watch is None:
+                result = (
+                    self.service.forms()
+                    .watches()
+                    .renew(formId=form_id, watchId=watch_id)
+                    .execute()
+                )
+                print(result)
+                return result
+            watch = FormWatchManager(self.service, watch.integration).renew(watch)
+            schedule_form_watch_renewal(watch)
+            return {"watch_id": watch.watch_id, "state": watch.state, "expire_time": watch.expire_time}
         except HttpError as error:
             print(f"An error occurred: {error}")
             return f"An error occurred: {error}"
@@ -1560,29 +1845,56 @@ class GoogleFormTools:
             watch_id: Google watch ID
         """
         try:
-            # Print JSON response after deleting a form watch
-            result = (
-                self.service.forms()
-                .watches()
-                .delete(formId=form_id, watchId=watch_id)
-                .execute()
-            )
-            print(result)
-            return result
+            watch = FormWatch.objects.filter(form_id=form_id, watch_id=watch_id).first()
+            if watch is None:
+                result = (
+                    self.service.forms()
+                    .watches()
+                    .delete(formId=form_id, watchId=watch_id)
+                    .execute()
+                )
+                print(result)
+                return result
+            FormWatchManager(self.service, watch.integration).delete(watch)
+            return {"deleted": watch_id}
         except HttpError as error:
             print(f"An error occurred: {error}")
             return f"An error occurred: {error}"
 
+    def get_tools(self) -> List:
+        """Get the tools in the toolkit."""
+        return [
+            self.create_form,
+            self.retrieve_single_form_response,
+            self.retrieve_all_form_responses,
+            self.count_form_answers,
+            self.retrieve_form_content,
+            self.update_form,
+            self.convert_form_to_quiz,
+            self.create_form_watch,
+            self.list_form_watches,
+            self.renew_form_watch,
+            self.delete_form_watch,
+        ]
+
 
 class SalesForceTools:
-    def __init__(self, username, password, security_token, instance, session_id='') -> None:
-        self.sf = Salesforce(instance=instance, session_id=session_id)
-        self.sf = Salesforce(username=username, password=password, security_token=security_token)
+    def __init__(self, username=None, password=None, security_token=None, instance=None, session_id='', integration: Integration = None) -> None:
+        if integration is not None:
+            self.sf = salesforce_client(integration)
+        elif session_id:
+            self.sf = Salesforce(instance=instance, session_id=session_id)
+        else:
+            self.sf = Salesforce(username=username, password=password, security_token=security_token)
+        self.knowledge = KnowledgeMirror(self.sf, integration) if integration is not None else None
 
     @tool
     def search_knowledge(self, query: str) -> str:
         """
-        Searches Salesforce Knowledge articles for a given query using SOSL, within the LangChain framework.
+        Searches Salesforce Knowledge articles for a given query.
+
+        Articles are looked up in the local mirror of the org's Knowledge base, which is
+        kept in sync in the background; a live SOSL search is used when the mirror has no match.
 
         Parameters:
             query (str): The keyword or phrase to search for within Salesforce Knowledge articles.
@@ -1590,28 +1902,16 @@ class SalesForceTools:
         Returns:
             str: A formatted string containing the titles, questions, and URLs of the found articles, dynamically constructed based on the Salesforce instance.
         """
-        # Assuming 'sf' Salesforce connection object is initialized and accessible globally
-
         print (f"Searching Salesforce Knowledge for: {query}")
-        # Format the SOSL search string with the search term enclosed in braces
-        search_string = "FIND {{{0}}} IN ALL FIELDS RETURNING Knowledge__kav(Id, Title, Question__c, Answer__c, UrlName)".format(query)
-        print (f"search_string: {search_string}")
-        search_result = self.sf.search(search_string)
-        
-        # Initialize an empty list to store formatted article details
-        articles_details = []
-
-        # Dynamically construct the base URL from the Salesforce instance URL
-        base_url = self.sf.base_url.split('/services')[0]
-
-        # Process search results
-        for article in search_result['searchRecords']:
-            # Dynamically construct the URL for the article using the Salesforce instance URL
-            article_id = article['Id']
-            article_url = f"{base_url}/lightning/r/Knowledge__kav/{article_id}/view"
-            article_details = f"Title: {article['Title']}, Question: {article['Question__c']}, AnswerL:{article['Answer__c']}, URL: {article_url}"
-            articles_details.append(article_details)
+        if self.knowledge is not None:
+            articles = self.knowledge.search(query)
+        else:
+            articles = KnowledgeMirror(self.sf, None).search_live(query)
 
+        articles_details = [
+            f"Title: {article['title']}, Question: {article['question']}, Answer: {article['answer']}, URL: {article['url']}"
+            for article in articles
+        ]
         print(articles_details)
 
         # Join all article details into a single string to return
@@ -1677,7 +1977,7 @@ class SalesForceTools:
             case_id = new_case['id']
             
             # Construct the link to the created case
-            case_link = f"{self.sf.base_url}/lightning/r/Case/{case_id}/view"
+            case_link = record_url(self.sf, "Case", case_id)
             
             # Return success message along with the link to the created case
             return f"Case created successfully. Case Link: {case_link}"
@@ -1687,6 +1987,75 @@ class SalesForceTools:
             return f"Error creating case: {str(e)}"
 
 
+    @tool
+    def create_cases(self, cases: List[Dict[str, str]]) -> str:
+        """
+        Creates several case records in Salesforce at once.
+
+        Parameters:
+            cases (List[Dict[str, str]]): The cases to create. Each has a "subject" and a "description",
+                and optionally a "priority" (e.g. "High", "Medium", "Low") and an "origin" (defaults to "Web").
+
+        Returns:
+            str: One line per case, in the given order, with the link to the created case or the reason it failed.
+        """
+        try:
+            records = [
+                {
+                    'Subject': case.get('subject', ''),
+                    'Description': case.get('description', ''),
+                    'Origin': case.get('origin') or 'Web',
+                    **({'Priority': case['priority']} if case.get('priority') else {}),
+                }
+                for case in cases
+            ]
+            results = SObjectCollectionExecutor(self.sf).create("Case", records)
+            return self._format_case_results(cases, results, "created")
+        except Exception as e:
+            return f"Error creating cases: {str(e)}"
+
+    @tool
+    def update_cases(self, updates: List[Dict[str, str]]) -> str:
+        """
+        Updates several case records in Salesforce at once.
+
+        Parameters:
+            updates (List[Dict[str, str]]): The changes to make. Each has the "case_id" of the case to change and
+                the fields to set, e.g. {"case_id": "500...", "status": "Closed", "priority": "Low"}.
+                Field names are Subject, Description, Status, Priority or Origin (any casing), or Salesforce API names.
+
+        Returns:
+            str: One line per case, in the given order, with the link to the updated case or the reason it failed.
+        """
+        try:
+            records = [
+                {
+                    'Id': update['case_id'],
+                    **{
+                        CASE_FIELDS.get(field.lower(), field): value
+                        for field, value in update.items()
+                        if field != 'case_id'
+                    },
+                }
+                for update in updates
+            ]
+            results = SObjectCollectionExecutor(self.sf).update("Case", records)
+            return self._format_case_results(updates, results, "updated")
+        except Exception as e:
+            return f"Error updating cases: {str(e)}"
+
+    def _format_case_results(self, cases: List[Dict], results: List[Dict], action: str) -> str:
+        lines = []
+        for case, result in zip(cases, results):
+            label = case.get('subject') or case.get('case_id') or result['id']
+            if result['success']:
+                lines.append(f"- {label}: {action}. Case Link: {record_url(self.sf, 'Case', result['id'])}")
+            else:
+                errors = "; ".join(error.get('message', '') for error in result['errors'])
+                lines.append(f"- {label}: failed. {errors}")
+        succeeded = sum(result['success'] for result in results)
+        return f"{succeeded} of {len(results)} cases {action}.\n" + "\n".join(lines)
+
     @tool
     def search_account_summary(self, account_name: str) -> str:
         """
@@ -1700,49 +2069,60 @@ class SalesForceTools:
         """
         try:
             # Step 1: Search for the Account based on the provided name
-            search_result = self.sf.query(f"SELECT Id, Name FROM Account WHERE Name LIKE '%{account_name}%' LIMIT 1")
+            search_result = self.sf.query(
+                f"SELECT Id, Name FROM Account WHERE Name LIKE '%{escape_soql(account_name)}%' LIMIT 1"
+            )
             if search_result['totalSize'] == 0:
                 return f"No Account found with a similar name to '{account_name}'."
 
             # Extract Account Id from the search result
             account_id = search_result['records'][0]['Id']
 
-            # Step 2: Retrieve associated Opportunities, Contacts, and Cases
-            opportunities = self.sf.query_all(f"SELECT Id, Name, Amount, StageName FROM Opportunity WHERE AccountId = '{account_id}'")
-            contacts = self.sf.query_all(f"SELECT Id, Name FROM Contact WHERE AccountId = '{account_id}'")
-            cases = self.sf.query_all(f"SELECT Id, CaseNumber, Subject, Description FROM Case WHERE AccountId = '{account_id}'")
+            # Step 2: Stream associated Opportunities, Contacts, and Cases, stopping
+            # after a capped number of rows per section so large accounts stay cheap
+            sections = [
+                (
+                    "Opportunities",
+                    f"SELECT Id, Name, Amount, StageName FROM Opportunity WHERE AccountId = '{account_id}'",
+                    lambda opp: f"- Opportunity: {opp['Name']}, Amount: {opp.get('Amount') or 'N/A'}, Stage: {opp.get('StageName') or 'N/A'}",
+                ),
+                (
+                    "Contacts",
+                    f"SELECT Id, Name FROM Contact WHERE AccountId = '{account_id}'",
+                    lambda contact: f"- Contact: {contact['Name']}",
+                ),
+                (
+                    "Cases",
+                    f"SELECT Id, CaseNumber, Subject, Description FROM Case WHERE AccountId = '{account_id}' ORDER BY CreatedDate DESC",
+                    lambda case: f"- Case Number: {case['CaseNumber']}, Subject: {case.get('Subject') or 'N/A'}, Description: {case.get('Description') or 'N/A'}",
+                ),
+            ]
+            max_rows = settings.SALESFORCE_SUMMARY_MAX_ROWS
 
             # Format the summary
-            summary = f"Account Summary for '{account_name}':\n\n"
-
-            # Add information about Opportunities
-            if opportunities['totalSize'] > 0:
-                summary += "Opportunities:\n"
-                for opp in opportunities['records']:
-                    summary += f"- Opportunity: {opp['Name']}, Amount: {opp.get('Amount', 'N/A')}, Stage: {opp.get('StageName', 'N/A')}\n"
-            else:
-                summary += "No Opportunities found.\n"
-
-            # Add information about Contacts
-            if contacts['totalSize'] > 0:
-                summary += "\nContacts:\n"
-                for contact in contacts['records']:
-                    summary += f"- Contact: {contact['Name']}\n"
-            else:
-                summary += "No Contacts found.\n"
-
-            # Add information about Cases
-            if cases['totalSize'] > 0:
-                summary += "\nCases:\n"
-                for case in cases['records']:
-                    summary += f"- Case Number: {case['CaseNumber']}, Subject: {case.get('Subject', 'N/A')}, Description: {case.get('Description', 'N/A')}\n"
-            else:
-                summary += "No Cases found.\n"
+            summary = f"Account Summary for '{account_name}':\n"
+            for title, soql, line in sections:
+                executor = SalesforceQueryExecutor(self.sf)
+                lines = [line(record) for record in executor.iter_records(soql, max_rows=max_rows)]
+                if not lines:
+                    summary += f"\nNo {title} found.\n"
+                    continue
+                summary += f"\n{title} ({executor.total_size}):\n" + "\n".join(lines) + "\n"
+                if executor.total_size > len(lines):
+                    summary += f"... and {executor.total_size - len(lines)} more.\n"
 
             return summary
 
         except Exception as e:
             return f"Error searching for Account summary: {str(e)}"
     
-    def get_tools():
-        return []
\ No newline at end of file
+    def get_tools(self) -> List:
+        """Get the tools in the toolkit."""
+        return [
+            self.search_knowledge,
+            self.search_opportunities,
+            self.create_case,
+            self.create_cases,
+            self.update_cases,
+            self.search_account_summary,
+        ]
\ No newline at end of file
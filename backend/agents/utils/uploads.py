@@ -0,0 +1,230 @@
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
+
+from integrations.models import Integration
+
+from ..models import DriveUpload
+
+logger = logging.getLogger(__name__)
+
+# Drive requires every chunk except the last to be a multiple of 256 KiB.
+CHUNK_ALIGNMENT = 256 * 1024
+
+# Status codes Drive returns once a resumable session URI is no longer usable.
+EXPIRED_SESSION_STATUSES = (404, 410)
+
+
+class ResumableUploader:
+    """Chunked, restartable Drive uploads with bounded parallelism.
+
+    Every upload is tracked by a ``DriveUpload`` row keyed on the file's
+    fingerprint (path, size, mtime and target folder). The resumable session URI
+    and the committed offset are saved after each chunk, so re-running an upload
+    after a crash continues from the last byte Drive acknowledged.
+    """
+
+    def __init__(
+        self,
+        creds: Credentials,
+        integration: Optional[Integration] = None,
+        chunk_size: int = None,
+        max_workers: int = None,
+    ) -> None:
+        self.creds = creds
+        self.integration = integration
+        chunk_size = chunk_size or settings.DRIVE_UPLOAD_CHUNK_SIZE
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_size - chunk_size % CHUNK_ALIGNMENT)
+        self.max_workers = max_workers or settings.DRIVE_UPLOAD_MAX_WORKERS
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        # Discovery clients share an httplib2 connection which is not thread safe,
+        # so each worker thread gets its own.
+        if getattr(self._local, "service", None) is None:
+            self._local.service = build(
+                "drive", "v3", credentials=self.creds, cache_discovery=False
+            )
+        return self._local.service
+
+    def _get_session(self, file_name: str, mimetype: str, folder_id: Optional[str]) -> DriveUpload:
+        stat = os.stat(file_name)
+        session = (
+            DriveUpload.objects.filter(
+                integration=self.integration,
+                file_path=os.path.abspath(file_name),
+                file_size=stat.st_size,
+                file_mtime=stat.st_mtime,
+                folder_id=folder_id,
+            )
+            .order_by("-created_at")
+            .first()
+        )
+        if session is None or session.status == DriveUpload.Status.FAILED:
+            session = DriveUpload.objects.create(
+                integration=self.integration,
+                file_path=os.path.abspath(file_name),
+                file_size=stat.st_size,
+                file_mtime=stat.st_mtime,
+                mimetype=mimetype,
+                folder_id=folder_id,
+            )
+        return session
+
+    def _build_request(self, session: DriveUpload):
+        file_metadata = {
+            "name": os.path.basename(session.file_path),
+            "parents": [session.folder_id or "appDataFolder"],
+        }
+        media = MediaFileUpload(
+            session.file_path,
+            mimetype=session.mimetype,
+            chunksize=self.chunk_size,
+            resumable=True,
+        )
+        request = self.service.files().create(
+            body=file_metadata, media_body=media, fields="id"
+        )
+        if session.session_uri:
+            request.resumable_uri = session.session_uri
+        return request
+
+    def _query_offset(self, request, session: DriveUpload) -> Optional[Dict]:
+        """Ask Drive how much of the session it has persisted and resume from there.
+
+        The saved offset may be ahead of what the server actually committed.
+        Returns the file resource if Drive already has the whole file.
+        """
+        resp, content = request.http.request(
+            session.session_uri,
+            method="PUT",
+            headers={"Content-Length": "0", "Content-Range": f"bytes */{session.file_size}"},
+        )
+        if resp.status in (200, 201):
+            return json.loads(content)
+        if resp.status != 308:
+            raise HttpError(resp, content, uri=session.session_uri)
+        # "bytes=0-N" once Drive holds N + 1 bytes; no header when it holds none
+        committed = resp.get("range")
+        request.resumable_progress = int(committed.rsplit("-", 1)[1]) + 1 if committed else 0
+        return None
+
+    def upload(self, file_name: str, mimetype: str = None, folder_id: str = None) -> Dict:
+        """Upload a single file, resuming a previous session when one exists."""
+        mimetype = mimetype or mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+        session = self._get_session(file_name, mimetype, folder_id)
+        if session.status == DriveUpload.Status.COMPLETED:
+            return self._result(session, resumed=False)
+
+        resumed = bool(session.session_uri)
+        resumed_from = session.bytes_uploaded
+        session.status = DriveUpload.Status.UPLOADING
+        session.started_at = timezone.now()
+        session.save(update_fields=["status", "started_at", "updated_at"])
+
+        started = time.monotonic()
+        try:
+            try:
+                response = self._upload_chunks(session)
+            except HttpError as error:
+                if error.resp.status not in EXPIRED_SESSION_STATUSES or not session.session_uri:
+                    raise
+                logger.info("Upload session for %s expired, restarting", session.file_path)
+                session.session_uri = None
+                session.bytes_uploaded = resumed_from = 0
+                session.save(update_fields=["session_uri", "bytes_uploaded", "updated_at"])
+                response = self._upload_chunks(session)
+        except Exception as error:
+            # Includes a failed restart, so the row never stays UPLOADING
+            self._fail(session, error)
+            raise
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        session.status = DriveUpload.Status.COMPLETED
+        session.drive_file_id = response.get("id")
+        session.bytes_uploaded = session.file_size
+        session.throughput = (session.file_size - resumed_from) / elapsed
+        session.finished_at = timezone.now()
+        session.save()
+        logger.info(
+            "Uploaded %s to Drive (%s) at %.0f B/s",
+            session.file_path,
+            session.drive_file_id,
+            session.throughput,
+        )
+        return self._result(session, resumed=resumed)
+
+    def _upload_chunks(self, session: DriveUpload) -> Dict:
+        request = self._build_request(session)
+        response = self._query_offset(request, session) if session.session_uri else None
+        while response is None:
+            _, response = request.next_chunk(num_retries=settings.DRIVE_UPLOAD_NUM_RETRIES)
+            if (
+                request.resumable_uri != session.session_uri
+                or request.resumable_progress != session.bytes_uploaded
+            ):
+                session.session_uri = request.resumable_uri
+                session.bytes_uploaded = request.resumable_progress
+                session.save(update_fields=["session_uri", "bytes_uploaded", "updated_at"])
+        return response
+
+    def _fail(self, session: DriveUpload, error: Exception):
+        session.status = DriveUpload.Status.FAILED
+        session.error = str(error)
+        session.finished_at = timezone.now()
+        session.save(update_fields=["status", "error", "finished_at", "updated_at"])
+
+    def _result(self, session: DriveUpload, resumed: bool) -> Dict:
+        return {
+            "file_name": os.path.basename(session.file_path),
+            "file_id": session.drive_file_id,
+            "status": session.status,
+            "bytes": session.file_size,
+            "throughput": session.throughput,
+            "resumed": resumed,
+        }
+
+    def upload_many(
+        self,
+        files: Sequence[Union[str, Tuple[str, str]]],
+        folder_id: str = None,
+    ) -> List[Dict]:
+        """Upload several files concurrently, at most ``max_workers`` at a time.
+
+        ``files`` holds file names or ``(file_name, mimetype)`` pairs. A failed
+        file does not abort the others; its entry carries the error instead.
+        """
+
+        def _upload(item):
+            file_name, mimetype = (item, None) if isinstance(item, str) else item
+            try:
+                return self.upload(file_name, mimetype=mimetype, folder_id=folder_id)
+            except Exception as error:
+                logger.exception("Upload of %s failed", file_name)
+                return {
+                    "file_name": os.path.basename(file_name),
+                    "file_id": None,
+                    "status": DriveUpload.Status.FAILED,
+                    "error": str(error),
+                }
+            finally:
+                # Worker threads open their own DB connection; don't leak it.
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(_upload, files))
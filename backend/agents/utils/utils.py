@@ -10,13 +10,28 @@ from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_core.messages import BaseMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.prebuilt import create_react_agent
 from langgraph.prebuilt.tool_executor import ToolExecutor
 from langgraph.graph import StateGraph, END
 from langchain_core.output_parsers.openai_functions import JsonOutputFunctionsParser
 
-from .tools import GmailTools, GoogleCalenderTools, SalesForceTools
-from .constants import GENERAL_SYSTEM_MESSAGE, GMAIL_SYSTEM_MESSAGE, GOOGLE_CALENDER_SYSTEM_MESSAGE
+from .tools import (
+    GmailTools,
+    GoogleCalenderTools,
+    GoogleDocTools,
+    GoogleDriveTools,
+    GoogleSheetTools,
+    SalesForceTools,
+)
+from .constants import (
+    GENERAL_SYSTEM_MESSAGE,
+    GMAIL_SYSTEM_MESSAGE,
+    GOOGLE_CALENDER_SYSTEM_MESSAGE,
+    GOOGLE_DOCS_SYSTEM_MESSAGE,
+    GOOGLE_DRIVE_SYSTEM_MESSAGE,
+    GOOGLE_SHEET_SYSTEM_MESSAGE,
+)
 from common.models import ThirdParty
 from integrations.models import Integration
 
@@ -96,28 +111,28 @@ def create_agent_supervisor(llm, members: list):
     return supervisor_chain
 
 
-def create_google_workspace_multi_agent(llm: ChatOpenAI, credential: Credentials):
-    # Define members of the AI crew
-    members = ["Gmail_Assistant", "Google_Calender_Assistant"]
+def create_google_workspace_multi_agent(llm: ChatOpenAI, credential: Credentials, checkpointer: BaseCheckpointSaver = None, integration: Integration = None):
+    # Define each member of the AI crew with its tools and prompt; the Drive
+    # tools search and index the integration's documents when it is given
+    members = {
+        "Gmail_Assistant": (GmailTools(creds=credential).get_tools(), GMAIL_SYSTEM_MESSAGE),
+        "Google_Calender_Assistant": (GoogleCalenderTools(creds=credential).get_tools(), GOOGLE_CALENDER_SYSTEM_MESSAGE),
+        "Google_Drive_Assistant": (
+            GoogleDriveTools(creds=credential, integration=integration).get_tools(),
+            GOOGLE_DRIVE_SYSTEM_MESSAGE,
+        ),
+        "Google_Docs_Assistant": (GoogleDocTools(creds=credential).get_tools(), GOOGLE_DOCS_SYSTEM_MESSAGE),
+        "Google_Sheets_Assistant": (GoogleSheetTools(creds=credential).get_tools(), GOOGLE_SHEET_SYSTEM_MESSAGE),
+    }
 
     # Create supervisor chain
-    supervisor_chain = create_agent_supervisor(llm, members)
-
-    # Define each agent tools
-    gmail_tools = GmailTools(creds=credential).get_tools()
-    calender_tools = GoogleCalenderTools(creds=credential).get_tools()
+    supervisor_chain = create_agent_supervisor(llm, list(members))
 
-    # define the agent and node
-    gmail_agent = create_agent(llm, gmail_tools, GMAIL_SYSTEM_MESSAGE)
-    gmail_node = functools.partial(agent_node, agent=gmail_agent, name="Gmail_Assistant")
-
-    calender_agent = create_agent(llm, calender_tools, GOOGLE_CALENDER_SYSTEM_MESSAGE)
-    calender_node = functools.partial(agent_node, agent=calender_agent, name="Google_Calender_Assistant")
-    
     # Create Graph
     workflow = StateGraph(AgentState)
-    workflow.add_node("Gmail_Assistant", gmail_node)
-    workflow.add_node("Google_Calender_Assistant", calender_node)
+    for name, (tools, system_message) in members.items():
+        member_agent = create_agent(llm, tools, system_message)
+        workflow.add_node(name, functools.partial(agent_node, agent=member_agent, name=name))
     workflow.add_node("supervisor", supervisor_chain)
 
     # Now connect all the edges in the graph.
@@ -132,24 +147,42 @@ def create_google_workspace_multi_agent(llm: ChatOpenAI, credential: Credentials
     # Finally, add entrypoint
     workflow.set_entry_point("supervisor")
 
-    graph = workflow.compile()
+    graph = workflow.compile(checkpointer=checkpointer)
     return graph
 
 
-def get_agent(integration: Integration, credential: Credentials = None, username: str = None, password: str = None, security_token: str = None):
-    llm = ChatOpenAI(model="gpt-4o", openai_api_key=settings.OPENAI_API_KEY)
+def response_text(response) -> str:
+    """The reply in the result of invoking an agent from ``get_agent``."""
+    if "output" in response:
+        return response["output"]
+    # LangGraph agents return their state; the reply is the last message.
+    return response["messages"][-1].content
+
+
+def get_agent(integration: Integration, credential: Credentials = None, username: str = None, password: str = None, security_token: str = None, checkpointer: BaseCheckpointSaver = None):
+    # Streaming lets callbacks see tokens as they arrive; invoke still returns the full reply.
+    llm = ChatOpenAI(model="gpt-4o", openai_api_key=settings.OPENAI_API_KEY, streaming=True)
 
     if integration.is_workspace:
         if integration.thirdparty == ThirdParty.GOOGLE_WORKSPACE and credential is not None:
-            agent = create_google_workspace_multi_agent(llm, credential=credential)
+            agent = create_google_workspace_multi_agent(
+                llm, credential=credential, checkpointer=checkpointer, integration=integration
+            )
     else:
         tools = []
 
         if integration.thirdparty == ThirdParty.SALESFORCE:
-            tools = SalesForceTools.get_tools()
+            tools = SalesForceTools(
+                username=username,
+                password=password,
+                security_token=security_token,
+                integration=integration if integration.access_token else None,
+            ).get_tools()
 
         tool_executors = ToolExecutor(tools=tools)
-        agent = create_react_agent(model=llm, tools=tool_executors, messages_modifier=GENERAL_SYSTEM_MESSAGE)
+        agent = create_react_agent(
+            model=llm, tools=tool_executors, messages_modifier=GENERAL_SYSTEM_MESSAGE, checkpointer=checkpointer
+        )
 
     print(f"Created agent successfully")
     return agent
@@ -1,8 +1,12 @@
+import hmac
+import logging
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.shortcuts import redirect
 from django.utils import timezone
 
 from rest_framework import mixins, permissions, status
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
 from rest_framework.decorators import action
@@ -12,11 +16,16 @@ from feedbacks.serializers import TicketSerializer
 from feedbacks.models import Ticket
 from chat.models import ChatMessage
 from chat.tasks import chat_response
-from chat.serializers import ChatMessageSerializer
+from chat.pagination import ChatHistoryPagination
+from chat.serializers import ChatHistorySerializer, ChatMessageSerializer
 from common.models import ThirdParty
 
 from .models import Agent
 from .serializers import AgentSerializer
+from .tasks import start_document_sync, start_knowledge_sync, sync_form_responses
+from .utils.form_events import claim_form_sync, parse_push_envelope
+
+logger = logging.getLogger(__name__)
 
 
 # Create your views here.
@@ -77,6 +86,10 @@ class AgentViewSet(
                 )
                 agent.integration = integration
                 agent.save()
+                if agent.thirdparty == ThirdParty.SALESFORCE:
+                    start_knowledge_sync(integration.id)
+                elif agent.thirdparty == ThirdParty.GOOGLE_WORKSPACE:
+                    start_document_sync(integration.id)
                 return Response(
                     {"status": "Authorization successful"}, status=status.HTTP_200_OK
                 )
@@ -95,15 +108,20 @@ class AgentViewSet(
     def chat(self, request, pk=None):
         agent = self.get_object()
         if request.method == "GET":
-            messages = ChatMessage.objects.filter(agent=agent)
-            serializer = ChatMessageSerializer(messages, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            paginator = ChatHistoryPagination()
+            messages = paginator.paginate_queryset(
+                ChatMessage.objects.filter(agent=agent).only("id", "message", "is_ai", "timestamp"),
+                request,
+                view=self,
+            )
+            serializer = ChatHistorySerializer(messages, many=True)
+            return paginator.get_paginated_response(serializer.data)
         elif request.method == "POST":
             data = request.data
             chat_message = ChatMessage.objects.create(
                 agent=agent, message=data["message"]
             )
-            chat_response.send(chat_message.id)
+            chat_response.send_with_options(args=(chat_message.id,), tenant=f"user:{agent.user_id}")
             return Response(
                 ChatMessageSerializer(chat_message).data, status=status.HTTP_201_CREATED
             )
@@ -123,3 +141,34 @@ class AgentViewSet(
         integration.webhook_url = webhook_url
         integration.save()
         return Response({"status": "Webhook URL set"}, status=status.HTTP_200_OK)
+
+
+class FormEventView(APIView):
+    """Pub/Sub push endpoint for Google Forms watch notifications.
+
+    Each notification only queues an incremental response sync of its form;
+    notifications for a form whose sync is already queued are dropped. Pub/Sub
+    treats any 2xx as an ack, so the response is sent before any API work.
+    """
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        token = request.query_params.get("token", "")
+        if not settings.FORMS_PUSH_TOKEN or not hmac.compare_digest(
+            token, settings.FORMS_PUSH_TOKEN
+        ):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        try:
+            event = parse_push_envelope(request.data)
+        except (KeyError, TypeError, ValueError):
+            # A malformed message will never parse; ack it so it isn't redelivered.
+            logger.warning("Dropping malformed form event: %s", request.data)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if event["event_type"] == "RESPONSES" and claim_form_sync(event["form_id"]):
+            sync_form_responses.send_with_options(
+                args=(event["form_id"],), delay=settings.FORMS_EVENT_DEBOUNCE * 1000
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
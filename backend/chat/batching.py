@@ -0,0 +1,135 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import msgpack
+import prometheus_client as prom
+from django.conf import settings
+
+# WebSocket subprotocol of clients that want msgpack binary frames instead of JSON text
+MSGPACK = "msgpack"
+
+CONNECTIONS = prom.Gauge(
+    "chat_ws_connections",
+    "Open chat WebSocket connections.",
+    multiprocess_mode="livesum",
+)
+FRAMES = prom.Counter(
+    "chat_ws_frames_total",
+    "WebSocket frames sent to chat clients.",
+    ["encoding"],
+)
+FRAME_BYTES = prom.Histogram(
+    "chat_ws_frame_bytes",
+    "Size of the WebSocket frames sent to chat clients.",
+    ["encoding"],
+    buckets=(32, 64, 128, 256, 512, 1024, 4096, 16384, 65536, float("inf")),
+)
+GROUP_SENDS = prom.Counter(
+    "chat_group_sends_total",
+    "Events sent to chat groups through the channel layer.",
+    ["type"],
+)
+GROUP_SEND_BYTES = prom.Histogram(
+    "chat_group_send_bytes",
+    "Size of the events sent to chat groups, as msgpack.",
+    ["type"],
+    buckets=(64, 128, 256, 512, 1024, 4096, 16384, 65536, float("inf")),
+)
+EVENTS_PER_SEND = prom.Histogram(
+    "chat_stream_events_per_send",
+    "Reply stream events coalesced into one group send.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, float("inf")),
+)
+
+Event = Tuple[str, Dict[str, Any]]
+
+
+def encode_frame(data: Dict[str, Any], encoding: str = None):
+    """``data`` as a WebSocket frame payload: msgpack bytes or JSON text."""
+    if encoding == MSGPACK:
+        frame = msgpack.packb(data)
+        size = len(frame)
+    else:
+        frame = json.dumps(data)
+        size = len(frame.encode())
+    FRAMES.labels(encoding or "json").inc()
+    FRAME_BYTES.labels(encoding or "json").observe(size)
+    return frame
+
+
+def record_group_send(event: Dict[str, Any]) -> None:
+    GROUP_SENDS.labels(event["type"]).inc()
+    # channels_redis sends events as msgpack, so this is what Redis carries
+    GROUP_SEND_BYTES.labels(event["type"]).observe(len(msgpack.packb(event)))
+
+
+class StreamBatcher:
+    """Coalesces the events of a streamed reply and flushes them once per window.
+
+    Consecutive tokens are joined, so a flush carries a few events however
+    many tokens the model produced in ``CHAT_STREAM_WINDOW_MS``, and the
+    group sends of a reply grow with its duration rather than its length.
+    ``add`` waits while a flush is being sent, which holds the run back when
+    the channel layer is slow. A flush that fails in the background is
+    raised by the next ``add`` or ``close``.
+    """
+
+    def __init__(self, flush: Callable[[List[Event]], Awaitable[None]], window: float = None) -> None:
+        self._send = flush
+        self.window = settings.CHAT_STREAM_WINDOW_MS / 1000 if window is None else window
+        self.pending: List[Event] = []
+        self._added = 0
+        self._lock = asyncio.Lock()
+        self._timer = None
+        self._error: Optional[BaseException] = None
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    async def add(self, kind: str, data: Dict[str, Any]) -> None:
+        self._raise_error()
+        async with self._lock:
+            if kind == "token" and self.pending and self.pending[-1][0] == "token":
+                self.pending[-1] = ("token", {"text": self.pending[-1][1]["text"] + data["text"]})
+            else:
+                self.pending.append((kind, data))
+            self._added += 1
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as error:
+            self._error = error
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self.pending:
+                return
+            events, self.pending = self.pending, []
+            EVENTS_PER_SEND.observe(self._added)
+            self._added = 0
+            await self._send(events)
+
+    def discard(self) -> None:
+        """Drop what has not been sent, e.g. when the reply is cancelled."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.pending = []
+        self._added = 0
+        self._error = None
+
+    async def close(self) -> None:
+        """Send what is left; the batcher is not used afterwards."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._raise_error()
+        await self.flush()
@@ -1,12 +1,54 @@
 # support/consumers.py
 
+import asyncio
 import json
+import logging
+import time
+
+import msgpack
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from agents.models import Agent
+from agents.utils.sheets import sheet_write_turn
+from agents.utils.utils import response_text
+
+from .batching import CONNECTIONS, MSGPACK, StreamBatcher, encode_frame, record_group_send
+from .models import ChatMessage
+from .serializers import ChatMessageSerializer
+from .streaming import ReplyStream, RunCancelled
+from .tasks import cached_agent, load_history
+
+logger = logging.getLogger(__name__)
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """Chat with one of the user's agents.
+
+    A ``{"message": ...}`` frame is saved and answered: the reply streams
+    to every socket of the agent as ``reset``/``token``/``tool`` frames, sent
+    in batches every ``CHAT_STREAM_WINDOW_MS``, and ends with the saved
+    reply. A ``{"type": "cancel"}`` frame stops the reply being generated.
+    Clients connecting with the ``msgpack`` subprotocol exchange msgpack
+    binary frames instead of JSON text.
+    """
+
+    # Open sockets in this process
+    connections = 0
+
     async def connect(self):
         self.agent_id = self.scope['url_route']['kwargs']['agent_id']
         self.agent_group_name = f'chat_{self.agent_id}'
+        self.run = None
+        self.stream = None
+        self.reply_to = None
+        self.encoding = MSGPACK if MSGPACK in self.scope.get('subprotocols', []) else None
+
+        self.agent = await self.get_agent()
+        if self.agent is None:
+            # Not signed in, or not the user's agent
+            await self.close()
+            return
 
         # Join agent group
         await self.channel_layer.group_add(
@@ -14,33 +56,153 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(subprotocol=self.encoding)
+        ChatConsumer.connections += 1
+        CONNECTIONS.inc()
 
     async def disconnect(self, close_code):
+        if getattr(self, 'agent', None) is None:
+            return
+        ChatConsumer.connections -= 1
+        CONNECTIONS.dec()
+        await self.cancel_run()
         # Leave agent group
         await self.channel_layer.group_discard(
             self.agent_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+    @database_sync_to_async
+    def get_agent(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return None
+        return Agent.objects.select_related('integration').filter(id=self.agent_id, user=user).first()
+
+    async def send_frame(self, data):
+        frame = encode_frame(data, self.encoding)
+        if self.encoding == MSGPACK:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def group_send(self, event):
+        record_group_send(event)
+        await self.channel_layer.group_send(self.agent_group_name, event)
 
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            text_data_json = msgpack.unpackb(bytes_data) if bytes_data is not None else json.loads(text_data)
+        except (ValueError, TypeError, msgpack.UnpackException):
+            await self.send_frame({'type': 'error', 'error': 'Frames must be JSON text or msgpack binary'})
+            return
+        if not isinstance(text_data_json, dict):
+            text_data_json = {}
+        if text_data_json.get('type') == 'cancel':
+            await self.cancel_run()
+            return
+        if not isinstance(text_data_json.get('message'), str) or not text_data_json['message'].strip():
+            await self.send_frame({'type': 'error', 'error': 'Expected a {"message": "..."} or {"type": "cancel"} frame'})
+            return
+
+        if self.run is not None and not self.run.done():
+            await self.send_frame({'type': 'error', 'error': 'A reply is still being written'})
+            return
+
+        message = await database_sync_to_async(ChatMessage.objects.create)(
+            agent=self.agent, message=text_data_json['message']
+        )
         # Send message to agent group
-        await self.channel_layer.group_send(
-            self.agent_group_name,
+        await self.group_send(
             {
                 'type': 'chat_message',
-                'message': message
+                'message': ChatMessageSerializer(message).data,
             }
         )
+        self.reply_to = str(message.id)
+        self.stream = ReplyStream(asyncio.get_running_loop())
+        self.run = asyncio.create_task(self.answer(message, self.stream))
+
+    def run_agent(self, message, stream):
+        """Answer ``message`` in a worker thread, reporting progress to ``stream``."""
+        try:
+            # The socket's agent was loaded on connect; its integration's token may have been refreshed since
+            agent = Agent.objects.select_related('integration').get(id=self.agent.id)
+            history = [m.instance for m in load_history(message)]
+            with sheet_write_turn():
+                response = cached_agent(agent).invoke({'messages': history}, config={'callbacks': [stream]})
+            stream.check()
+            reply = ChatMessage.objects.create(agent=self.agent, message=response_text(response), is_ai=True)
+            return ChatMessageSerializer(reply).data
+        finally:
+            stream.close()
+
+    async def answer(self, message, stream):
+        reply_to = str(message.id)
+        # Not thread sensitive, so runs of different sockets don't wait for each other
+        run = asyncio.ensure_future(database_sync_to_async(self.run_agent, thread_sensitive=False)(message, stream))
+        # A cancelled run still ends with RunCancelled, after no one awaits it
+        run.add_done_callback(lambda future: future.cancelled() or future.exception())
+        batcher = StreamBatcher(
+            lambda events: self.group_send(
+                {'type': 'chat_stream', 'reply_to': reply_to, 'events': [[kind, data] for kind, data in events]}
+            )
+        )
+        try:
+            async for kind, data in stream.events():
+                await batcher.add(kind, data)
+            reply = await run
+            await batcher.close()
+        except asyncio.CancelledError:
+            # Every way out stops the run, or its thread blocks on the full queue for good
+            stream.cancel()
+            batcher.discard()
+            raise
+        except RunCancelled:
+            stream.cancel()
+            batcher.discard()
+            return
+        except Exception:
+            stream.cancel()
+            batcher.discard()
+            logger.exception('Answering chat message %s failed', reply_to)
+            await self.send_frame({'type': 'error', 'reply_to': reply_to, 'error': 'The agent could not reply'})
+            return
+
+        await self.group_send(
+            {
+                'type': 'chat_message',
+                'message': reply,
+                'reply_to': reply_to,
+            }
+        )
+
+    async def cancel_run(self):
+        if self.run is None or self.run.done():
+            return
+        self.stream.cancel()
+        self.run.cancel()
+        # The worker thread stops at its next callback; clients needn't wait for it
+        await self.group_send({'type': 'chat_stream', 'reply_to': self.reply_to, 'events': [['cancelled', {}]]})
+
+    async def chat_stream(self, event):
+        for kind, data in event['events']:
+            await self.send_frame({'type': kind, 'reply_to': event['reply_to'], **data})
+
+    async def chat_error(self, event):
+        await self.send_frame({'type': 'error', 'reply_to': event['reply_to'], 'error': event['error']})
 
     async def chat_message(self, event):
         message = event['message']
-        print(message)
+        data = {'type': 'message', 'message': message}
+        if 'reply_to' in event:
+            data['reply_to'] = event['reply_to']
+        if 'timings' in event:
+            # Agent replies carry the time spent in each stage of the pipeline
+            data['timings'] = {
+                **event['timings'],
+                'delivery_ms': max(int((time.time() - event['sent_at']) * 1000), 0),
+            }
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'message': message
-        }))
+        await self.send_frame(data)
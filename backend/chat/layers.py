@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import hashlib
+import logging
+import time
+from typing import Dict, List
+
+from channels_redis.core import RedisChannelLayer
+
+logger = logging.getLogger(__name__)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach): adding a bucket moves only 1/n of the keys."""
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+class ShardedChannelLayer(RedisChannelLayer):
+    """Redis channel layer for many ASGI nodes over several Redis hosts.
+
+    Groups (``chat_{agent_id}``) and channels are spread over ``hosts`` by
+    jump consistent hashing, so adding a host moves a fraction of the groups
+    instead of nearly all of them, as the modulo hashing of
+    ``RedisChannelLayer`` does. Every node must use the same host list.
+
+    A group send delivers to channels of this process directly, without the
+    round trip through Redis, when it runs on the loop the process receives
+    on; remote channels are sent through Redis as usual. As in Redis, a
+    channel holding ``get_capacity(channel)`` undelivered messages, queued
+    here or in its receive buffer, misses the send, and the message is
+    serialized, so local receivers get their own copy with the same types.
+
+    The fast path hooks into ``_map_channel_keys_to_connection``,
+    ``receive_single`` and ``receive_buffer`` of ``RedisChannelLayer``,
+    which are not public API; requirements pin channels-redis to the
+    release they were written against.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (channels, serialized message) delivered in-process, waiting for the receive loop
+        self._local = collections.deque()
+        # channel -> its messages in self._local
+        self._local_queued = collections.Counter()
+        self._local_wakeup = None
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        if isinstance(value, str):
+            value = value.encode("utf8")
+        key = int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+        return jump_hash(key, self.ring_size)
+
+    def _is_receiving_here(self) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return self.receive_count > 0 and self.receive_event_loop is loop
+
+    def _map_channel_keys_to_connection(self, channel_names, message):
+        if self._is_receiving_here():
+            local_prefix = f"{self.client_prefix}!"
+            local, remote = [], []
+            for channel in channel_names:
+                if "!" in channel and self.non_local_name(channel).endswith(local_prefix):
+                    local.append(channel)
+                else:
+                    remote.append(channel)
+            local = self._within_capacity(local)
+            if local:
+                self._local.append((local, self.serialize(message)))
+                self._local_queued.update(local)
+                if self._local_wakeup is not None:
+                    self._local_wakeup.set()
+            channel_names = remote
+        return super()._map_channel_keys_to_connection(channel_names, message)
+
+    def _within_capacity(self, channels: List[str]) -> List[str]:
+        accepted = []
+        for channel in channels:
+            buffered = self.receive_buffer[channel].qsize() if channel in self.receive_buffer else 0
+            if self._local_queued[channel] + buffered < self.get_capacity(channel):
+                accepted.append(channel)
+        if len(accepted) < len(channels):
+            logger.info("%s of %s local channels over capacity", len(channels) - len(accepted), len(channels))
+        return accepted
+
+    def _pop_local(self):
+        channels, payload = self._local.popleft()
+        self._local_queued.subtract(channels)
+        for channel in channels:
+            if self._local_queued[channel] <= 0:
+                del self._local_queued[channel]
+        return channels, self.deserialize(payload)
+
+    async def receive_single(self, channel):
+        # receive() calls this for the process channel, one caller at a time,
+        # and hands what it returns to the waiting channels.
+        if not channel.endswith(f"{self.client_prefix}!"):
+            return await super().receive_single(channel)
+        if self._local:
+            return self._pop_local()
+
+        self._local_wakeup = wakeup = asyncio.Event()
+        single = asyncio.ensure_future(super().receive_single(channel))
+        woken = asyncio.ensure_future(wakeup.wait())
+        try:
+            await asyncio.wait({single, woken}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            single.cancel()
+            raise
+        finally:
+            self._local_wakeup = None
+            woken.cancel()
+
+        if single.done() or not single.cancel():
+            return single.result()
+        # Stop waiting on Redis; a message it had popped stays in the backup queue
+        try:
+            return await single
+        except asyncio.CancelledError:
+            pass
+        return self._pop_local()
+
+    async def group_sizes(self, groups: List[str]) -> Dict[str, int]:
+        """Live members of each group, read from the group's shard."""
+        sizes = {}
+        for group in groups:
+            connection = self.connection(self.consistent_hash(group))
+            sizes[group] = await connection.zcount(self._group_key(group), time.time() - self.group_expiry, "+inf")
+        return sizes
+
+    async def shard_stats(self, pattern: str = "*", top: int = 10) -> List[Dict]:
+        """Groups matching ``pattern`` on each host, with their live members and the largest groups."""
+        prefix = self._group_key("").decode("utf8")
+        stats = []
+        for index in range(self.ring_size):
+            connection = self.connection(index)
+            sizes = {}
+            async for key in connection.scan_iter(match=f"{prefix}{pattern}", count=1000):
+                group = key.decode("utf8")[len(prefix):]
+                sizes[group] = await connection.zcount(key, time.time() - self.group_expiry, "+inf")
+            largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:top]
+            stats.append(
+                {
+                    "shard": index,
+                    "groups": len(sizes),
+                    "connections": sum(sizes.values()),
+                    "largest": [{"group": group, "connections": size} for group, size in largest],
+                }
+            )
+        return stats
@@ -0,0 +1,151 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from langchain_core.messages import AIMessage
+
+from accounts.models import User
+from agents.models import Agent
+from chat import tasks
+from chat.models import ChatMessage
+from common.models import ThirdParty
+from integrations.models import Integration
+
+STAGES = ["queue_ms", "agent_ms", "persist_ms", "delivery_ms", "end_to_end_ms"]
+
+
+class StubAgent:
+    """Stands in for a compiled agent: waits about as long as an LLM call, then echoes."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+
+    def invoke(self, state, config=None):
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        return {"messages": [*state["messages"], AIMessage(content=f"echo: {state['messages'][-1].content}")]}
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent chats through chat_response against a stubbed LLM and report the time "
+        "spent in each stage, as received by WebSocket subscribers. Runs against a throwaway test "
+        "database, created next to the configured one and destroyed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=500, help="Conversations started at once")
+        parser.add_argument("--workers", type=int, default=32, help="Threads answering in-process")
+        parser.add_argument("--latency", type=float, default=0.5, help="Mean stub LLM latency in seconds")
+        parser.add_argument("--timeout", type=float, default=120.0)
+
+    def _listen(self, groups, results, ready, timeout):
+        """Subscribe like ChatConsumer does, one channel per chat, and collect the replies."""
+        layer = get_channel_layer()
+
+        async def subscribe(group):
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            return channel
+
+        async def receive(channel):
+            event = await layer.receive(channel)
+            results.append((time.time(), event))
+
+        async def main():
+            channels = await asyncio.gather(*(subscribe(group) for group in groups))
+            ready.set()
+            try:
+                await asyncio.wait_for(asyncio.gather(*(receive(channel) for channel in channels)), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        asyncio.run(main())
+
+    def _answer(self, message_id):
+        try:
+            tasks.chat_response.fn(message_id)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        # The chats' users, agents and messages never touch the configured database
+        old_config = setup_databases(verbosity=1, interactive=False)
+        try:
+            messages, results, elapsed = self._run(options)
+        finally:
+            teardown_databases(old_config, verbosity=1)
+        self._report(options["chats"], messages, results, elapsed)
+
+    def _run(self, options):
+        count = options["chats"]
+        user = User.objects.create(email=f"loadtest-{uuid.uuid4().hex[:12]}@example.com")
+        integrations = Integration.objects.bulk_create(
+            Integration(thirdparty=ThirdParty.SALESFORCE, access_token="", refresh_token="", user=user)
+            for _ in range(count)
+        )
+        agents = Agent.objects.bulk_create(
+            Agent(name=f"loadtest {i}", user=user, thirdparty=ThirdParty.SALESFORCE, integration=integration)
+            for i, integration in enumerate(integrations)
+        )
+        stub = StubAgent(options["latency"])
+        tasks._agents.clear()
+        try:
+            with mock.patch.object(tasks, "get_agent", lambda *args, **kwargs: stub):
+                results, ready = [], threading.Event()
+                listener = threading.Thread(
+                    target=self._listen,
+                    args=([f"chat_{agent.id}" for agent in agents], results, ready, options["timeout"]),
+                )
+                listener.start()
+                if not ready.wait(options["timeout"]):
+                    raise CommandError("Subscribing to the chat groups timed out")
+
+                started = time.perf_counter()
+                messages = ChatMessage.objects.bulk_create(
+                    ChatMessage(agent=agent, message=f"question {i}") for i, agent in enumerate(agents)
+                )
+                # Every chat is queued at once; the pool plays the interactive workers
+                with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                    list(pool.map(self._answer, [message.id for message in messages]))
+                listener.join()
+                elapsed = time.perf_counter() - started
+        finally:
+            # Cached entries hold the stub
+            tasks._agents.clear()
+        return messages, results, elapsed
+
+    def _report(self, count, messages, results, elapsed):
+        created = {str(message.id): message.created_at.timestamp() for message in messages}
+        stages = {stage: [] for stage in STAGES}
+        for received_at, event in results:
+            timings = {
+                **event["timings"],
+                "delivery_ms": (received_at - event["sent_at"]) * 1000,
+                "end_to_end_ms": (received_at - created[event["reply_to"]]) * 1000,
+            }
+            for stage in STAGES:
+                stages[stage].append(timings[stage])
+
+        self.stdout.write(
+            f"{len(results)}/{count} replies in {elapsed:.1f}s ({len(results) / elapsed:.1f} chats/s)"
+        )
+        if results:
+            for stage in STAGES:
+                values = stages[stage]
+                self.stdout.write(
+                    f"{stage:>14}: p50 {percentile(values, 50):8.1f}  p95 {percentile(values, 95):8.1f}  "
+                    f"p99 {percentile(values, 99):8.1f}  max {max(values):8.1f}"
+                )
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(fields=["agent", "timestamp"], name="chat_message_agent_time_idx"),
+        ),
+    ]
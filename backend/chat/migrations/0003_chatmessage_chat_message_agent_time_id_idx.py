@@ -0,0 +1,21 @@
+# Generated by Django 5.0.4 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0002_chatmessage_chat_message_agent_time_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="chatmessage",
+            name="chat_message_agent_time_idx",
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(fields=["agent", "timestamp", "id"], name="chat_message_agent_time_id_idx"),
+        ),
+    ]
@@ -12,9 +12,14 @@ class ChatMessage(AbstractBaseModel):
     is_ai = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["agent", "timestamp", "id"], name="chat_message_agent_time_id_idx"),
+        ]
+
     @property
     def instance(self):
         if self.is_ai:
-            return AIMessage(content=self.text)
+            return AIMessage(content=self.message)
         else:
-            return HumanMessage(conetnt=self.text)
\ No newline at end of file
+            return HumanMessage(content=self.message)
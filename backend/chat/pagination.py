@@ -0,0 +1,116 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(message) -> str:
+    position = json.dumps([message.timestamp.isoformat(), str(message.id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """The ``(timestamp, id)`` a cursor points at."""
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = parse_datetime(timestamp)
+    except (binascii.Error, TypeError, ValueError):
+        timestamp = None
+    if timestamp is None:
+        raise exceptions.NotFound("Invalid cursor")
+    return timestamp, message_id
+
+
+class ChatHistoryPagination(BasePagination):
+    """Keyset pagination over (timestamp, id) of an agent's messages.
+
+    Without parameters the newest messages come first, and ``next`` links to
+    the ones before them (``cursor``). ``newer`` links to the messages after
+    the newest one returned (``since``), oldest first, so a client can poll
+    it for new messages. Each page is a range scan of
+    ``chat_message_agent_time_id_idx``, however far back it is.
+    """
+
+    cursor_query_param = "cursor"
+    since_query_param = "since"
+    page_size_query_param = "limit"
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.CHAT_PAGE_SIZE
+        return min(max(size, 1), settings.CHAT_PAGE_SIZE_MAX)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.since = request.query_params.get(self.since_query_param)
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        if self.since:
+            timestamp, message_id = decode_cursor(self.since)
+            # The redundant bound on timestamp alone keeps this a single index range
+            queryset = queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(id__gt=message_id), timestamp__gte=timestamp
+            ).order_by("timestamp", "id")
+        else:
+            if cursor:
+                timestamp, message_id = decode_cursor(cursor)
+                queryset = queryset.filter(
+                    Q(timestamp__lt=timestamp) | Q(id__lt=message_id), timestamp__lte=timestamp
+                )
+            queryset = queryset.order_by("-timestamp", "-id")
+
+        # One extra row tells whether there is a page after this one
+        page = list(queryset[: self.page_size + 1])
+        self.has_more = len(page) > self.page_size
+        self.page = page[: self.page_size]
+        return self.page
+
+    def _url(self, param, value):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        url = remove_query_param(url, self.since_query_param)
+        return replace_query_param(url, param, value)
+
+    def get_next_link(self):
+        if self.since or not self.has_more:
+            return None
+        return self._url(self.cursor_query_param, encode_cursor(self.page[-1]))
+
+    def get_newer_link(self):
+        if self.since:
+            newest = encode_cursor(self.page[-1]) if self.page else self.since
+        elif self.page:
+            newest = encode_cursor(self.page[0])
+        else:
+            return None
+        return self._url(self.since_query_param, newest)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "newer": self.get_newer_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "newer": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -10,4 +10,14 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ChatMessage
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class ChatHistorySerializer(serializers.ModelSerializer):
+    """What a chat window shows of a message; used for history pages."""
+
+    id = rest.HashidSerializerCharField(read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ["id", "message", "is_ai", "timestamp"]
+        read_only_fields = fields
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Queued after the last event of a run
+END = ("end", {})
+
+
+class RunCancelled(Exception):
+    """Raised inside an agent run whose client asked to stop it."""
+
+
+class ReplyStream(BaseCallbackHandler):
+    """Hands the progress of an agent run in a worker thread to an asyncio consumer.
+
+    The run puts events on a queue of ``CHAT_STREAM_BUFFER`` entries and
+    blocks while it is full, so a slow socket pauses the model instead of
+    letting tokens pile up. ``cancel`` makes the run raise ``RunCancelled``
+    at its next callback.
+    """
+
+    # Exceptions of the handler abort the run instead of being logged
+    raise_error = True
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, size: int = None) -> None:
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size or settings.CHAT_STREAM_BUFFER)
+        self.cancelled = threading.Event()
+        self._pending: Optional[Tuple[str, Dict[str, Any]]] = None
+
+    def _put(self, item) -> None:
+        self.check()
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def check(self) -> None:
+        if self.cancelled.is_set():
+            raise RunCancelled()
+
+    def close(self) -> None:
+        """Mark the end of the run; called from the worker thread."""
+        if not self.cancelled.is_set():
+            asyncio.run_coroutine_threadsafe(self.queue.put(END), self.loop).result()
+
+    def cancel(self) -> None:
+        """Stop the run; called from the event loop."""
+        self.cancelled.set()
+        # Free a run blocked on the full queue so it reaches its next callback
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> Any:
+        # Each model call of the run starts a new draft of the reply
+        self._put(("reset", {}))
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> Any:
+        if token:
+            self._put(("token", {"text": token}))
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> Any:
+        self._put(("tool", {"name": (serialized or {}).get("name")}))
+
+    async def events(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """The run's events until it ends; tokens already queued are sent as one."""
+        while True:
+            if self._pending is not None:
+                item, self._pending = self._pending, None
+            else:
+                item = await self.queue.get()
+            if item is END:
+                return
+            kind, data = item
+            if kind == "token":
+                text = [data["text"]]
+                while not self.queue.empty():
+                    following = self.queue.get_nowait()
+                    if following[0] != "token":
+                        self._pending = following
+                        break
+                    text.append(following[1]["text"])
+                data = {"text": "".join(text)}
+            yield kind, data
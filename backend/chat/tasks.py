@@ -1,11 +1,107 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
 import dramatiq
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
 
-from agents.utils.utils import get_agent
+from agents.utils.sheets import sheet_write_turn
+from agents.utils.utils import get_agent, response_text
+from common.scheduling import INTERACTIVE_QUEUE
 
 from .models import ChatMessage
+from .serializers import ChatMessageSerializer
+
+logger = logging.getLogger(__name__)
+
+# agent id -> (integration.updated_at, compiled agent), least recently used first
+_agents: "OrderedDict[str, tuple]" = OrderedDict()
+_agents_lock = threading.Lock()
+
+
+def cached_agent(agent):
+    """The compiled agent of ``agent``, rebuilt when its integration changes (e.g. a token refresh)."""
+    integration = agent.integration
+    key = str(agent.id)
+    with _agents_lock:
+        cached = _agents.get(key)
+        if cached is not None and cached[0] == integration.updated_at:
+            _agents.move_to_end(key)
+            return cached[1]
+
+    compiled = get_agent(integration, integration.credentials)
+    with _agents_lock:
+        cached = _agents.get(key)
+        if cached is not None and cached[0] > integration.updated_at:
+            # Built meanwhile from newer credentials; don't replace it with this one
+            return compiled
+        _agents[key] = (integration.updated_at, compiled)
+        _agents.move_to_end(key)
+        while len(_agents) > settings.CHAT_AGENT_CACHE_SIZE:
+            _agents.popitem(last=False)
+    return compiled
+
 
+def load_history(message):
+    """The agent's newest messages up to and including ``message``, oldest first."""
+    history = list(
+        ChatMessage.objects.filter(agent=message.agent, timestamp__lte=message.timestamp)
+        .order_by("-timestamp", "-id")[: settings.CHAT_HISTORY_MESSAGES]
+    )
+    history.reverse()
+    return history
 
-@dramatiq.actor
+
+def _ms(seconds: float) -> int:
+    return int(seconds * 1000)
+
+
+# Not retried: a retry would run the agent, and bill its model calls, again
+@dramatiq.actor(queue_name=INTERACTIVE_QUEUE, max_retries=0)
 def chat_response(message_id):
-    message = ChatMessage.objects.get(id=message_id)
-    agent = get_agent(message.agent.integration, )
\ No newline at end of file
+    """Answer a chat message and push the reply to the agent's WebSocket group.
+
+    The pushed event carries how long each stage took: waiting in the queue,
+    running the agent, saving the reply and handing it to the channel layer.
+    ``ChatConsumer`` adds the delivery time to the WebSocket. When the agent
+    fails, an error event is pushed instead.
+    """
+    started = time.time()
+    message = ChatMessage.objects.select_related("agent__integration").get(id=message_id)
+    agent = message.agent
+    timings = {"queue_ms": max(_ms(started - message.created_at.timestamp()), 0)}
+
+    t = time.perf_counter()
+    try:
+        with sheet_write_turn():
+            response = cached_agent(agent).invoke({"messages": [m.instance for m in load_history(message)]})
+    except Exception:
+        async_to_sync(get_channel_layer().group_send)(
+            f"chat_{agent.id}",
+            {"type": "chat_error", "reply_to": str(message.id), "error": "The agent could not reply"},
+        )
+        raise
+    timings["agent_ms"] = _ms(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    reply = ChatMessage.objects.create(agent=agent, message=response_text(response), is_ai=True)
+    timings["persist_ms"] = _ms(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    async_to_sync(get_channel_layer().group_send)(
+        f"chat_{agent.id}",
+        {
+            "type": "chat_message",
+            "message": ChatMessageSerializer(reply).data,
+            "reply_to": str(message.id),
+            "timings": timings,
+            "sent_at": time.time(),
+        },
+    )
+    timings["push_ms"] = _ms(time.perf_counter() - t)
+    timings["total_ms"] = _ms(time.time() - message.created_at.timestamp())
+    logger.info("Answered chat message %s: %s", message.id, timings)
+    return timings
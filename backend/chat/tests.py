@@ -1,3 +1,548 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import threading
+import time
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.sessions import CookieMiddleware
+from channels_redis.core import RedisChannelLayer, RedisLoopLayer
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from langchain_core.messages import AIMessage
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import JSONWebTokenCookieAuthMiddleware
+from accounts.models import User
+from agents.models import Agent
+from common.models import ThirdParty
+from integrations.models import Integration
+from . import tasks
+from .batching import MSGPACK, StreamBatcher
+from .layers import ShardedChannelLayer, jump_hash
+from .models import ChatMessage
+from .pagination import ChatHistoryPagination, encode_cursor
+from .routing import websocket_urlpatterns
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@override_settings(CHAT_PAGE_SIZE=2, CHAT_PAGE_SIZE_MAX=3)
+class ChatHistoryPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner@example.com", password="password")
+        cls.agent = Agent.objects.create(name="Support", user=user, thirdparty=ThirdParty.SLACK)
+        start = timezone.now() - datetime.timedelta(hours=1)
+        # Five messages, the middle three sharing a timestamp
+        cls.messages = []
+        for seconds in [0, 10, 10, 10, 20]:
+            message = ChatMessage.objects.create(agent=cls.agent, message=f"at {seconds}s")
+            ChatMessage.objects.filter(id=message.id).update(timestamp=start + datetime.timedelta(seconds=seconds))
+            cls.messages.append(message)
+
+    def paginate(self, **params):
+        paginator = ChatHistoryPagination()
+        request = Request(APIRequestFactory().get("/api/chat/history/", params))
+        queryset = ChatMessage.objects.filter(agent=self.agent)
+        page = paginator.paginate_queryset(queryset, request)
+        return [message.id for message in page], paginator.get_paginated_response([]).data
+
+    def param(self, link, name):
+        return parse_qs(urlparse(link).query)[name][0]
+
+    def test_pages_back_from_the_newest_across_timestamp_ties(self):
+        ids, data = self.paginate()
+        seen = list(ids)
+        while data["next"]:
+            ids, data = self.paginate(cursor=self.param(data["next"], "cursor"))
+            seen += ids
+        self.assertEqual(seen, [message.id for message in reversed(self.messages)])
+
+    def test_since_returns_newer_messages_oldest_first(self):
+        # Polling from the second message: the two it ties with come before the newest
+        since = encode_cursor(ChatMessage.objects.get(id=self.messages[1].id))
+        ids, data = self.paginate(since=since)
+        self.assertEqual(ids, [self.messages[2].id, self.messages[3].id])
+        self.assertIsNone(data["next"])
+
+        ids, data = self.paginate(since=self.param(data["newer"], "since"))
+        self.assertEqual(ids, [self.messages[4].id])
+
+    def test_polling_with_nothing_new_keeps_the_position(self):
+        _, data = self.paginate()
+        since = self.param(data["newer"], "since")
+        ids, data = self.paginate(since=since)
+        self.assertEqual(ids, [])
+        self.assertEqual(self.param(data["newer"], "since"), since)
+
+        newest = ChatMessage.objects.create(agent=self.agent, message="new")
+        self.assertEqual(self.paginate(since=since)[0], [newest.id])
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.paginate(limit=100)[0]), 3)
+        self.assertEqual(len(self.paginate(limit=0)[0]), 1)
+        self.assertEqual(len(self.paginate(limit="many")[0]), 2)
+
+    def test_invalid_cursor(self):
+        for cursor in ["not-base64!", "bm90IGpzb24=", "WyJub3QgYSBkYXRlIiwiMSJd"]:
+            with self.assertRaises(exceptions.NotFound):
+                self.paginate(cursor=cursor)
+
+
+class StreamBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+
+    async def send(self, events):
+        self.sent.append(events)
+
+    async def test_joins_consecutive_tokens(self):
+        batcher = StreamBatcher(self.send, window=60)
+        for kind, data in [
+            ("token", {"text": "Hel"}),
+            ("token", {"text": "lo"}),
+            ("tool", {"name": "search"}),
+            ("token", {"text": "Done"}),
+            ("token", {"text": "."}),
+        ]:
+            await batcher.add(kind, data)
+        self.assertEqual(self.sent, [])
+        await batcher.close()
+        self.assertEqual(
+            self.sent,
+            [[("token", {"text": "Hello"}), ("tool", {"name": "search"}), ("token", {"text": "Done."})]],
+        )
+
+    async def test_flushes_once_per_window(self):
+        batcher = StreamBatcher(self.send, window=0.01)
+        await batcher.add("token", {"text": "a"})
+        await batcher.add("token", {"text": "b"})
+        await asyncio.sleep(0.05)
+        await batcher.add("token", {"text": "c"})
+        await batcher.close()
+        self.assertEqual(self.sent, [[("token", {"text": "ab"})], [("token", {"text": "c"})]])
+
+    async def test_discard_drops_pending_events(self):
+        batcher = StreamBatcher(self.send, window=0.01)
+        await batcher.add("token", {"text": "a"})
+        batcher.discard()
+        await asyncio.sleep(0.05)
+        await batcher.close()
+        self.assertEqual(self.sent, [])
+
+    async def test_background_flush_error_is_raised_by_the_next_add(self):
+        async def fail(events):
+            raise ConnectionError("layer down")
+
+        batcher = StreamBatcher(fail, window=0.01)
+        await batcher.add("token", {"text": "a"})
+        await asyncio.sleep(0.05)
+        with self.assertRaises(ConnectionError):
+            await batcher.add("token", {"text": "b"})
+
+
+class JumpHashTests(SimpleTestCase):
+    def test_buckets_are_stable(self):
+        # Hosts keep their groups across releases only if these never change
+        self.assertEqual([jump_hash(key, 10) for key in range(10)], [0, 6, 6, 8, 1, 4, 9, 0, 4, 7])
+        self.assertEqual(jump_hash(2**64 - 1, 1000), 313)
+        self.assertEqual(jump_hash(123456789, 100000), 42483)
+
+    def test_adding_a_bucket_moves_about_one_in_n_keys(self):
+        keys = [key * 0x9E3779B97F4A7C15 % 2**64 for key in range(10000)]
+        before = [jump_hash(key, 4) for key in keys]
+        after = [jump_hash(key, 5) for key in keys]
+        moved = [(old, new) for old, new in zip(before, after) if old != new]
+        # Keys only move to the new bucket, and about a fifth of them do
+        self.assertTrue(all(new == 4 for _, new in moved))
+        self.assertAlmostEqual(len(moved) / len(keys), 1 / 5, delta=0.02)
+        self.assertTrue(all(1800 < after.count(bucket) < 2200 for bucket in range(5)))
+
+    def test_layer_hashes_names_onto_its_hosts(self):
+        layer = ShardedChannelLayer(hosts=[f"redis://redis-{index}" for index in range(3)])
+        self.assertEqual(layer.consistent_hash("chat_1"), layer.consistent_hash(b"chat_1"))
+        self.assertEqual({layer.consistent_hash(f"chat_{index}") for index in range(100)}, {0, 1, 2})
+        self.assertEqual(ShardedChannelLayer(hosts=["redis://redis-0"]).consistent_hash("chat_1"), 0)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class ShardedChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        servers = [fakeredis.FakeServer() for _ in range(2)]
+
+        def get_connection(loop_layer, index):
+            if index not in loop_layer._connections:
+                loop_layer._connections[index] = fakeredis.aioredis.FakeRedis(server=servers[index])
+            return loop_layer._connections[index]
+
+        patcher = mock.patch.object(RedisLoopLayer, "get_connection", get_connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.layer = ShardedChannelLayer(hosts=["redis://redis-0", "redis://redis-1"], capacity=5)
+
+    async def receive_all(self, channel, received):
+        while True:
+            received.append((await self.layer.receive(channel))["n"])
+
+    async def test_group_send_delivers_to_local_channels_in_process(self):
+        reading, idle = await self.layer.new_channel(), await self.layer.new_channel()
+        remote = "specific.other!remote"
+        for channel in [reading, idle, remote]:
+            await self.layer.group_add("chat_1", channel)
+        received = []
+        reader = asyncio.ensure_future(self.receive_all(reading, received))
+        await asyncio.sleep(0.05)
+
+        with mock.patch.object(
+            RedisChannelLayer,
+            "_map_channel_keys_to_connection",
+            autospec=True,
+            side_effect=RedisChannelLayer._map_channel_keys_to_connection,
+        ) as through_redis:
+            await self.layer.group_send("chat_1", {"type": "chat.message", "n": 1})
+        await asyncio.sleep(0.05)
+        reader.cancel()
+
+        # Only the other process's channel goes through Redis
+        self.assertEqual(through_redis.call_args.args[1], [remote])
+        self.assertEqual(received, [1])
+        self.assertEqual((await self.layer.receive(idle))["n"], 1)
+        self.assertFalse(self.layer._local)
+
+    async def test_local_channels_are_capped_at_capacity(self):
+        fast, slow = await self.layer.new_channel(), await self.layer.new_channel()
+        for channel in [fast, slow]:
+            await self.layer.group_add("chat_1", channel)
+        received = []
+        reader = asyncio.ensure_future(self.receive_all(fast, received))
+        await asyncio.sleep(0.05)
+
+        for n in range(20):
+            await self.layer.group_send("chat_1", {"type": "chat.message", "n": n})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.1)
+        reader.cancel()
+
+        self.assertEqual(received, list(range(20)))
+        # The channel nobody reads keeps the first messages and misses the rest
+        self.assertEqual([(await self.layer.receive(slow))["n"] for _ in range(5)], list(range(5)))
+        self.assertEqual(self.layer.receive_buffer[slow].qsize(), 0)
+        self.assertFalse(self.layer._local_queued)
+
+    async def test_local_receivers_get_a_serialized_copy(self):
+        channel = await self.layer.new_channel()
+        await self.layer.group_add("chat_1", channel)
+        received = []
+
+        async def receive():
+            received.append(await self.layer.receive(channel))
+
+        reader = asyncio.ensure_future(receive())
+        await asyncio.sleep(0.05)
+        message = {"type": "chat.message", "n": 1, "sources": ("a", "b"), "meta": {"seen": []}}
+        await self.layer.group_send("chat_1", message)
+        message["meta"]["seen"].append("sender")
+        await asyncio.wait_for(reader, 1)
+
+        # What a remote receiver would get: tuples come back as lists, nothing is shared
+        self.assertEqual(received[0]["sources"], ["a", "b"])
+        self.assertEqual(received[0]["meta"], {"seen": []})
+        with self.assertRaises(TypeError):
+            await self.layer.group_send("chat_1", {"type": "chat.message", "n": object()})
+
+
+class FakeAgent:
+    """Answers every conversation with ``reply``, remembering what it was given."""
+
+    def __init__(self, reply="Hello!", error=None):
+        self.reply = reply
+        self.error = error
+        self.states = []
+
+    def invoke(self, state, config=None):
+        self.states.append(state)
+        if self.error is not None:
+            raise self.error
+        return {"messages": [*state["messages"], AIMessage(content=self.reply)]}
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ChatResponseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner@example.com", password="password")
+        cls.integration = Integration.objects.create(
+            thirdparty=ThirdParty.SALESFORCE, access_token="token", refresh_token="", user=user
+        )
+        cls.agent = Agent.objects.create(
+            name="Support", user=user, thirdparty=ThirdParty.SALESFORCE, integration=cls.integration
+        )
+
+    def setUp(self):
+        tasks._agents.clear()
+        self.addCleanup(tasks._agents.clear)
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f"chat_{self.agent.id}", self.channel)
+
+    def use_agent(self, agent):
+        patcher = mock.patch("chat.tasks.get_agent", return_value=agent)
+        get_agent = patcher.start()
+        self.addCleanup(patcher.stop)
+        return get_agent
+
+    def pushed(self):
+        return async_to_sync(self.layer.receive)(self.channel)
+
+    def test_reply_is_saved_and_pushed_with_timings(self):
+        self.use_agent(FakeAgent("Hello!"))
+        message = ChatMessage.objects.create(agent=self.agent, message="Hi")
+
+        timings = tasks.chat_response.fn(message.id)
+
+        reply = ChatMessage.objects.get(agent=self.agent, is_ai=True)
+        self.assertEqual(reply.message, "Hello!")
+        event = self.pushed()
+        self.assertEqual(event["type"], "chat_message")
+        self.assertEqual(event["reply_to"], str(message.id))
+        self.assertEqual(event["message"]["message"], "Hello!")
+        for stage in ["queue_ms", "agent_ms", "persist_ms"]:
+            self.assertGreaterEqual(event["timings"][stage], 0)
+        self.assertEqual(set(timings), {"queue_ms", "agent_ms", "persist_ms", "push_ms", "total_ms"})
+
+    @override_settings(CHAT_HISTORY_MESSAGES=2)
+    def test_agent_sees_the_newest_messages_up_to_the_question(self):
+        agent = FakeAgent()
+        self.use_agent(agent)
+        for text in ["first", "second", "third"]:
+            message = ChatMessage.objects.create(agent=self.agent, message=text)
+        # Written after the question, so not part of its history
+        later = ChatMessage.objects.create(agent=self.agent, message="later")
+        ChatMessage.objects.filter(id=later.id).update(timestamp=timezone.now() + datetime.timedelta(minutes=1))
+
+        tasks.chat_response.fn(message.id)
+
+        self.assertEqual([m.content for m in agent.states[0]["messages"]], ["second", "third"])
+
+    def test_failure_pushes_an_error_and_is_not_retried(self):
+        self.use_agent(FakeAgent(error=RuntimeError("model down")))
+        message = ChatMessage.objects.create(agent=self.agent, message="Hi")
+
+        with self.assertRaises(RuntimeError):
+            tasks.chat_response.fn(message.id)
+
+        self.assertEqual(
+            self.pushed(),
+            {"type": "chat_error", "reply_to": str(message.id), "error": "The agent could not reply"},
+        )
+        self.assertFalse(ChatMessage.objects.filter(is_ai=True).exists())
+        self.assertEqual(tasks.chat_response.options["max_retries"], 0)
+
+    def test_agent_is_rebuilt_when_the_integration_changes(self):
+        get_agent = self.use_agent(FakeAgent())
+        agent = Agent.objects.select_related("integration").get(id=self.agent.id)
+        compiled = tasks.cached_agent(agent)
+        self.assertIs(tasks.cached_agent(agent), compiled)
+        self.assertEqual(get_agent.call_count, 1)
+
+        self.integration.access_token = "refreshed"
+        self.integration.save()
+        agent = Agent.objects.select_related("integration").get(id=self.agent.id)
+        tasks.cached_agent(agent)
+        self.assertEqual(get_agent.call_count, 2)
+        self.assertEqual(get_agent.call_args.args[0].access_token, "refreshed")
+
+    @override_settings(CHAT_AGENT_CACHE_SIZE=1)
+    def test_cache_keeps_the_most_recently_used_agents(self):
+        self.use_agent(FakeAgent())
+        other = Agent.objects.create(
+            name="Sales",
+            user=self.agent.user,
+            thirdparty=ThirdParty.SALESFORCE,
+            integration=Integration.objects.create(
+                thirdparty=ThirdParty.SALESFORCE, access_token="token", refresh_token="", user=self.agent.user
+            ),
+        )
+        tasks.cached_agent(self.agent)
+        tasks.cached_agent(other)
+        self.assertEqual(list(tasks._agents), [str(other.id)])
+
+
+class StreamingAgent:
+    """Streams ``tokens`` to the run's callbacks, then replies with them joined."""
+
+    def __init__(self, tokens=("Hel", "lo"), delay=0):
+        self.tokens = tokens
+        self.delay = delay
+        self.finished = threading.Event()
+
+    def invoke(self, state, config=None):
+        stream = config["callbacks"][0]
+        try:
+            stream.on_chat_model_start({}, [state["messages"]])
+            stream.on_tool_start({"name": "search"}, "")
+            for token in self.tokens:
+                time.sleep(self.delay)
+                stream.on_llm_new_token(token)
+        finally:
+            self.finished.set()
+        return {"messages": [*state["messages"], AIMessage(content="".join(self.tokens))]}
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ChatConsumerTests(TransactionTestCase):
+    # The agent runs in worker threads, which only see committed rows
+
+    def setUp(self):
+        tasks._agents.clear()
+        self.addCleanup(tasks._agents.clear)
+        self.user = User.objects.create_user("owner@example.com", password="password")
+        integration = Integration.objects.create(
+            thirdparty=ThirdParty.SALESFORCE, access_token="token", refresh_token="", user=self.user
+        )
+        self.agent = Agent.objects.create(
+            name="Support", user=self.user, thirdparty=ThirdParty.SALESFORCE, integration=integration
+        )
+        # The session part of AuthMiddlewareStack is left out: these sockets sign in with the JWT cookie
+        self.application = CookieMiddleware(JSONWebTokenCookieAuthMiddleware(URLRouter(websocket_urlpatterns)))
+
+    def use_agent(self, agent):
+        patcher = mock.patch("chat.tasks.get_agent", return_value=agent)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return agent
+
+    async def connect(self, user=None, agent=None, subprotocols=()):
+        headers = [(b"cookie", f"{settings.ACCESS_TOKEN_COOKIE}={AccessToken.for_user(user)}".encode())] if user else []
+        socket = ApplicationCommunicator(
+            self.application,
+            {
+                "type": "websocket",
+                "path": f"/ws/chat/{(agent or self.agent).id}/",
+                "headers": headers,
+                "subprotocols": list(subprotocols),
+            },
+        )
+        await socket.send_input({"type": "websocket.connect"})
+        return socket, await socket.receive_output(timeout=5)
+
+    async def close(self, socket):
+        await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+        await socket.wait(timeout=5)
+
+    async def receive(self, socket):
+        frame = await socket.receive_output(timeout=5)
+        return msgpack.unpackb(frame["bytes"]) if frame.get("bytes") is not None else json.loads(frame["text"])
+
+    async def receive_reply(self, socket):
+        """The frames sent until the agent's reply, the reply included."""
+        frames = []
+        while not frames or not (frames[-1]["type"] in ["message", "error"] and "reply_to" in frames[-1]):
+            frames.append(await self.receive(socket))
+        return frames
+
+    async def test_only_the_agents_owner_can_connect(self):
+        stranger = await database_sync_to_async(User.objects.create_user)("other@example.com", password="password")
+        for user in [None, stranger]:
+            socket, event = await self.connect(user)
+            self.assertEqual(event["type"], "websocket.close")
+            await socket.wait(timeout=5)
+
+        socket, event = await self.connect(self.user)
+        self.assertEqual(event["type"], "websocket.accept")
+        await self.close(socket)
+
+    async def test_invalid_frames_are_answered_with_an_error(self):
+        socket, _ = await self.connect(self.user)
+        for frame in [
+            {"text": "{not json"},
+            {"bytes": b"\xc1"},
+            {"text": "[1, 2]"},
+            {"text": '{"type": "ping"}'},
+            {"text": '{"message": "  "}'},
+            {"text": '{"message": 42}'},
+        ]:
+            await socket.send_input({"type": "websocket.receive", **frame})
+            self.assertEqual((await self.receive(socket))["type"], "error")
+        self.assertFalse(await database_sync_to_async(ChatMessage.objects.exists)())
+        await self.close(socket)
+
+    async def test_reply_streams_to_every_socket_of_the_agent(self):
+        self.use_agent(StreamingAgent(tokens=["Hel", "lo"]))
+        socket, _ = await self.connect(self.user)
+        watcher, event = await self.connect(self.user, subprotocols=[MSGPACK])
+        self.assertEqual(event["subprotocol"], MSGPACK)
+
+        await socket.send_input({"type": "websocket.receive", "text": json.dumps({"message": "Hi"})})
+        for frames in [await self.receive_reply(socket), await self.receive_reply(watcher)]:
+            self.assertEqual(frames[0]["type"], "message")
+            self.assertEqual(frames[0]["message"]["message"], "Hi")
+            question = frames[0]["message"]["id"]
+            self.assertEqual(frames[1:3], [
+                {"type": "reset", "reply_to": question},
+                {"type": "tool", "reply_to": question, "name": "search"},
+            ])
+            self.assertEqual("".join(frame["text"] for frame in frames if frame["type"] == "token"), "Hello")
+            self.assertEqual(frames[-1]["reply_to"], question)
+            self.assertEqual(frames[-1]["message"]["message"], "Hello")
+
+        replies = await database_sync_to_async(list)(
+            ChatMessage.objects.filter(is_ai=True).values_list("message", flat=True)
+        )
+        self.assertEqual(replies, ["Hello"])
+        await self.close(socket)
+        await self.close(watcher)
+
+    async def test_one_reply_at_a_time_and_cancel_stops_the_run(self):
+        agent = self.use_agent(StreamingAgent(tokens=["token "] * 500, delay=0.01))
+        socket, _ = await self.connect(self.user)
+        await socket.send_input({"type": "websocket.receive", "text": json.dumps({"message": "Hi"})})
+        self.assertEqual((await self.receive(socket))["type"], "message")
+        self.assertEqual((await self.receive(socket))["type"], "reset")
+
+        await socket.send_input({"type": "websocket.receive", "text": json.dumps({"message": "Again"})})
+        frame = await self.receive(socket)
+        while frame["type"] != "error":
+            frame = await self.receive(socket)
+        self.assertEqual(frame["error"], "A reply is still being written")
+
+        await socket.send_input({"type": "websocket.receive", "text": json.dumps({"type": "cancel"})})
+        while (await self.receive(socket))["type"] != "cancelled":
+            pass
+        # The worker thread stops at its next token instead of finishing the reply
+        self.assertTrue(await asyncio.to_thread(agent.finished.wait, 5))
+        self.assertTrue(await socket.receive_nothing(timeout=0.2))
+        self.assertFalse(await database_sync_to_async(ChatMessage.objects.filter(is_ai=True).exists)())
+        await self.close(socket)
+
+    async def test_failed_run_is_reported_to_the_socket(self):
+        self.use_agent(FakeAgent(error=RuntimeError("model down")))
+        socket, _ = await self.connect(self.user)
+        await socket.send_input({"type": "websocket.receive", "text": json.dumps({"message": "Hi"})})
+
+        with self.assertLogs("chat.consumers", "ERROR"):
+            frames = await self.receive_reply(socket)
+        self.assertEqual(frames[-1]["error"], "The agent could not reply")
+
+        # The socket can ask again afterwards
+        self.use_agent(StreamingAgent())
+        tasks._agents.clear()
+        await socket.send_input({"type": "websocket.receive", "text": json.dumps({"message": "Hi again"})})
+        self.assertEqual((await self.receive_reply(socket))[-1]["message"]["message"], "Hello")
+        await self.close(socket)
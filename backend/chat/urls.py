@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = "chat"
+
+urlpatterns = [
+    path("connections/", views.connections, name="connections"),
+    path("metrics/", views.metrics, name="metrics"),
+]
@@ -1,3 +1,43 @@
-from django.shortcuts import render
+import os
 
-# Create your views here.
+import prometheus_client as prom
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .consumers import ChatConsumer
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def metrics(request):
+    """Prometheus metrics, e.g. the chat WebSocket frame rate and sizes and the tenant queue wait."""
+    registry = prom.REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Server and dramatiq worker processes write their values to files; report their total
+        from prometheus_client import multiprocess
+
+        registry = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(prom.generate_latest(registry), content_type=prom.CONTENT_TYPE_LATEST)
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def connections(request):
+    """Open chat sockets of this process, and per channel-layer shard.
+
+    With ``?agent=<id>`` (repeatable), the live members of those agents'
+    groups are returned instead of the shard summary.
+    """
+    layer = get_channel_layer()
+    data = {"process": {"connections": ChatConsumer.connections}}
+    agents = request.query_params.getlist("agent")
+    if agents:
+        data["groups"] = async_to_sync(layer.group_sizes)([f"chat_{agent}" for agent in agents])
+    else:
+        data["shards"] = async_to_sync(layer.shard_stats)("chat_*")
+    return Response(data)
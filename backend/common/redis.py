@@ -0,0 +1,10 @@
+import functools
+
+import redis
+from django.conf import settings
+
+
+@functools.lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """Process-wide Redis client for locks, coalescing keys and small caches."""
+    return redis.Redis.from_url(settings.REDIS_URL)
@@ -0,0 +1,171 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import prometheus_client as prom
+from django.conf import settings
+from dramatiq.middleware import Middleware, SkipMessage
+
+from .redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Queue for work a person is waiting on (agent replies, chat); background
+# syncs stay on "default", so a separate worker pool keeps replies moving
+# while a backlog of syncs drains.
+INTERACTIVE_QUEUE = "interactive"
+
+# On the default registry, like the chat metrics. Web and worker processes
+# started with the same PROMETHEUS_MULTIPROC_DIR share their values, so
+# /api/chat/metrics/ reports the workers' queue wait as well.
+QUEUE_WAIT = prom.Histogram(
+    "dramatiq_tenant_queue_wait_seconds",
+    "Time messages waited before a worker started them, per tenant.",
+    ["queue_name", "tenant"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf")),
+)
+
+SLOTS_KEY = "fair:{queue}:slots:{tenant}"
+ACTIVE_KEY = "fair:{queue}:active"
+WEIGHTS_KEY = "fair:{queue}:weights"
+
+# Takes a slot for a message unless its tenant already holds its share.
+#
+# A tenant's share of the lane's ``capacity`` is proportional to its weight
+# among the tenants active on the lane, never below one slot and never above
+# the tenant's hard limit. A tenant stays active while it holds slots or was
+# turned away recently, so a lone tenant can use the whole lane and a noisy
+# one shrinks to its share as soon as anyone else shows up.
+#
+# Slots are leases: a worker that dies without releasing frees its slot
+# once the lease runs out.
+ACQUIRE_SCRIPT = """
+local slots, active, weights = KEYS[1], KEYS[2], KEYS[3]
+local now, lease, member, tenant = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], ARGV[4]
+local weight, capacity, hard_limit, linger = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7]), tonumber(ARGV[8])
+
+redis.call('ZREMRANGEBYSCORE', slots, '-inf', now)
+redis.call('ZREMRANGEBYSCORE', active, '-inf', now)
+redis.call('HSET', weights, tenant, weight)
+local current = tonumber(redis.call('ZSCORE', active, tenant) or 0)
+if current < now + linger then
+    redis.call('ZADD', active, now + linger, tenant)
+end
+
+local total = 0
+for _, name in ipairs(redis.call('ZRANGE', active, 0, -1)) do
+    total = total + tonumber(redis.call('HGET', weights, name) or 1)
+end
+local limit = math.min(hard_limit, math.max(1, math.floor(capacity * weight / total)))
+if redis.call('ZCARD', slots) >= limit then
+    return 0
+end
+
+redis.call('ZADD', slots, now + lease, member)
+redis.call('PEXPIRE', slots, lease)
+if current < now + lease then
+    redis.call('ZADD', active, now + lease, tenant)
+end
+redis.call('PEXPIRE', active, lease)
+redis.call('PEXPIRE', weights, lease)
+return limit
+"""
+
+# Frees a slot; a tenant left without running messages only lingers as active.
+RELEASE_SCRIPT = """
+local slots, active = KEYS[1], KEYS[2]
+redis.call('ZREM', slots, ARGV[1])
+if redis.call('ZCARD', slots) == 0 then
+    redis.call('ZADD', active, 'XX', tonumber(ARGV[2]) + tonumber(ARGV[3]), ARGV[4])
+end
+"""
+
+
+def tenant_limit(tenant: str) -> int:
+    """Hard cap on a tenant's concurrent messages, by kind of tenant."""
+    kind = tenant.split(":", 1)[0]
+    if kind == "team":
+        return settings.TENANT_TEAM_CONCURRENCY
+    return settings.TENANT_USER_CONCURRENCY
+
+
+def tenant_weight(tenant: str) -> int:
+    return max(int(settings.TENANT_WEIGHTS.get(tenant, 1)), 1)
+
+
+class TenantFairness(Middleware):
+    """Shares worker slots fairly between the tenants of each queue.
+
+    Messages sent with a ``tenant`` option (``"team:<slack team>"`` or
+    ``"user:<user id>"``) need a slot of that tenant before they run. When
+    the tenant is at its weighted share, the message is put back on the
+    queue after ``TENANT_DEFER_MS`` instead of occupying a worker, so one
+    workspace flooding the queue cannot starve the others. Messages without
+    a tenant are not affected.
+
+    The time from enqueue to start, deferrals included, is exported per
+    queue and tenant as ``dramatiq_tenant_queue_wait_seconds``, served by
+    ``/api/chat/metrics/``.
+    """
+
+    def __init__(self) -> None:
+        self._acquire_script = None
+        self._release_script = None
+        self._held: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, broker, message, tenant: str) -> int:
+        if self._acquire_script is None:
+            self._acquire_script = get_redis().register_script(ACQUIRE_SCRIPT)
+        queue = message.queue_name
+        actor = broker.get_actor(message.actor_name)
+        lease = message.options.get("time_limit") or actor.options.get("time_limit") or 600000
+        return self._acquire_script(
+            keys=[
+                SLOTS_KEY.format(queue=queue, tenant=tenant),
+                ACTIVE_KEY.format(queue=queue),
+                WEIGHTS_KEY.format(queue=queue),
+            ],
+            args=[
+                int(time.time() * 1000),
+                lease + 30000,
+                message.message_id,
+                tenant,
+                tenant_weight(tenant),
+                settings.TENANT_LANE_CAPACITY,
+                tenant_limit(tenant),
+                settings.TENANT_ACTIVE_LINGER_MS,
+            ],
+        )
+
+    def before_process_message(self, broker, message):
+        tenant: Optional[str] = message.options.get("tenant")
+        if not tenant:
+            return
+        if not self._acquire(broker, message, tenant):
+            delay = settings.TENANT_DEFER_MS + random.randint(0, settings.TENANT_DEFER_MS)
+            logger.debug("Deferring %s of %s by %dms, tenant at its share", message.message_id, tenant, delay)
+            broker.enqueue(message, delay=delay)
+            raise SkipMessage()
+
+        with self._lock:
+            self._held[message.message_id] = (message.queue_name, tenant)
+        waited = max(time.time() - message.message_timestamp / 1000, 0)
+        QUEUE_WAIT.labels(message.queue_name, tenant).observe(waited)
+
+    def after_process_message(self, broker, message, *, result=None, exception=None):
+        with self._lock:
+            held = self._held.pop(message.message_id, None)
+        if held is None:
+            return
+        queue, tenant = held
+        if self._release_script is None:
+            self._release_script = get_redis().register_script(RELEASE_SCRIPT)
+        self._release_script(
+            keys=[SLOTS_KEY.format(queue=queue, tenant=tenant), ACTIVE_KEY.format(queue=queue)],
+            args=[message.message_id, int(time.time() * 1000), settings.TENANT_ACTIVE_LINGER_MS, tenant],
+        )
+
+    after_skip_message = after_process_message
@@ -1,3 +1,98 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import dramatiq
+from django.test import SimpleTestCase, override_settings
+from dramatiq.brokers.stub import StubBroker
+from dramatiq.middleware import SkipMessage
+from prometheus_client import REGISTRY
+
+from .scheduling import INTERACTIVE_QUEUE, TenantFairness
+
+try:
+    # The scripts run on fakeredis' Lua runtime
+    import fakeredis
+    import lupa  # noqa: F401
+except ImportError:
+    fakeredis = None
+
+
+@skipUnless(fakeredis, "fakeredis[lua] is not installed")
+@override_settings(
+    TENANT_LANE_CAPACITY=4,
+    TENANT_TEAM_CONCURRENCY=4,
+    TENANT_USER_CONCURRENCY=2,
+    TENANT_WEIGHTS={},
+    TENANT_DEFER_MS=100,
+    TENANT_ACTIVE_LINGER_MS=5000,
+)
+class TenantFairnessTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("common.scheduling.get_redis", return_value=fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.broker = StubBroker()
+        self.actor = dramatiq.actor(lambda: None, actor_name="reply", queue_name=INTERACTIVE_QUEUE, broker=self.broker)
+        self.middleware = TenantFairness()
+
+    def message(self, tenant=None):
+        return self.actor.message_with_options(tenant=tenant) if tenant else self.actor.message()
+
+    def acquire(self, tenant):
+        return self.middleware._acquire(self.broker, self.message(tenant), tenant)
+
+    def test_lone_tenant_runs_up_to_its_hard_limit(self):
+        self.assertEqual([self.acquire("user:1") for _ in range(3)], [2, 2, 0])
+
+    def test_lone_team_uses_the_whole_lane(self):
+        self.assertEqual([self.acquire("team:T1") for _ in range(5)], [4, 4, 4, 4, 0])
+
+    def test_share_shrinks_when_another_tenant_shows_up(self):
+        self.assertEqual([self.acquire("team:T1") for _ in range(4)], [4, 4, 4, 4])
+        # T2 gets half the lane while T1 still holds all of it, and T1 gets nothing more
+        self.assertEqual(self.acquire("team:T2"), 2)
+        self.assertEqual(self.acquire("team:T1"), 0)
+
+    @override_settings(TENANT_WEIGHTS={"team:T1": 3})
+    def test_share_follows_weights(self):
+        self.assertEqual(self.acquire("team:T2"), 4)
+        self.assertEqual(self.acquire("team:T1"), 3)
+        self.assertEqual(self.acquire("team:T2"), 0)
+
+    def test_release_frees_the_slot(self):
+        messages = [self.message("user:1") for _ in range(2)]
+        for message in messages:
+            self.middleware.before_process_message(self.broker, message)
+        self.assertEqual(self.acquire("user:1"), 0)
+
+        self.middleware.after_process_message(self.broker, messages[0])
+        self.assertEqual(self.acquire("user:1"), 2)
+        # Releasing twice does not free another slot
+        self.middleware.after_process_message(self.broker, messages[0])
+        self.assertEqual(self.acquire("user:1"), 0)
+
+    def test_defers_a_tenant_at_its_share(self):
+        before = REGISTRY.get_sample_value(
+            "dramatiq_tenant_queue_wait_seconds_count", {"queue_name": INTERACTIVE_QUEUE, "tenant": "user:1"}
+        )
+        for _ in range(2):
+            self.middleware.before_process_message(self.broker, self.message("user:1"))
+        after = REGISTRY.get_sample_value(
+            "dramatiq_tenant_queue_wait_seconds_count", {"queue_name": INTERACTIVE_QUEUE, "tenant": "user:1"}
+        )
+        self.assertEqual(after - (before or 0), 2)
+
+        deferred = self.message("user:1")
+        with mock.patch.object(self.broker, "enqueue") as enqueue:
+            with self.assertRaises(SkipMessage):
+                self.middleware.before_process_message(self.broker, deferred)
+        enqueue.assert_called_once()
+        self.assertGreaterEqual(enqueue.call_args.kwargs["delay"], 100)
+        # A skipped message held no slot, so nothing is released
+        self.middleware.after_skip_message(self.broker, deferred)
+        self.assertEqual(self.acquire("user:1"), 0)
+
+    def test_messages_without_a_tenant_are_not_limited(self):
+        with mock.patch.object(self.middleware, "_acquire") as acquire:
+            self.middleware.before_process_message(self.broker, self.message())
+            self.middleware.after_process_message(self.broker, self.message())
+        acquire.assert_not_called()
@@ -270,6 +270,23 @@ SLACK_CLIENT_SECRET = env("SLACK_CLIENT_SECRET", default="")
 SLACK_SIGNING_SECRET = env("SLACK_SIGNING_SECRET", default="")
 SLACK_EVENT_URL = urljoin(DOMAIN_URL, "/api/integrations/event")
 SLACK_STATE_EXPIRATION_SECONDS = env("SLACK_STATE_EXPIRATION_SECONDS", default=3000)
+SLACK_EVENT_DEDUPE_TTL = env.int("SLACK_EVENT_DEDUPE_TTL", default=60 * 60)  # outlives the ~6 min retry window
+SLACK_BOT_CACHE_TTL = env.int("SLACK_BOT_CACHE_TTL", default=5 * 60)  # seconds an identity is reused
+SLACK_POOL_SIZE = env.int("SLACK_POOL_SIZE", default=10)  # keep-alive connections per host
+SLACK_TIMEOUT = env.int("SLACK_TIMEOUT", default=30)  # seconds
+SLACK_MAX_RETRIES = env.int("SLACK_MAX_RETRIES", default=2)  # retries of rate-limited calls
+SLACK_CLIENT_CACHE_SIZE = env.int("SLACK_CLIENT_CACHE_SIZE", default=1000)  # bot tokens with a cached client
+SLACK_PROGRESSIVE_REPLIES = env.bool("SLACK_PROGRESSIVE_REPLIES", default=True)  # edit a placeholder as the agent works
+SLACK_UPDATE_INTERVAL = env.float("SLACK_UPDATE_INTERVAL", default=1.2)  # seconds between chat.update calls (tier 3: 50/min)
+SLACK_THREAD_HISTORY = env.int("SLACK_THREAD_HISTORY", default=20)  # turns of a thread given to the agent
+SLACK_THREAD_CACHE_TTL = env.int("SLACK_THREAD_CACHE_TTL", default=24 * 60 * 60)  # seconds an idle thread's tail stays in Redis
+
+# WHATSAPP CONFIGURATIONS
+WHATSAPP_API_VERSION = env("WHATSAPP_API_VERSION", default="v19.0")
+WHATSAPP_RATE_LIMIT = env.int("WHATSAPP_RATE_LIMIT", default=80)  # messages per second per business number
+WHATSAPP_POOL_SIZE = env.int("WHATSAPP_POOL_SIZE", default=10)  # keep-alive connections to the Graph API
+WHATSAPP_TIMEOUT = env.int("WHATSAPP_TIMEOUT", default=10)  # seconds
+WHATSAPP_MAX_RETRIES = env.int("WHATSAPP_MAX_RETRIES", default=4)  # in-process retries of throttled or failed sends
 
 # GOOGLE CONFIGURATIONS
 GOOGLE_WORKSPACE_SCOPE = [
@@ -292,6 +309,20 @@ GOOGLE_AUTH_URI = env("GOOGLE_AUTH_URI", default="")
 GOOGLE_TOKEN_URI = env("GOOGLE_TOKEN_URI", default="")
 INTEGRATION_REDIRECT_URI = urljoin(DOMAIN_URL, "/api/agents/callback")
 GOOGLE_API_KEY = env("GOOGLE_API_KEY", default="")  # For GeminiAPI 
+DRIVE_UPLOAD_CHUNK_SIZE = env.int("DRIVE_UPLOAD_CHUNK_SIZE", default=8 * 1024 * 1024)  # Multiple of 256 KiB
+DRIVE_UPLOAD_MAX_WORKERS = env.int("DRIVE_UPLOAD_MAX_WORKERS", default=4)
+DRIVE_UPLOAD_NUM_RETRIES = env.int("DRIVE_UPLOAD_NUM_RETRIES", default=3)
+SHEETS_READ_BLOCK_ROWS = env.int("SHEETS_READ_BLOCK_ROWS", default=5000)  # Rows per values.get page
+SHEETS_INLINE_ROWS = env.int("SHEETS_INLINE_ROWS", default=50)  # Larger ranges are summarized
+SHEETS_PREVIEW_ROWS = env.int("SHEETS_PREVIEW_ROWS", default=5)
+SHEETS_WRITE_BUFFER_MAX_CELLS = env.int("SHEETS_WRITE_BUFFER_MAX_CELLS", default=50000)  # Flush early past this
+FORMS_PAGE_SIZE = env.int("FORMS_PAGE_SIZE", default=5000)  # Max allowed by responses.list
+FORMS_SUMMARY_TOP_VALUES = env.int("FORMS_SUMMARY_TOP_VALUES", default=50)  # Answer counts kept per question
+FORMS_WATCH_TOPIC = env("FORMS_WATCH_TOPIC", default="")  # projects/<project>/topics/<topic>
+FORMS_PUSH_TOKEN = env("FORMS_PUSH_TOKEN", default="")  # ?token= on the Pub/Sub push endpoint URL
+FORMS_EVENT_DEBOUNCE = env.int("FORMS_EVENT_DEBOUNCE", default=5)  # seconds to collect a burst of events
+FORMS_EVENT_COALESCE_TTL = env.int("FORMS_EVENT_COALESCE_TTL", default=10 * 60)
+FORMS_WATCH_RENEW_MARGIN = env.int("FORMS_WATCH_RENEW_MARGIN", default=24 * 60 * 60)  # renew this early
 
 
 # ZOHO CONFIGURATION
@@ -302,15 +333,34 @@ ZOHO_AUTH_URI = env("ZOHO_AUTH_URI", default="")
 ZOHO_TOKEN_URI = env("ZOHO_TOKEN_URI", default="")
 
 
+# SALESFORCE CONFIGURATIONS
+SALESFORCE_SCOPE = env.list("SALESFORCE_SCOPE", default=["api", "refresh_token"])
+SALESFORCE_CLIENT_ID = env("SALESFORCE_CLIENT_ID", default="")
+SALESFORCE_CLIENT_SECRET = env("SALESFORCE_CLIENT_SECRET", default="")
+SALESFORCE_API_VERSION = env("SALESFORCE_API_VERSION", default="59.0")
+SALESFORCE_BULK_THRESHOLD = env.int("SALESFORCE_BULK_THRESHOLD", default=50000)  # rows; 0 disables Bulk API 2.0
+SALESFORCE_BULK_PAGE_SIZE = env.int("SALESFORCE_BULK_PAGE_SIZE", default=50000)  # rows per Bulk result download
+SALESFORCE_SUMMARY_MAX_ROWS = env.int("SALESFORCE_SUMMARY_MAX_ROWS", default=25)  # rows per section in agent summaries
+KNOWLEDGE_SYNC_INTERVAL = env.int("KNOWLEDGE_SYNC_INTERVAL", default=60 * 60)  # seconds
+KNOWLEDGE_LANGUAGE = env("KNOWLEDGE_LANGUAGE", default="en_US")  # "" mirrors every language
+KNOWLEDGE_EMBEDDINGS = env.bool("KNOWLEDGE_EMBEDDINGS", default=False)  # uses RETRIEVAL_EMBEDDING_FUNCTION
+KNOWLEDGE_MIN_SIMILARITY = env.float("KNOWLEDGE_MIN_SIMILARITY", default=0.3)  # vector-only hits below are misses
+
+
+# REDIS CONFIGURATIONS
+REDIS_URL = env("REDIS_URL", default="redis://127.0.0.1:6379")
+
+
 # DRAMATIQ CONFIGURATIONS
 DRAMATIQ_BROKER = {
     "BROKER": "dramatiq.brokers.redis.RedisBroker",
     "OPTIONS": {
-        "connection_pool": redis.ConnectionPool.from_url(env("REDIS_URL", default="redis://127.0.0.1:6379")),
+        "connection_pool": redis.ConnectionPool.from_url(REDIS_URL),
     },
     "MIDDLEWARE": [
         # "dramatiq.middleware.Prometheus",
         "dramatiq.middleware.AgeLimit",
+        "common.scheduling.TenantFairness",
         "dramatiq.middleware.TimeLimit",
         "dramatiq.middleware.Callbacks",
         "dramatiq.middleware.Retries",
@@ -319,6 +369,14 @@ DRAMATIQ_BROKER = {
     ]
 }
 
+# Tenant fair scheduling of agent replies and chat (common.scheduling)
+TENANT_LANE_CAPACITY = env.int("TENANT_LANE_CAPACITY", default=8)  # worker threads serving a queue
+TENANT_TEAM_CONCURRENCY = env.int("TENANT_TEAM_CONCURRENCY", default=4)  # running messages per Slack workspace
+TENANT_USER_CONCURRENCY = env.int("TENANT_USER_CONCURRENCY", default=2)  # running messages per user
+TENANT_WEIGHTS = env.dict("TENANT_WEIGHTS", cast={"value": int}, default={})  # e.g. "team:T0123=3;user:42=2"
+TENANT_DEFER_MS = env.int("TENANT_DEFER_MS", default=250)  # back-off of a message whose tenant is at its share
+TENANT_ACTIVE_LINGER_MS = env.int("TENANT_ACTIVE_LINGER_MS", default=5000)  # a turned-away tenant keeps its share this long
+
 # Defines which database should be used to persist Task objects when the
 # AdminMiddleware is enabled.  The default value is "default".
 DRAMATIQ_TASKS_DATABASE = "default"
@@ -336,16 +394,49 @@ DRAMATIQ_TASKS_DATABASE = "default"
 # OPENAI CONFIGURATION
 OPENAI_API_KEY = env("OPENAI_API_KEY", default="")
 
+# AGENT CHECKPOINT CONFIGURATIONS
+AGENT_CHECKPOINT_MAX_MESSAGES = env.int("AGENT_CHECKPOINT_MAX_MESSAGES", default=40)  # kept in a compacted state; 0 keeps all
+AGENT_CHECKPOINT_MAX_AGE_DAYS = env.int("AGENT_CHECKPOINT_MAX_AGE_DAYS", default=30)  # idle conversations pruned after
+
 # CHANNELS CONFIGURATIONS
+# Group and channel keys are spread over these by consistent hashing; every ASGI node must list the same hosts
+CHANNEL_REDIS_HOSTS = env.list("CHANNEL_REDIS_HOSTS", default=[REDIS_URL])
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'chat.layers.ShardedChannelLayer',
         'CONFIG': {
-            'hosts': [('127.0.0.1', 6379)],
+            'hosts': CHANNEL_REDIS_HOSTS,
         },
     },
 }
 
 
+# CHAT CONFIGURATIONS
+CHAT_HISTORY_MESSAGES = env.int("CHAT_HISTORY_MESSAGES", default=20)  # earlier messages given to the agent
+CHAT_AGENT_CACHE_SIZE = env.int("CHAT_AGENT_CACHE_SIZE", default=64)  # compiled agents kept per worker process
+CHAT_PAGE_SIZE = env.int("CHAT_PAGE_SIZE", default=50)  # messages per history page
+CHAT_PAGE_SIZE_MAX = env.int("CHAT_PAGE_SIZE_MAX", default=200)  # largest ?limit= accepted
+CHAT_STREAM_BUFFER = env.int("CHAT_STREAM_BUFFER", default=64)  # streamed chunks queued before the agent waits for the socket
+CHAT_STREAM_WINDOW_MS = env.int("CHAT_STREAM_WINDOW_MS", default=30)  # streamed events coalesced into one group send
+
+
+# RETRIEVAL CONFIGURATIONS
+RETRIEVAL_INDEX_DIR = env("RETRIEVAL_INDEX_DIR", default=str(BASE_DIR / "indexes"))
+# Dotted path to a callable mapping a list of texts to an (n, dim) array,
+# e.g. "agents.utils.retrieval.hashing_embedding" for a local embedding.
+RETRIEVAL_EMBEDDING_FUNCTION = env(
+    "RETRIEVAL_EMBEDDING_FUNCTION", default="agents.utils.retrieval.openai_embedding"
+)
+RETRIEVAL_EMBEDDING_MODEL = env("RETRIEVAL_EMBEDDING_MODEL", default="text-embedding-3-small")
+RETRIEVAL_EMBEDDING_DIM = env.int("RETRIEVAL_EMBEDDING_DIM", default=384)  # hashing_embedding only
+RETRIEVAL_CHUNK_SIZE = env.int("RETRIEVAL_CHUNK_SIZE", default=1000)
+RETRIEVAL_CHUNK_OVERLAP = env.int("RETRIEVAL_CHUNK_OVERLAP", default=150)
+RETRIEVAL_IVF_THRESHOLD = env.int("RETRIEVAL_IVF_THRESHOLD", default=200000)  # 0 disables IVF
+RETRIEVAL_IVF_NPROBE = env.int("RETRIEVAL_IVF_NPROBE", default=8)
+RETRIEVAL_SYNC_INTERVAL = env.int("RETRIEVAL_SYNC_INTERVAL", default=15 * 60)  # seconds
+RETRIEVAL_COMPACT_THRESHOLD = env.float("RETRIEVAL_COMPACT_THRESHOLD", default=0.25)  # dead fraction of rows
+RETRIEVAL_LOCK_TIMEOUT = env.int("RETRIEVAL_LOCK_TIMEOUT", default=30 * 60)  # seconds
+
+
 # NOTIFICATION CONFIGURATIONS
 NOTIFICATIONS_STRATEGIES = ["InAppNotificationStrategy"]
\ No newline at end of file
@@ -11,6 +11,7 @@ urlpatterns = [
                 path("", include("common.urls", namespace="common")),
                 path("", include("accounts.urls", namespace="accounts")),
                 path("agents/", include("agents.urls", namespace="agents")),
+                path("chat/", include("chat.urls", namespace="chat")),
                 path("integrations/", include("integrations.urls", namespace="integrations")),
                 path("notifications/", include("notifications.urls", namespace="notifications")),
             ]
@@ -0,0 +1,62 @@
+import logging
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from common.redis import get_redis
+
+from .models import Bot
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "slack:bot-identity:generation"
+
+
+class BotIdentity(NamedTuple):
+    id: str
+    agent_id: Optional[str]
+    integration_id: str
+    team_id: str
+    user_id: str
+    bot_id: Optional[str]
+    bot_user_id: Optional[str]
+    access_token: Optional[str]
+
+
+# (team_id, user_id) -> (cached at, generation, identity or None for "no such bot")
+_identities: Dict[Tuple[str, str], Tuple[float, bytes, Optional[BotIdentity]]] = {}
+
+
+def _generation() -> bytes:
+    return get_redis().get(GENERATION_KEY) or b"0"
+
+
+def get_bot_identity(team_id: str, user_id: str) -> Optional[BotIdentity]:
+    """The installed bot for a workspace user, from the process cache when possible.
+
+    Entries, including misses, are reused until any process saves or deletes
+    a ``Bot`` (which bumps a generation counter in Redis) or until
+    ``SLACK_BOT_CACHE_TTL`` passes. A hit costs one Redis GET instead of a
+    database query.
+    """
+    key = (team_id, user_id)
+    generation = _generation()
+    cached = _identities.get(key)
+    if cached is not None and cached[1] == generation and time.monotonic() - cached[0] < settings.SLACK_BOT_CACHE_TTL:
+        return cached[2]
+
+    bot = (
+        Bot.objects.filter(team_id=team_id, user_id=user_id)
+        .values_list(*BotIdentity._fields)
+        .first()
+    )
+    identity = BotIdentity(*bot) if bot is not None else None
+    _identities[key] = (time.monotonic(), generation, identity)
+    return identity
+
+
+def invalidate_bot_identity(team_id: Optional[str], user_id: Optional[str]):
+    """Forget a bot here and make every other process reload bots on next use."""
+    _identities.pop((team_id, user_id), None)
+    get_redis().incr(GENERATION_KEY)
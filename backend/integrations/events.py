@@ -0,0 +1,57 @@
+import logging
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from common.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+SEEN_EVENT_KEY = "slack:event:{event_id}"
+# Events after which the stored tokens of a workspace are no longer valid.
+LIFECYCLE_EVENTS = ("app_uninstalled", "tokens_revoked")
+
+
+def claim_slack_event(event_id: str, retry_num: Optional[str] = None) -> bool:
+    """Record the first delivery of ``event_id``; False for every later one.
+
+    Slack retries an event that isn't acknowledged within 3 seconds (then
+    after a minute and after five), each time with the same ``event_id`` and
+    an ``X-Slack-Retry-Num`` header. Whichever delivery sets the key first
+    queues the event; the key outlives Slack's retry window.
+    """
+    claimed = bool(
+        get_redis().set(
+            SEEN_EVENT_KEY.format(event_id=event_id),
+            retry_num or 0,
+            nx=True,
+            ex=settings.SLACK_EVENT_DEDUPE_TTL,
+        )
+    )
+    if not claimed:
+        logger.info("Dropping Slack retry %s of event %s", retry_num, event_id)
+    elif retry_num:
+        # The original delivery never got as far as claiming the event.
+        logger.warning("Processing Slack event %s from retry %s", event_id, retry_num)
+    return claimed
+
+
+def is_actionable_event(data: Dict) -> bool:
+    """Cheap checks that need no lookups: a user message in a channel, not a bot's own."""
+    event = data.get("event") or {}
+    return (
+        data.get("type") == "event_callback"
+        and bool(data.get("event_id"))
+        and bool(event.get("user"))
+        and bool(event.get("channel"))
+        and not event.get("bot_id")
+        and event.get("subtype") not in ("bot_message", "message_changed", "message_deleted")
+    )
+
+
+def is_lifecycle_event(data: Dict) -> bool:
+    return (
+        data.get("type") == "event_callback"
+        and bool(data.get("event_id"))
+        and (data.get("event") or {}).get("type") in LIFECYCLE_EVENTS
+    )
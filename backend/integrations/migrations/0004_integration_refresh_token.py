@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0003_alter_integration_thirdparty"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="integration",
+            name="refresh_token",
+            field=models.CharField(default="", max_length=255),
+            preserve_default=False,
+        ),
+    ]
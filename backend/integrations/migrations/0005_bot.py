@@ -0,0 +1,80 @@
+# Generated by Django 5.0.4 on 2026-10-19 14:05
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0009_knowledgearticle_knowledgesyncstate"),
+        ("integrations", "0004_integration_refresh_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Bot",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("app_id", models.CharField(blank=True, max_length=32, null=True)),
+                ("enterprise_id", models.CharField(blank=True, max_length=32, null=True)),
+                ("enterprise_name", models.CharField(blank=True, max_length=255, null=True)),
+                ("enterprise_url", models.URLField(blank=True, null=True)),
+                ("team_id", models.CharField(blank=True, max_length=32, null=True)),
+                ("team_name", models.CharField(blank=True, max_length=255, null=True)),
+                (
+                    "user_id",
+                    models.CharField(
+                        blank=True,
+                        help_text="Slack user who installed the app",
+                        max_length=32,
+                        null=True,
+                    ),
+                ),
+                ("bot_id", models.CharField(blank=True, max_length=32, null=True)),
+                ("bot_user_id", models.CharField(blank=True, max_length=32, null=True)),
+                ("access_token", models.CharField(blank=True, max_length=255, null=True)),
+                ("bot_scopes", models.TextField(blank=True, null=True)),
+                ("user_token", models.CharField(blank=True, max_length=255, null=True)),
+                ("user_scopes", models.TextField(blank=True, null=True)),
+                ("token_type", models.CharField(blank=True, max_length=32, null=True)),
+                ("is_enterprise_install", models.BooleanField(blank=True, null=True)),
+                ("whatsapp_id", models.CharField(blank=True, max_length=32, null=True)),
+                ("whatsapp_name", models.CharField(blank=True, max_length=255, null=True)),
+                ("whatsapp_recipient_id", models.CharField(blank=True, max_length=32, null=True)),
+                (
+                    "agent",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="bots",
+                        to="agents.agent",
+                    ),
+                ),
+                (
+                    "integration",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="bots",
+                        to="integrations.integration",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0005_bot"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="bot",
+            constraint=models.UniqueConstraint(
+                fields=("team_id", "user_id"), name="integrations_bot_team_user_unique"
+            ),
+        ),
+    ]
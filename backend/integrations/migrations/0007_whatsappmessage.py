@@ -0,0 +1,67 @@
+# Generated by Django 5.0.4 on 2026-10-19 16:40
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0006_bot_integrations_bot_team_user_unique"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WhatsAppMessage",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "phone_number_id",
+                    models.CharField(help_text="Business number the message is sent from", max_length=32),
+                ),
+                ("recipient", models.CharField(max_length=32)),
+                ("body", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("queued", "Queued"), ("sent", "Sent"), ("failed", "Failed")],
+                        default="queued",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("wamid", models.CharField(blank=True, max_length=128, null=True)),
+                ("error", models.TextField(blank=True, null=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "latency_ms",
+                    models.PositiveIntegerField(blank=True, help_text="From queued to accepted by the API", null=True),
+                ),
+                (
+                    "bot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="whatsapp_messages",
+                        to="integrations.bot",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["status", "created_at"], name="integrations_wa_status_idx"),
+                ],
+            },
+        ),
+    ]
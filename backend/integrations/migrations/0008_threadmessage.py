@@ -0,0 +1,61 @@
+# Generated by Django 5.0.4 on 2026-10-19 17:25
+
+import django.db.models.deletion
+import hashid_field.field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0007_whatsappmessage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ThreadMessage",
+            fields=[
+                (
+                    "id",
+                    hashid_field.field.HashidAutoField(
+                        alphabet="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890",
+                        min_length=7,
+                        prefix="",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("channel", models.CharField(max_length=32)),
+                (
+                    "thread_ts",
+                    models.CharField(help_text="ts of the thread's parent message", max_length=32),
+                ),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[("user", "User"), ("assistant", "Assistant")], max_length=10
+                    ),
+                ),
+                ("content", models.TextField()),
+                ("user_id", models.CharField(blank=True, max_length=32, null=True)),
+                (
+                    "bot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="thread_messages",
+                        to="integrations.bot",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["bot", "channel", "thread_ts", "created_at"],
+                        name="integrations_thread_turns_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
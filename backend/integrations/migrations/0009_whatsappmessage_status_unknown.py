@@ -0,0 +1,22 @@
+# Generated by Django 5.0.4 on 2026-10-19 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0008_threadmessage"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="whatsappmessage",
+            name="status",
+            field=models.CharField(
+                choices=[("queued", "Queued"), ("sent", "Sent"), ("failed", "Failed"), ("unknown", "Unknown")],
+                default="queued",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0009_whatsappmessage_status_unknown"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="integration",
+            name="is_workspace",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from django.db import models
 
+from google.oauth2.credentials import Credentials
+
 from common.models import AbstractBaseModel, ThirdParty
 from accounts.models import User
 
@@ -19,7 +21,7 @@ class Integration(AbstractBaseModel):
     expires_at = models.DateTimeField(null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
-    def refresh_token(self):
+    def refresh_access_token(self):
         if self.expires_at and datetime.now() > self.expires_at:
             if self.thirdparty == ThirdParty.GOOGLE_WORKSPACE:
                 token_url = settings.GOOGLE_TOKEN_URI
@@ -42,8 +44,110 @@ class Integration(AbstractBaseModel):
             else:
                 raise Exception("Failed to refresh token")
 
+    @property
+    def credentials(self) -> Credentials:
+        return Credentials(
+            token=self.access_token,
+            refresh_token=self.refresh_token,
+            token_uri=settings.GOOGLE_TOKEN_URI,
+            client_id=settings.GOOGLE_CLIENT_ID,
+            client_secret=settings.GOOGLE_CLIENT_SECRET,
+            scopes=self.scopes,
+        )
+
     @property
     def scopes(self):
         if self.thirdparty == ThirdParty.GOOGLE_WORKSPACE:
-            return settings.GOOGLE_WORKSPACE_SCOPES
+            return settings.GOOGLE_WORKSPACE_SCOPE
         return []
+
+
+class Bot(AbstractBaseModel):
+    """A chat app installation: the Slack workspace install or WhatsApp number an agent answers on."""
+
+    agent = models.ForeignKey(
+        "agents.Agent", on_delete=models.CASCADE, related_name="bots", null=True, blank=True
+    )
+    integration = models.ForeignKey(Integration, on_delete=models.CASCADE, related_name="bots")
+    app_id = models.CharField(max_length=32, null=True, blank=True)
+    enterprise_id = models.CharField(max_length=32, null=True, blank=True)
+    enterprise_name = models.CharField(max_length=255, null=True, blank=True)
+    enterprise_url = models.URLField(null=True, blank=True)
+    team_id = models.CharField(max_length=32, null=True, blank=True)
+    team_name = models.CharField(max_length=255, null=True, blank=True)
+    user_id = models.CharField(max_length=32, null=True, blank=True, help_text="Slack user who installed the app")
+    bot_id = models.CharField(max_length=32, null=True, blank=True)
+    bot_user_id = models.CharField(max_length=32, null=True, blank=True)
+    access_token = models.CharField(max_length=255, null=True, blank=True)
+    bot_scopes = models.TextField(null=True, blank=True)
+    user_token = models.CharField(max_length=255, null=True, blank=True)
+    user_scopes = models.TextField(null=True, blank=True)
+    token_type = models.CharField(max_length=32, null=True, blank=True)
+    is_enterprise_install = models.BooleanField(null=True, blank=True)
+    whatsapp_id = models.CharField(max_length=32, null=True, blank=True)
+    whatsapp_name = models.CharField(max_length=255, null=True, blank=True)
+    whatsapp_recipient_id = models.CharField(max_length=32, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # One installation per workspace installer; also serves the event lookup.
+            models.UniqueConstraint(fields=["team_id", "user_id"], name="integrations_bot_team_user_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.team_name or self.whatsapp_name or self.id}"
+
+
+class WhatsAppMessage(AbstractBaseModel):
+    """An outbound WhatsApp message and the outcome of delivering it."""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+        # Sent, but the API's response never arrived: it may have been delivered
+        UNKNOWN = "unknown", "Unknown"
+
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name="whatsapp_messages")
+    phone_number_id = models.CharField(max_length=32, help_text="Business number the message is sent from")
+    recipient = models.CharField(max_length=32)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    wamid = models.CharField(max_length=128, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True, help_text="From queued to accepted by the API")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="integrations_wa_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient} ({self.status})"
+
+
+class ThreadMessage(AbstractBaseModel):
+    """One turn of a conversation a bot had in a Slack thread."""
+
+    class Role(models.TextChoices):
+        USER = "user", "User"
+        ASSISTANT = "assistant", "Assistant"
+
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name="thread_messages")
+    channel = models.CharField(max_length=32)
+    thread_ts = models.CharField(max_length=32, help_text="ts of the thread's parent message")
+    role = models.CharField(max_length=10, choices=Role.choices)
+    content = models.TextField()
+    user_id = models.CharField(max_length=32, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["bot", "channel", "thread_ts", "created_at"], name="integrations_thread_turns_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.channel}/{self.thread_ts} {self.role}"
@@ -0,0 +1,127 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = ":mag: Working on it..."
+CURSOR = " :writing_hand:"
+# Slack caps a section block's text at 3000 characters and a message at 50 blocks.
+SECTION_LIMIT = 3000
+MAX_BLOCKS = 50
+
+
+def mrkdwn_blocks(text: str) -> List[Dict]:
+    sections = [text[i : i + SECTION_LIMIT] for i in range(0, len(text), SECTION_LIMIT)] or [" "]
+    return [
+        {"type": "section", "text": {"type": "mrkdwn", "text": section}}
+        for section in sections[:MAX_BLOCKS]
+    ]
+
+
+class SlackProgressReporter:
+    """A reply that is posted at once and then edited as the agent works.
+
+    ``start`` posts a placeholder in the thread. Streamed tokens and tool
+    progress only change local state; a background thread sends
+    ``chat.update`` at most once every ``min_interval`` seconds with whatever
+    accumulated in between, so a fast token stream costs a handful of calls,
+    stays inside the method's rate limit tier, and never waits on Slack.
+    ``finish`` stops the thread and always sends the final text.
+    """
+
+    def __init__(self, client, channel: str, thread_ts: Optional[str], min_interval: float = None) -> None:
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.min_interval = settings.SLACK_UPDATE_INTERVAL if min_interval is None else min_interval
+        self.ts: Optional[str] = None
+        self.text = ""
+        self.status = ""
+        self.updates = 0
+        self._sent = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._updater: Optional[threading.Thread] = None
+
+    def start(self, text: str = PLACEHOLDER) -> str:
+        result = self.client.chat_postMessage(channel=self.channel, thread_ts=self.thread_ts, text=text)
+        self.ts = result["ts"]
+        self._sent = text
+        self._updater = threading.Thread(target=self._run, name=f"slack-progress-{self.ts}", daemon=True)
+        self._updater.start()
+        return self.ts
+
+    def _render(self) -> str:
+        if self.text:
+            return self.text + CURSOR
+        return self.status or PLACEHOLDER
+
+    def _update(self, text: str):
+        self.client.chat_update(channel=self.channel, ts=self.ts, text=text, blocks=mrkdwn_blocks(text))
+        self._sent = text
+        self.updates += 1
+
+    def _run(self):
+        while not self._done.wait(self.min_interval):
+            with self._lock:
+                text = self._render()
+            if text == self._sent:
+                continue
+            try:
+                self._update(text)
+            except Exception:
+                # A dropped progress update is harmless; the final one carries everything.
+                logger.exception("Progress update of Slack message %s failed", self.ts)
+
+    def reset(self):
+        """Start a new generation: intermediate LLM turns are replaced, not appended."""
+        with self._lock:
+            self.text = ""
+
+    def add_token(self, token: str):
+        with self._lock:
+            self.text += token
+
+    def set_status(self, status: str):
+        with self._lock:
+            self.status = status
+
+    def finish(self, text: str):
+        self._done.set()
+        if self._updater is not None:
+            # Lets an update in flight land before the final text replaces it
+            self._updater.join()
+        if self.ts is None:
+            self.client.chat_postMessage(
+                channel=self.channel, thread_ts=self.thread_ts, text=text, blocks=mrkdwn_blocks(text)
+            )
+        else:
+            self._update(text)
+
+
+class SlackProgressCallbackHandler(BaseCallbackHandler):
+    """Feeds LLM tokens and tool activity of an agent run into a ``SlackProgressReporter``."""
+
+    def __init__(self, reporter: SlackProgressReporter) -> None:
+        self.reporter = reporter
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> Any:
+        self.reporter.reset()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> Any:
+        self.reporter.reset()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> Any:
+        if token:
+            self.reporter.add_token(token)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> Any:
+        name = (serialized or {}).get("name") or "a tool"
+        self.reporter.set_status(f":hammer_and_wrench: Using `{name}`...")
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> Any:
+        self.reporter.set_status(":thinking_face: Thinking...")
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bots import invalidate_bot_identity
+from .models import Bot
+
+
+@receiver(post_save, sender=Bot)
+@receiver(post_delete, sender=Bot)
+def invalidate_bot(sender, instance: Bot, **kwargs):
+    # Covers reinstalls (new token and bot ids) and uninstalls alike.
+    invalidate_bot_identity(instance.team_id, instance.user_id)
@@ -0,0 +1,316 @@
+import asyncio
+import http.client
+import io
+import logging
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+from urllib.request import Request
+
+import aiohttp
+import urllib3
+from django.conf import settings
+from slack_sdk import WebClient
+from slack_sdk.http_retry.async_handler import AsyncRetryHandler
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from slack_sdk.web.async_client import AsyncWebClient
+
+logger = logging.getLogger(__name__)
+
+# Requests per minute allowed for each Web API rate limit tier.
+TIER_LIMITS = {1: 1, 2: 20, 3: 50, 4: 100}
+# chat.postMessage is "special": about one message per second per channel,
+# which we budget per token.
+POST_MESSAGE_LIMIT = 60
+METHOD_TIERS = {
+    "auth.test": 4,
+    "chat.update": 3,
+    "chat.delete": 3,
+    "chat.getPermalink": 4,
+    "conversations.history": 3,
+    "conversations.replies": 3,
+    "conversations.info": 3,
+    "conversations.list": 2,
+    "reactions.add": 3,
+    "users.info": 4,
+    "users.list": 2,
+    "files.upload": 2,
+}
+DEFAULT_TIER = 3
+
+
+def method_limit(method: str) -> int:
+    if method == "chat.postMessage":
+        return POST_MESSAGE_LIMIT
+    return TIER_LIMITS[METHOD_TIERS.get(method, DEFAULT_TIER)]
+
+
+class SlackMetrics:
+    """Process-wide counters for Slack traffic, exposed by ``slack_metrics()``."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.counters)
+
+
+metrics = SlackMetrics()
+
+
+class MethodThrottle:
+    """Paces calls per (token, method) to the method's tier limit.
+
+    Each key gets a token bucket holding a minute's worth of calls, so bursts
+    up to the limit go straight through and sustained traffic is spread out.
+    A 429 ``Retry-After`` blocks the key for that long, so other calls made by
+    this process with the same token wait instead of being rejected too.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # key -> (available calls, last refill time, blocked until)
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float, float]] = {}
+
+    def reserve(self, token: Optional[str], method: str) -> float:
+        """Take a call for ``method``; returns the seconds to wait before making it."""
+        limit = method_limit(method)
+        rate = limit / 60.0
+        key = (token or "", method)
+        with self._lock:
+            now = time.monotonic()
+            available, refilled, blocked_until = self._buckets.get(key, (float(limit), now, 0.0))
+            available = min(limit, available + (now - refilled) * rate)
+            start = max(now, blocked_until)
+            wait = start - now
+            if available < 1:
+                wait = max(wait, (1 - available) / rate)
+            self._buckets[key] = (available - 1, now, blocked_until)
+        if wait > 0:
+            metrics.incr("throttled_calls")
+            metrics.incr("throttle_wait_seconds", wait)
+        return wait
+
+    def block(self, token: Optional[str], method: str, seconds: float):
+        key = (token or "", method)
+        with self._lock:
+            now = time.monotonic()
+            available, refilled, blocked_until = self._buckets.get(key, (0.0, now, 0.0))
+            self._buckets[key] = (0.0, now, max(blocked_until, now + seconds))
+        metrics.incr("rate_limited")
+        metrics.incr("retry_after_seconds", seconds)
+
+    def forget(self, token: Optional[str]):
+        """Drop the buckets of ``token`` that don't hold back a call."""
+        token = token or ""
+        with self._lock:
+            now = time.monotonic()
+            for key in [key for key in self._buckets if key[0] == token]:
+                available, refilled, blocked_until = self._buckets[key]
+                if available >= 0 and blocked_until <= now:
+                    del self._buckets[key]
+
+
+throttle = MethodThrottle()
+
+
+def _retry_after(headers) -> float:
+    for name, value in headers.items():
+        if name.lower() == "retry-after":
+            value = value[0] if isinstance(value, (list, tuple)) else value
+            return float(value)
+    return 1.0
+
+
+def _token(headers) -> Optional[str]:
+    for name, value in headers.items():
+        if name.lower() == "authorization":
+            value = value[0] if isinstance(value, (list, tuple)) else value
+            return value.split(" ", 1)[-1]
+    return None
+
+
+def _method(url: str) -> str:
+    return urlparse(url).path.rsplit("/", 1)[-1]
+
+
+class TierRateLimitRetryHandler(RateLimitErrorRetryHandler):
+    """Retries 429s after ``Retry-After``, and holds back the method for everyone else."""
+
+    def prepare_for_next_attempt(self, *, state, request, response=None, error=None):
+        if response is not None:
+            throttle.block(_token(request.headers), _method(request.url), _retry_after(response.headers))
+        super().prepare_for_next_attempt(state=state, request=request, response=response, error=error)
+
+
+class AsyncTierRateLimitRetryHandler(AsyncRetryHandler):
+    async def _can_retry_async(self, *, state, request, response=None, error=None) -> bool:
+        return response is not None and response.status_code == 429
+
+    async def prepare_for_next_attempt_async(self, *, state, request, response=None, error=None):
+        if response is None:
+            raise error
+        seconds = _retry_after(response.headers)
+        throttle.block(_token(request.headers), _method(request.url), seconds)
+        state.next_attempt_requested = True
+        await asyncio.sleep(seconds)
+        state.increment_current_attempt()
+
+
+_pool = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=settings.SLACK_POOL_SIZE,
+    block=False,
+    retries=False,
+)
+_hosts = set()
+
+
+class PooledWebClient(WebClient):
+    """A ``WebClient`` that sends over a shared keep-alive connection pool.
+
+    The stock client opens a new TLS connection through ``urllib`` for every
+    call. This one hands the prepared request to a process-wide ``urllib3``
+    pool instead, and paces calls per method tier before sending them.
+
+    The sync ``WebClient`` has no public transport hook, so this overrides
+    ``_perform_urllib_http_request_internal``; requirements pin slack_sdk to
+    the release it was written against.
+    """
+
+    def api_call(self, api_method: str, **kwargs):
+        wait = throttle.reserve(self.token, api_method)
+        if wait > 0:
+            time.sleep(wait)
+        return super().api_call(api_method, **kwargs)
+
+    def _perform_urllib_http_request_internal(self, url: str, req: Request) -> Dict:
+        if self.proxy is not None or not url.lower().startswith("http"):
+            return super()._perform_urllib_http_request_internal(url, req)
+        parsed = urlparse(url)
+        _hosts.add(f"{parsed.scheme}://{parsed.netloc}")
+        metrics.incr("requests")
+        resp = _pool.request(
+            req.get_method(),
+            url,
+            body=req.data,
+            headers=dict(req.header_items()),
+            timeout=self.timeout,
+            redirect=False,
+        )
+        # The same header type urllib returns, which the base client expects.
+        headers = http.client.parse_headers(
+            io.BytesIO(
+                "".join(f"{name}: {value}\r\n" for name, value in resp.headers.items()).encode("latin-1")
+                + b"\r\n"
+            )
+        )
+        if resp.status >= 400:
+            # The base client handles 429s and other errors from urllib's HTTPError.
+            raise HTTPError(url, resp.status, resp.reason, headers, io.BytesIO(resp.data))
+        if headers.get_content_type() == "application/gzip":
+            return {"status": resp.status, "headers": headers, "body": resp.data}
+        charset = headers.get_content_charset() or "utf-8"
+        return {"status": resp.status, "headers": headers, "body": resp.data.decode(charset)}
+
+
+class PooledAsyncWebClient(AsyncWebClient):
+    async def api_call(self, api_method: str, **kwargs):
+        wait = throttle.reserve(self.token, api_method)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return await super().api_call(api_method, **kwargs)
+
+
+# token -> client, least recently used first. Clients share _pool and hold no
+# connections of their own, so an evicted one only takes its throttle state.
+_clients: "OrderedDict[str, PooledWebClient]" = OrderedDict()
+_clients_lock = threading.Lock()
+# One aiohttp session per event loop; sessions can't be shared across loops.
+_async_sessions = weakref.WeakKeyDictionary()
+
+
+def get_web_client(token: str) -> PooledWebClient:
+    """The shared client for a bot token.
+
+    Up to ``SLACK_CLIENT_CACHE_SIZE`` clients are kept; the least recently
+    used one is dropped to make room for a new token.
+    """
+    with _clients_lock:
+        client = _clients.get(token)
+        if client is not None:
+            _clients.move_to_end(token)
+            return client
+        client = PooledWebClient(
+            token=token,
+            timeout=settings.SLACK_TIMEOUT,
+            retry_handlers=[TierRateLimitRetryHandler(max_retry_count=settings.SLACK_MAX_RETRIES)],
+        )
+        _clients[token] = client
+        while len(_clients) > settings.SLACK_CLIENT_CACHE_SIZE:
+            evicted, _ = _clients.popitem(last=False)
+            throttle.forget(evicted)
+    return client
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    async def on_create(session, context, params):
+        metrics.incr("async_connections_opened")
+
+    async def on_reuse(session, context, params):
+        metrics.incr("async_connections_reused")
+
+    async def on_request(session, context, params):
+        metrics.incr("async_requests")
+
+    config = aiohttp.TraceConfig()
+    config.on_connection_create_end.append(on_create)
+    config.on_connection_reuseconn.append(on_reuse)
+    config.on_request_start.append(on_request)
+    return config
+
+
+def get_async_web_client(token: str) -> PooledAsyncWebClient:
+    """An async client for a bot token, sharing a keep-alive session per event loop."""
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.SLACK_POOL_SIZE, keepalive_timeout=60),
+            trace_configs=[_trace_config()],
+        )
+        _async_sessions[loop] = session
+    return PooledAsyncWebClient(
+        token=token,
+        session=session,
+        timeout=settings.SLACK_TIMEOUT,
+        retry_handlers=[AsyncTierRateLimitRetryHandler(max_retry_count=settings.SLACK_MAX_RETRIES)],
+    )
+
+
+async def close_async_web_clients():
+    """Close the running loop's shared session; call before the loop shuts down."""
+    session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def slack_metrics() -> Dict[str, float]:
+    """Request, connection reuse and throttling counters for this process."""
+    stats = metrics.snapshot()
+    opened = sum(_pool.connection_from_url(url).num_connections for url in _hosts)
+    requests = stats.get("requests", 0)
+    stats["connections_opened"] = opened
+    stats["connections_reused"] = max(requests - opened, 0)
+    stats["clients"] = len(_clients)
+    return stats
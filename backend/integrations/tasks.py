@@ -1,10 +1,21 @@
+import logging
+
 import dramatiq
-from slack_sdk import WebClient
+from django.conf import settings
+from django.utils import timezone
 
-from agents.utils.utils import get_agent
-from agents.models import Message
+from agents.utils.checkpoints import DjangoCheckpointSaver, count_tokens
+from agents.utils.sheets import sheet_write_turn
+from agents.utils.utils import get_agent, response_text
 from common.models import ThirdParty
-from .models import Agent, Bot
+from common.scheduling import INTERACTIVE_QUEUE
+from .models import Bot, WhatsAppMessage
+from .progress import SlackProgressCallbackHandler, SlackProgressReporter, mrkdwn_blocks
+from .slack import get_web_client, slack_metrics
+from .threads import ThreadStore
+from .whatsapp import WhatsAppClient, WhatsAppDeliveryUnknown, WhatsAppError
+
+logger = logging.getLogger(__name__)
 
 
 @dramatiq.actor
@@ -12,52 +23,124 @@ def add(a, b):
     return a + b
 
 
-@dramatiq.actor
+@dramatiq.actor(queue_name=INTERACTIVE_QUEUE)
+def process_slack_event(data):
+    """Resolve the bot an acknowledged Slack event is for and queue the agent's reply."""
+    # utils imports the actors defined here.
+    from .events import is_lifecycle_event
+    from .utils import process_slack_lifecycle_event, process_slack_message
+
+    if is_lifecycle_event(data):
+        process_slack_lifecycle_event(data)
+    else:
+        process_slack_message(data)
+
+
+# Not retried: the user sees the failure in the thread and can ask again
+@dramatiq.actor(queue_name=INTERACTIVE_QUEUE, max_retries=0)
 def agent_response(bot_id, channel, thread_ts, bot_token, query, user_id=None):
+    bot = Bot.objects.select_related("agent__integration", "integration").get(id=bot_id)
+    is_slack = bot.integration.thirdparty == ThirdParty.SLACK
+
+    reporter = None
+    config = {}
+    if is_slack and settings.SLACK_PROGRESSIVE_REPLIES:
+        # Post a placeholder right away and edit it as the agent streams
+        reporter = SlackProgressReporter(get_web_client(bot_token), channel, thread_ts)
+        reporter.start()
+        config["callbacks"] = [SlackProgressCallbackHandler(reporter)]
+
     try:
-        print("Creating agent")
-        bot = Bot.objects.select_related(
-            "agent__integration", "bot__agent__integration"
-        ).get(id=bot_id)
-        print(bot.integration.thirdparty)
-        agent_executor = get_agent(bot.agent.integration, bot.agent.credentials)
-
-        messages = Message.objects.all()[:5]
-        message_list = []
-
-        for msg in messages:
-            if msg.is_ai:
-                message_list.append(("ai", msg.text))
-            else:
-                message_list.append(("user", msg.text))
-
-        message_list.append(("user", query))
-        print(message_list)
-
-        response = agent_executor.invoke({"input": message_list})
-
-        print(response)
-
-        output_text = response[
-            "output"
-        ]  # Adjust according to your actual response structure
-
-        if user_id:
-            output_text = f"<@{user_id}> {output_text}"
-
-        if bot.integration.thirdparty == ThirdParty.SLACK:
-            # Update the initial message with the response and use mrkdown block section to return the response in Slack markdown format
-            # client.chat_update(
-            client = WebClient(token=bot_token)
-            client.chat_postMessage(
-                channel=channel,
-                ts=thread_ts,
-                text=output_text,
-                blocks=[
-                    {"type": "section", "text": {"type": "mrkdwn", "text": output_text}}
-                ],
+        # The graph resumes from the thread's saved state
+        checkpointer = DjangoCheckpointSaver()
+        agent_executor = get_agent(bot.agent.integration, bot.agent.integration.credentials, checkpointer=checkpointer)
+
+        thread = ThreadStore(bot.id, channel, thread_ts)
+        config["configurable"] = {"thread_id": thread.key}
+        history = thread.load()
+        if checkpointer.get_tuple(config) is None:
+            # A new conversation, or its state was pruned: seed it from the stored turns
+            message_list = history + [("user", query)]
+        else:
+            message_list = [("user", query)]
+            logger.info(
+                "Resumed %s from its checkpoint, %d prompt tokens of history not replayed",
+                thread.key,
+                count_tokens(history),
             )
-        print("Message sent successfully")
-        return response
+
+        with sheet_write_turn():
+            response = agent_executor.invoke({"messages": message_list}, config=config)
+    except Exception:
+        if reporter is not None:
+            try:
+                reporter.finish(":warning: Sorry, something went wrong while working on this.")
+            except Exception:
+                # Don't let the notice hide the agent's own error
+                logger.exception("Could not report the failure in %s", channel)
+        raise
+
+    output_text = response_text(response)
+    thread.append([("user", query), ("assistant", output_text)], user_id=user_id)
+    checkpointer.compact(thread.key)
+
+    if user_id:
+        output_text = f"<@{user_id}> {output_text}"
+
+    if reporter is not None:
+        reporter.finish(output_text)
+        logger.info("Replied in %s with %d progress updates", channel, reporter.updates)
+    elif is_slack:
+        # Post the response in the thread and use mrkdown block section to return the response in Slack markdown format
+        client = get_web_client(bot_token)
+        client.chat_postMessage(
+            channel=channel,
+            thread_ts=thread_ts,
+            text=output_text,
+            blocks=mrkdwn_blocks(output_text),
+        )
+    logger.debug("Slack client metrics: %s", slack_metrics())
+    return response
+
+
+# Throttled and failed sends are retried by the client, so the actor isn't
+@dramatiq.actor(queue_name=INTERACTIVE_QUEUE, max_retries=0)
+def send_whatsapp_message(message_id):
+    """Deliver a queued WhatsApp message, recording its latency or failure."""
+    message = WhatsAppMessage.objects.select_related("bot").get(id=message_id)
+    if message.status != WhatsAppMessage.Status.QUEUED:
+        return
+
+    client = WhatsAppClient(message.bot.access_token, message.phone_number_id)
+    try:
+        result = client.send_text(message.recipient, message.body)
+    except WhatsAppDeliveryUnknown as e:
+        # Sending it again could deliver it twice
+        message.attempts += client.attempts
+        message.error = str(e)
+        message.status = WhatsAppMessage.Status.UNKNOWN
+        message.save(update_fields=["attempts", "error", "status", "updated_at"])
+        logger.warning("WhatsApp message %s timed out, it may or may not have been delivered", message.id)
+        return
     except Exception as e:
-        raise e
+        # Not retried, so the row must not stay QUEUED
+        message.attempts += client.attempts
+        message.error = str(e) or type(e).__name__
+        message.status = WhatsAppMessage.Status.FAILED
+        message.save(update_fields=["attempts", "error", "status", "updated_at"])
+        if isinstance(e, WhatsAppError):
+            logger.error("WhatsApp message %s failed after %d attempts: %s", message.id, message.attempts, e)
+        else:
+            logger.exception("WhatsApp message %s failed", message.id)
+        return
+
+    message.attempts += client.attempts
+    message.status = WhatsAppMessage.Status.SENT
+    message.wamid = (result.get("messages") or [{}])[0].get("id")
+    message.sent_at = timezone.now()
+    message.latency_ms = int((message.sent_at - message.created_at).total_seconds() * 1000)
+    message.error = None
+    message.save(update_fields=["attempts", "status", "wamid", "sent_at", "latency_ms", "error", "updated_at"])
+    logger.info(
+        "WhatsApp message %s sent in %dms (%d attempts)", message.id, message.latency_ms, message.attempts
+    )
@@ -1,3 +1,495 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+import urllib3
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from slack_sdk.signature import SignatureVerifier
+
+from accounts.models import User
+from agents.models import Agent
+from common.models import ThirdParty
+from . import slack, tasks
+from .bots import GENERATION_KEY, _identities, get_bot_identity
+from .events import claim_slack_event
+from .models import Bot, Integration, ThreadMessage, WhatsAppMessage
+from .progress import CURSOR, PLACEHOLDER, SlackProgressReporter
+from .threads import ThreadStore
+from .whatsapp import WhatsAppClient, WhatsAppDeliveryUnknown, WhatsAppError
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+try:
+    # ThreadStore primes the cache with a Lua script
+    import lupa  # noqa: F401
+except ImportError:
+    lupa = None
+
+
+class FakeSlackClient:
+    """Records the calls a reporter makes, optionally taking ``delay`` seconds per update."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.posted = []
+        self.updated = []
+
+    def chat_postMessage(self, **kwargs):
+        self.posted.append(kwargs)
+        return {"ts": "1.1"}
+
+    def chat_update(self, **kwargs):
+        time.sleep(self.delay)
+        self.updated.append(kwargs["text"])
+
+
+class SlackProgressReporterTests(SimpleTestCase):
+    def test_updates_are_coalesced_in_the_background(self):
+        client = FakeSlackClient()
+        reporter = SlackProgressReporter(client, "C1", "1.0", min_interval=0.05)
+        reporter.start()
+        self.assertEqual(client.posted[0]["text"], PLACEHOLDER)
+        for token in ["Hel", "lo", " there"]:
+            reporter.add_token(token)
+        time.sleep(0.2)
+        reporter.finish("Hello there")
+        self.assertEqual(client.updated, ["Hello there" + CURSOR, "Hello there"])
+        self.assertEqual(reporter.updates, 2)
+
+    def test_tokens_do_not_wait_for_slack(self):
+        client = FakeSlackClient(delay=0.3)
+        reporter = SlackProgressReporter(client, "C1", "1.0", min_interval=0.01)
+        reporter.start()
+        reporter.set_status("Searching")
+        time.sleep(0.05)
+        # An update is in flight now; adding tokens must not block on it
+        started = time.monotonic()
+        for _ in range(100):
+            reporter.add_token("x")
+        self.assertLess(time.monotonic() - started, 0.1)
+        reporter.finish("done")
+        self.assertEqual(client.updated[-1], "done")
+
+    def test_failed_progress_update_is_dropped(self):
+        client = FakeSlackClient()
+        reporter = SlackProgressReporter(client, "C1", "1.0", min_interval=0.01)
+        reporter.start()
+        with mock.patch.object(client, "chat_update", side_effect=ConnectionError("down")) as update:
+            with self.assertLogs("integrations.progress", "ERROR"):
+                reporter.add_token("partial")
+                time.sleep(0.05)
+        self.assertTrue(update.called)
+        reporter.finish("full")
+        self.assertEqual(client.updated, ["full"])
+
+    def test_finish_without_placeholder_posts(self):
+        client = FakeSlackClient()
+        reporter = SlackProgressReporter(client, "C1", "1.0")
+        reporter.finish("answer")
+        self.assertEqual(client.posted[0]["text"], "answer")
+        self.assertEqual(client.updated, [])
+        self.assertFalse(any(thread.name.startswith("slack-progress") for thread in threading.enumerate()))
+
+
+@override_settings(SLACK_PROGRESSIVE_REPLIES=True)
+class AgentResponseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner@example.com", password="password")
+        integration = Integration.objects.create(
+            thirdparty=ThirdParty.SLACK, access_token="xoxb", refresh_token="", user=user
+        )
+        agent = Agent.objects.create(name="Support", user=user, thirdparty=ThirdParty.SLACK, integration=integration)
+        cls.bot = Bot.objects.create(integration=integration, agent=agent, team_id="T1", user_id="U1")
+
+    def run_failing_agent(self, reporter):
+        with mock.patch.object(tasks, "SlackProgressReporter", return_value=reporter), mock.patch.object(
+            tasks, "get_web_client"
+        ), mock.patch.object(tasks, "get_agent", side_effect=RuntimeError("build failed")):
+            with self.assertRaisesMessage(RuntimeError, "build failed"):
+                tasks.agent_response.fn(self.bot.id, "C1", "1.0", "xoxb", "hello")
+
+    def test_failure_finishes_the_placeholder(self):
+        reporter = mock.Mock()
+        self.run_failing_agent(reporter)
+        self.assertIn("went wrong", reporter.finish.call_args.args[0])
+
+    def test_failed_notice_keeps_the_agent_error(self):
+        reporter = mock.Mock()
+        reporter.finish.side_effect = ConnectionError("slack down")
+        with self.assertLogs("integrations.tasks", "ERROR"):
+            self.run_failing_agent(reporter)
+
+    def test_not_retried(self):
+        self.assertEqual(tasks.agent_response.options["max_retries"], 0)
+
+
+def graph_response(status, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body or {}).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+@mock.patch("integrations.whatsapp.time.sleep")
+@mock.patch("integrations.whatsapp.acquire_send_slot")
+class WhatsAppClientTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("integrations.whatsapp.logger")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, *outcomes):
+        session = mock.Mock()
+        session.post.side_effect = outcomes
+        client = WhatsAppClient("token", "100", max_retries=2, session=session)
+        try:
+            return client.send_text("15550001", "hi")
+        finally:
+            self.attempts = client.attempts
+
+    def test_retries_throttling_after_retry_after(self, slot, sleep):
+        result = self.send(
+            graph_response(429, headers={"Retry-After": "3"}),
+            graph_response(200, {"messages": [{"id": "wamid.1"}]}),
+        )
+        self.assertEqual(result["messages"][0]["id"], "wamid.1")
+        self.assertEqual(self.attempts, 2)
+        sleep.assert_called_once_with(3.0)
+
+    def test_retries_throttling_error_codes(self, slot, sleep):
+        self.send(graph_response(400, {"error": {"code": 131056}}), graph_response(200))
+        self.assertEqual(self.attempts, 2)
+
+    def test_does_not_retry_client_errors(self, slot, sleep):
+        with self.assertRaises(WhatsAppError) as raised:
+            self.send(graph_response(400, {"error": {"code": 100, "message": "Invalid parameter"}}))
+        self.assertEqual((raised.exception.code, raised.exception.retryable), (100, False))
+        self.assertEqual(self.attempts, 1)
+
+    def test_retries_connection_failures(self, slot, sleep):
+        self.send(requests.ConnectTimeout(), requests.ConnectionError(), graph_response(200))
+        self.assertEqual(self.attempts, 3)
+
+    def test_read_timeout_is_not_sent_again(self, slot, sleep):
+        with self.assertRaises(WhatsAppDeliveryUnknown):
+            self.send(requests.ReadTimeout(), graph_response(200))
+        self.assertEqual(self.attempts, 1)
+
+    def test_gives_up_after_max_retries(self, slot, sleep):
+        with self.assertRaises(WhatsAppError) as raised:
+            self.send(*[graph_response(503)] * 3)
+        self.assertTrue(raised.exception.retryable)
+        self.assertEqual(self.attempts, 3)
+
+
+class SendWhatsAppMessageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner@example.com", password="password")
+        integration = Integration.objects.create(
+            thirdparty=ThirdParty.SLACK, is_chat_app=True, access_token="token", refresh_token="", user=user
+        )
+        cls.bot = Bot.objects.create(integration=integration, access_token="token", whatsapp_id="100")
+
+    def deliver(self, outcome):
+        message = WhatsAppMessage.objects.create(bot=self.bot, phone_number_id="100", recipient="15550001", body="hi")
+        with mock.patch.object(WhatsAppClient, "send_text", side_effect=[outcome]), mock.patch.object(
+            tasks.send_whatsapp_message, "send"
+        ) as requeue:
+            tasks.send_whatsapp_message.fn(message.id)
+        requeue.assert_not_called()
+        message.refresh_from_db()
+        return message
+
+    def test_sent(self):
+        message = self.deliver({"messages": [{"id": "wamid.1"}]})
+        self.assertEqual((message.status, message.wamid), (WhatsAppMessage.Status.SENT, "wamid.1"))
+        self.assertIsNotNone(message.latency_ms)
+
+    def test_timeout_marks_delivery_unknown(self):
+        with self.assertLogs("integrations.tasks", "WARNING"):
+            message = self.deliver(WhatsAppDeliveryUnknown("Read timed out"))
+        self.assertEqual(message.status, WhatsAppMessage.Status.UNKNOWN)
+
+    def test_exhausted_retries_fail_without_requeueing(self):
+        with self.assertLogs("integrations.tasks", "ERROR"):
+            message = self.deliver(WhatsAppError("HTTP 503", status=503, retryable=True))
+        self.assertEqual((message.status, message.error), (WhatsAppMessage.Status.FAILED, "HTTP 503"))
+
+    def test_unexpected_errors_fail(self):
+        with self.assertLogs("integrations.tasks", "ERROR"):
+            message = self.deliver(KeyError())
+        self.assertEqual((message.status, message.error), (WhatsAppMessage.Status.FAILED, "KeyError"))
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(SLACK_BOT_CACHE_TTL=300)
+class BotIdentityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner@example.com", password="password")
+        cls.integration = Integration.objects.create(
+            thirdparty=ThirdParty.SLACK, access_token="xoxb", refresh_token="", user=cls.user
+        )
+
+    def setUp(self):
+        patcher = mock.patch("integrations.bots.get_redis", return_value=fakeredis.FakeRedis())
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        _identities.clear()
+        self.addCleanup(_identities.clear)
+        self.bot = Bot.objects.create(integration=self.integration, team_id="T1", user_id="U1", bot_id="B1")
+
+    def test_repeated_lookups_skip_the_database(self):
+        self.assertEqual(get_bot_identity("T1", "U1").bot_id, "B1")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_bot_identity("T1", "U1").id, self.bot.id)
+
+    def test_misses_are_cached_too(self):
+        self.assertIsNone(get_bot_identity("T1", "U2"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_bot_identity("T1", "U2"))
+
+    def test_saving_a_bot_invalidates(self):
+        get_bot_identity("T1", "U1")
+        self.bot.bot_id = "B2"
+        self.bot.save()
+        self.assertEqual(get_bot_identity("T1", "U1").bot_id, "B2")
+
+    def test_a_save_elsewhere_invalidates_this_process(self):
+        get_bot_identity("T1", "U1")
+        # Another process saved a bot: only the shared generation changes here
+        Bot.objects.filter(id=self.bot.id).update(bot_id="B2")
+        self.redis.incr(GENERATION_KEY)
+        self.assertEqual(get_bot_identity("T1", "U1").bot_id, "B2")
+
+    def test_deleting_a_bot_invalidates(self):
+        get_bot_identity("T1", "U1")
+        self.bot.delete()
+        self.assertIsNone(get_bot_identity("T1", "U1"))
+
+    def test_entries_expire(self):
+        get_bot_identity("T1", "U1")
+        with override_settings(SLACK_BOT_CACHE_TTL=0), self.assertNumQueries(1):
+            get_bot_identity("T1", "U1")
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(SLACK_SIGNING_SECRET="secret", SLACK_EVENT_DEDUPE_TTL=3600)
+class SlackEventTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("integrations.events.get_redis", return_value=fakeredis.FakeRedis())
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(tasks.process_slack_event, "send")
+        self.queued = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data, retry_num=None, secret="secret"):
+        body = json.dumps(data)
+        timestamp = str(int(time.time()))
+        headers = {
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature": SignatureVerifier(secret).generate_signature(timestamp=timestamp, body=body),
+        }
+        if retry_num:
+            headers["X-Slack-Retry-Num"] = retry_num
+        return self.client.post(
+            reverse("integrations:slack-event"), body, content_type="application/json", headers=headers
+        )
+
+    def event(self, event_id="Ev1", **event):
+        return {
+            "type": "event_callback",
+            "event_id": event_id,
+            "event": {"type": "message", "user": "U1", "channel": "C1", "text": "hi", **event},
+        }
+
+    def test_claims_an_event_once(self):
+        self.assertTrue(claim_slack_event("Ev1"))
+        self.assertFalse(claim_slack_event("Ev1", "1"))
+        with self.assertLogs("integrations.events", "WARNING"):
+            self.assertTrue(claim_slack_event("Ev2", "1"))
+        self.assertEqual(self.redis.ttl("slack:event:Ev1"), 3600)
+
+    def test_retries_are_acknowledged_and_dropped(self):
+        self.assertEqual(self.post(self.event()).status_code, 200)
+        self.assertEqual(self.post(self.event(), retry_num="1").status_code, 200)
+        self.queued.assert_called_once()
+        self.assertEqual(self.queued.call_args.args[0]["event_id"], "Ev1")
+
+    def test_retry_of_an_unclaimed_event_is_processed(self):
+        with self.assertLogs("integrations.events", "WARNING"):
+            self.post(self.event(), retry_num="2")
+        self.queued.assert_called_once()
+
+    def test_bot_and_edited_messages_are_not_queued(self):
+        self.post(self.event("Ev1", bot_id="B1"))
+        self.post(self.event("Ev2", subtype="message_changed"))
+        self.queued.assert_not_called()
+        # Nothing was claimed, so nothing is left to expire
+        self.assertEqual(self.redis.keys(), [])
+
+    def test_lifecycle_events_are_queued(self):
+        self.post({"type": "event_callback", "event_id": "Ev1", "event": {"type": "tokens_revoked"}})
+        self.queued.assert_called_once()
+
+    def test_url_verification(self):
+        response = self.post({"type": "url_verification", "challenge": "abc"})
+        self.assertEqual(response.json(), {"challenge": "abc"})
+
+    def test_rejects_bad_signatures(self):
+        self.assertEqual(self.post(self.event(), secret="wrong").status_code, 403)
+        self.queued.assert_not_called()
+
+
+@mock.patch("integrations.slack.time.monotonic")
+class MethodThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.throttle = slack.MethodThrottle()
+
+    def test_bursts_up_to_the_tier_limit_then_paces(self, monotonic):
+        monotonic.return_value = 100.0
+        # conversations.list is tier 2: 20 calls a minute
+        waits = [self.throttle.reserve("xoxb", "conversations.list") for _ in range(22)]
+        self.assertEqual(waits[:20], [0] * 20)
+        self.assertEqual(waits[20:], [3.0, 6.0])
+
+    def test_bucket_refills_over_time(self, monotonic):
+        monotonic.return_value = 100.0
+        for _ in range(20):
+            self.throttle.reserve("xoxb", "conversations.list")
+        monotonic.return_value = 103.0
+        self.assertEqual(self.throttle.reserve("xoxb", "conversations.list"), 0)
+        self.assertEqual(self.throttle.reserve("xoxb", "conversations.list"), 3.0)
+
+    def test_keys_are_per_token_and_method(self, monotonic):
+        monotonic.return_value = 100.0
+        for _ in range(20):
+            self.throttle.reserve("xoxb-1", "conversations.list")
+        self.assertEqual(self.throttle.reserve("xoxb-2", "conversations.list"), 0)
+        self.assertEqual(self.throttle.reserve("xoxb-1", "users.list"), 0)
+        self.assertEqual(self.throttle.reserve("xoxb-1", "chat.postMessage"), 0)
+
+    def test_retry_after_blocks_other_callers(self, monotonic):
+        monotonic.return_value = 100.0
+        self.throttle.block("xoxb", "chat.update", 30)
+        self.assertEqual(self.throttle.reserve("xoxb", "chat.update"), 30)
+        self.assertEqual(self.throttle.reserve("xoxb", "chat.delete"), 0)
+
+    def test_forget_keeps_buckets_that_hold_back_calls(self, monotonic):
+        monotonic.return_value = 100.0
+        self.throttle.reserve("xoxb", "users.info")
+        self.throttle.block("xoxb", "chat.update", 30)
+        self.throttle.reserve("other", "users.info")
+        self.throttle.forget("xoxb")
+        self.assertEqual(set(self.throttle._buckets), {("xoxb", "chat.update"), ("other", "users.info")})
+
+
+class WebClientTests(SimpleTestCase):
+    def setUp(self):
+        for name, value in [("_clients", slack.OrderedDict()), ("throttle", slack.MethodThrottle())]:
+            patcher = mock.patch.object(slack, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(SLACK_CLIENT_CACHE_SIZE=2)
+    def test_clients_are_reused_and_least_recently_used_evicted(self):
+        first = slack.get_web_client("xoxb-1")
+        slack.get_web_client("xoxb-2")
+        self.assertIs(slack.get_web_client("xoxb-1"), first)
+        slack.throttle.reserve("xoxb-2", "users.info")
+        slack.get_web_client("xoxb-3")
+        self.assertEqual(list(slack._clients), ["xoxb-1", "xoxb-3"])
+        self.assertNotIn(("xoxb-2", "users.info"), slack.throttle._buckets)
+
+    @mock.patch("slack_sdk.http_retry.builtin_handlers.time.sleep")
+    def test_rate_limited_calls_retry_over_the_shared_pool(self, sleep):
+        pool = mock.Mock()
+        pool.request.side_effect = [
+            urllib3.HTTPResponse(b"", status=429, headers={"Retry-After": "7"}, preload_content=True),
+            urllib3.HTTPResponse(
+                b'{"ok": true, "user_id": "U1"}',
+                status=200,
+                headers={"Content-Type": "application/json; charset=utf-8"},
+                preload_content=True,
+            ),
+        ]
+        with mock.patch.object(slack, "_pool", pool), mock.patch.object(slack, "_hosts", set()):
+            response = slack.get_web_client("xoxb-1").auth_test()
+        self.assertEqual(response["user_id"], "U1")
+        self.assertEqual(pool.request.call_count, 2)
+        self.assertEqual(pool.request.call_args.kwargs["headers"]["Authorization"], "Bearer xoxb-1")
+        # The 429 holds back the method for every other caller with this token
+        self.assertGreater(slack.throttle.reserve("xoxb-1", "auth.test"), 6)
+
+
+@skipUnless(fakeredis and lupa, "fakeredis[lua] is not installed")
+@override_settings(SLACK_THREAD_HISTORY=3, SLACK_THREAD_CACHE_TTL=600)
+class ThreadStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner@example.com", password="password")
+        integration = Integration.objects.create(
+            thirdparty=ThirdParty.SLACK, access_token="xoxb", refresh_token="", user=user
+        )
+        cls.bot = Bot.objects.create(integration=integration, team_id="T1", user_id="U1")
+
+    def setUp(self):
+        patcher = mock.patch("integrations.threads.get_redis", return_value=fakeredis.FakeRedis())
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.store = ThreadStore(self.bot.id, "C1", "1.0")
+
+    def turns(self, *numbers):
+        return [("user" if n % 2 else "assistant", f"turn {n}") for n in numbers]
+
+    def test_a_miss_primes_the_cache_from_the_database(self):
+        ThreadStore(self.bot.id, "C1", "1.0").append(self.turns(1, 2, 3, 4))
+        self.assertEqual(self.redis.exists(self.store.key), 0)
+
+        self.assertEqual(self.store.load(), self.turns(2, 3, 4))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.store.load(), self.turns(2, 3, 4))
+        self.assertLessEqual(self.redis.ttl(self.store.key), 600)
+
+    def test_an_empty_thread_is_cached(self):
+        self.assertEqual(self.store.load(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.store.load(), [])
+
+    def test_append_extends_and_trims_the_tail(self):
+        self.store.load()
+        self.store.append(self.turns(1, 2), user_id="U2")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.store.load(), self.turns(1, 2))
+        self.store.append(self.turns(3, 4))
+        self.assertEqual(self.redis.llen(self.store.key), 3)
+        self.assertEqual(self.store.load(), self.turns(2, 3, 4))
+        self.assertEqual(
+            list(ThreadMessage.objects.order_by("id").values_list("user_id", flat=True)), ["U2", None, None, None]
+        )
+
+    def test_prime_does_not_overwrite_a_concurrent_fill(self):
+        def fill_meanwhile():
+            # Another worker primes and appends while this one reads the database
+            self.redis.rpush(self.store.key, b"-", json.dumps(["user", "turn 1"]), json.dumps(["assistant", "turn 2"]))
+            return self.turns(1)
+
+        with mock.patch.object(self.store, "_from_db", side_effect=fill_meanwhile):
+            self.assertEqual(self.store.load(), self.turns(1))
+        self.assertEqual(self.store.load(), self.turns(1, 2))
+
+    def test_threads_are_separate(self):
+        self.store.append(self.turns(1))
+        other = ThreadStore(self.bot.id, "C1", "2.0")
+        self.assertEqual(other.load(), [])
+        self.assertEqual(self.store.load(), self.turns(1))
@@ -0,0 +1,93 @@
+import json
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from common.redis import get_redis
+
+from .models import ThreadMessage
+
+logger = logging.getLogger(__name__)
+
+TAIL_KEY = "slack:thread:{bot_id}:{channel}:{thread_ts}"
+# First element of a primed tail, so a thread without turns is still a hit.
+EMPTY = b"-"
+
+# Fills the tail only if no one else did in the meantime.
+PRIME_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+Turn = Tuple[str, str]
+
+
+class ThreadStore:
+    """Conversation turns of a bot's Slack threads.
+
+    Turns are stored as ``ThreadMessage`` rows, and the last
+    ``SLACK_THREAD_HISTORY`` of each thread are kept in a Redis list as well,
+    so loading the context of a reply is one ``LRANGE``. The list is filled
+    from the database on a miss and appended to afterwards; appends only
+    extend a list that already exists, so it never holds just the newest turns.
+    """
+
+    def __init__(self, bot_id: str, channel: str, thread_ts: str, size: int = None) -> None:
+        self.bot_id = bot_id
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.size = size or settings.SLACK_THREAD_HISTORY
+        self.key = TAIL_KEY.format(bot_id=bot_id, channel=channel, thread_ts=thread_ts)
+
+    def _from_db(self) -> List[Turn]:
+        rows = (
+            ThreadMessage.objects.filter(bot_id=self.bot_id, channel=self.channel, thread_ts=self.thread_ts)
+            .order_by("-created_at", "-id")
+            .values_list("role", "content")[: self.size]
+        )
+        return list(reversed(rows))
+
+    def load(self) -> List[Turn]:
+        """The thread's last turns as ``(role, content)``, oldest first."""
+        redis = get_redis()
+        cached = redis.lrange(self.key, -self.size, -1)
+        if cached:
+            return [tuple(json.loads(item)) for item in cached if item != EMPTY]
+
+        turns = self._from_db()
+        redis.eval(
+            PRIME_SCRIPT,
+            1,
+            self.key,
+            settings.SLACK_THREAD_CACHE_TTL,
+            EMPTY,
+            *(json.dumps(turn) for turn in turns),
+        )
+        return turns
+
+    def append(self, turns: Iterable[Turn], user_id: Optional[str] = None):
+        """Store turns in one insert and add them to the cached tail."""
+        turns = list(turns)
+        if not turns:
+            return
+        ThreadMessage.objects.bulk_create(
+            ThreadMessage(
+                bot_id=self.bot_id,
+                channel=self.channel,
+                thread_ts=self.thread_ts,
+                role=role,
+                content=content,
+                user_id=user_id if role == ThreadMessage.Role.USER else None,
+            )
+            for role, content in turns
+        )
+        pipe = get_redis().pipeline()
+        pipe.rpushx(self.key, *(json.dumps(turn) for turn in turns))
+        pipe.ltrim(self.key, -self.size, -1)
+        pipe.expire(self.key, settings.SLACK_THREAD_CACHE_TTL)
+        pipe.execute()
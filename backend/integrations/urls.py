@@ -1,9 +1,12 @@
+from django.urls import path
 from rest_framework import routers
 
-from .views import IntegrationViewSet
+from .views import IntegrationViewSet, SlackEventView
 
 app_name = "integration"
 
 router = routers.SimpleRouter()
 router.register(r'', IntegrationViewSet, basename="integrations")
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = [
+    path("event", SlackEventView.as_view(), name="slack-event"),
+] + router.urls
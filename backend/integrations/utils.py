@@ -1,15 +1,15 @@
-import re
-import json
 import logging
-import requests
-
-from rest_framework import status
-from rest_framework.response import Response
+import re
 
 from slack_sdk import WebClient
 
-from .tasks import agent_response
-from .models import Bot, Agent, Integration
+from agents.models import Agent
+
+from .bots import get_bot_identity
+from .tasks import agent_response, send_whatsapp_message
+from .models import Bot, Integration, WhatsAppMessage
+
+logger = logging.getLogger(__name__)
 
 
 def save_bot(agent: Agent, oauth_response: dict, client: WebClient, integration: Integration):
@@ -20,23 +20,26 @@ def save_bot(agent: Agent, oauth_response: dict, client: WebClient, integration:
     access_token = oauth_response.get("access_token")
     # NOTE: oauth.v2.access doesn't include bot_id in response
     bot_id = None
+    bot_user_id = oauth_response.get("bot_user_id")
     enterprise_url = None
     if access_token is not None:
         auth_test = client.auth_test(token=access_token)
         bot_id = auth_test["bot_id"]
-        print(f"Bot ID: {bot_id}")
+        bot_user_id = bot_user_id or auth_test.get("user_id")
+        logger.debug("Installing Slack bot %s", bot_id)
         if is_enterprise_install is True:
             enterprise_url = auth_test.get("url")
 
-    bot, _ = Bot.objects.get_or_create(
-        agent=agent,
-        integration=integration,
-        user_id=installer.get("id"),
-        app_id=oauth_response.get("app_id"),
+    # A reinstall updates the existing row, whose save invalidates cached identities.
+    bot, _ = Bot.objects.update_or_create(
         team_id=installed_team.get("id"),
-        bot_id=bot_id,
-        bot_user_id=oauth_response.get("bot_user_id"),
+        user_id=installer.get("id"),
         defaults={
+            "agent": agent,
+            "integration": integration,
+            "app_id": oauth_response.get("app_id"),
+            "bot_id": bot_id,
+            "bot_user_id": bot_user_id,
             "enterprise_id": installed_enterprise.get("id"),
             "enterprise_name": installed_enterprise.get("name"),
             "enterprise_url": enterprise_url,
@@ -47,62 +50,16 @@ def save_bot(agent: Agent, oauth_response: dict, client: WebClient, integration:
             "user_scopes": installer.get("scope"),  # comma-separated string
             "is_enterprise_install": is_enterprise_install,
             "token_type": oauth_response.get("token_type"),
-
         }
     )
     return bot
 
 
-def log_http_response(response):
-    logging.info(f"Status: {response.status_code}")
-    logging.info(f"Content-type: {response.headers.get('content-type')}")
-    logging.info(f"Body: {response.text}")
-
-
-def get_text_message_input(recipient, text):
-    return json.dumps(
-        {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": recipient,
-            "type": "text",
-            "text": {"preview_url": False, "body": text},
-        }
-    )
-
-
 def generate_response(response):
     # Return text in uppercase
     return response.upper()
 
 
-def send_message(data, access_token, version, phone_number_id):
-    headers = {
-        "Content-type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-    }
-
-    url = f"https://graph.facebook.com/{version}/{phone_number_id}/messages"
-
-    try:
-        response = requests.post(
-            url, data=data, headers=headers, timeout=10
-        )  # 10 seconds timeout as an example
-        response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
-    except requests.Timeout:
-        print("Timeout occurred while sending message")
-        return Response(status=status.HTTP_408_REQUEST_TIMEOUT)
-    except (
-        requests.RequestException
-    ) as e:  # This will catch any general request exception
-        print(f"Request failed due to: {e}")
-        return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    else:
-        # Process the response as normal
-        log_http_response(response)
-        return response
-
-
 def process_text_for_whatsapp(text):
     # Remove brackets
     pattern = r"\【.*?\】"
@@ -151,8 +108,15 @@ def process_whatsapp_message(body):
     # response = generate_response(message_body, wa_id, name)
     # response = process_text_for_whatsapp(response)
 
-    data = get_text_message_input(bot.whatsapp_recipient_id, response)
-    send_message(data)
+    # Delivery, with its retries and rate limiting, happens on the queue
+    phone_number_id = body["entry"][0]["changes"][0]["value"]["metadata"]["phone_number_id"]
+    outbound = WhatsAppMessage.objects.create(
+        bot=bot,
+        phone_number_id=phone_number_id,
+        recipient=bot.whatsapp_recipient_id or wa_id,
+        body=response,
+    )
+    send_whatsapp_message.send(outbound.id)
 
 
 def process_slack_message(data):
@@ -167,27 +131,23 @@ def process_slack_message(data):
     user_id = event.get("user")
     query = event.get("text")
     channel = event.get("channel")
-    thread_ts = event.get("ts")
+    # Replies in a thread carry its parent's ts; a top-level message starts a thread
+    thread_ts = event.get("thread_ts") or event.get("ts")
 
-    # Lookup the stored bot token for this workspace
-    try:
-        bot = Bot.objects.get(
-            user_id=user_id,
-            team_id=team_id,
-        )
-    except:
-        print("Unknown slack user-ID")
+    # Lookup the stored bot for this workspace; served from the identity cache
+    bot = get_bot_identity(team_id, user_id)
+    if bot is None:
+        logger.debug("No bot installed for Slack team %s", team_id)
         return
 
-    agent = bot.agent
     bot_token = bot.access_token
     if not bot_token:
         # The app may be uninstalled or be used in a shared channel
-        print("Please install this app first!")
+        logger.debug("Bot of Slack team %s has no token", team_id)
         return 
 
-    client = WebClient(token=bot_token)
-    bot_id = client.api_call("auth.test")["user_id"]
+    # The bot's own user id was stored at install time
+    bot_id = bot.bot_user_id
 
     if event.get("type") == "app_mention":
         blocks = event.get("blocks") or []
@@ -200,7 +160,7 @@ def process_slack_message(data):
 
     # Ignore bot's own message
     if user_id == bot_id:
-        print("user-ID and bot-ID is the same")
+        logger.debug("Ignoring the bot's own message in %s", channel)
         return
 
     # Post an initial message
@@ -209,23 +169,35 @@ def process_slack_message(data):
     # )
     # thread_ts = result.get("ts")
 
-    print("About to run task")
-    print(f"""agent_id: {agent.id}
-            channel: {channel}
-            bot_token: {bot_token}
-            query: {query}
-            thread_ts: {thread_ts}""")
+    logger.debug("Queueing reply of agent %s in %s, thread %s", bot.agent_id, channel, thread_ts)
     # send_agent_response.delay(agent.id, channel, thread_ts, bot_token, query)
-    agent_response.send(
-        bot_id=bot.id,
-        channel=channel,
-        thread_ts=thread_ts,
-        bot_token=bot_token,
-        query=query,
-        user_id=user_id,
+    # Scheduled fairly against other workspaces' replies
+    agent_response.send_with_options(
+        kwargs={
+            "bot_id": bot.id,
+            "channel": channel,
+            "thread_ts": thread_ts,
+            "bot_token": bot_token,
+            "query": query,
+            "user_id": user_id,
+        },
+        tenant=f"team:{team_id}",
     )
 
 
+def process_slack_lifecycle_event(data):
+    """Forget the tokens of a workspace that uninstalled the app or revoked them."""
+    event = data.get("event") or {}
+    bots = Bot.objects.filter(team_id=data.get("team_id"))
+    if event.get("type") == "tokens_revoked":
+        bots = bots.filter(bot_user_id__in=(event.get("tokens") or {}).get("bot") or [])
+    # Saved one by one so each save invalidates its cached identity.
+    for bot in bots:
+        bot.access_token = None
+        bot.user_token = None
+        bot.save(update_fields=["access_token", "user_token", "updated_at"])
+
+
 def is_valid_whatsapp_message(body):
     """
     Check if the incoming webhook event has a valid WhatsApp message structure.
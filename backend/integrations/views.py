@@ -1,8 +1,16 @@
+import json
+
+from django.conf import settings
 from rest_framework import mixins, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
+from slack_sdk.signature import SignatureVerifier
 
+from .events import claim_slack_event, is_actionable_event, is_lifecycle_event
 from .models import Integration
 from .serializers import IntegrationSerializer
+from .tasks import process_slack_event
 
 
 class IntegrationViewSet(mixins.RetrieveModelMixin,
@@ -15,4 +23,40 @@ class IntegrationViewSet(mixins.RetrieveModelMixin,
     filterset_fields = ['is_chat_app']
 
     def get_queryset(self):
-        return Integration.objects.filter(user=self.request.user)
\ No newline at end of file
+        return Integration.objects.filter(user=self.request.user)
+
+
+class SlackEventView(APIView):
+    """Events API request URL.
+
+    Slack wants an acknowledgement within 3 seconds, so this only checks the
+    signature, drops retries of events it has already seen and queues the
+    rest; resolving the bot and running the agent happen in the actor.
+    """
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        body = request.body
+        verifier = SignatureVerifier(settings.SLACK_SIGNING_SECRET)
+        if not verifier.is_valid(
+            body,
+            request.headers.get("X-Slack-Request-Timestamp"),
+            request.headers.get("X-Slack-Signature"),
+        ):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        if data.get("type") == "url_verification":
+            return Response({"challenge": data.get("challenge")})
+
+        if (is_actionable_event(data) or is_lifecycle_event(data)) and claim_slack_event(
+            data["event_id"],
+            request.headers.get("X-Slack-Retry-Num"),
+        ):
+            process_slack_event.send(data)
+        return Response(status=status.HTTP_200_OK)
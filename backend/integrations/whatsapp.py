@@ -0,0 +1,163 @@
+import logging
+import random
+import time
+from typing import Dict, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from common.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+GRAPH_URL = "https://graph.facebook.com/{version}/{phone_number_id}/messages"
+RATE_KEY = "whatsapp:rate:{phone_number_id}:{second}"
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Graph error codes that mean "try again later", whatever the HTTP status:
+# temporary outage, app/account rate limits, throughput and pair rate limits.
+RETRYABLE_CODES = (1, 2, 4, 17, 80007, 130429, 131000, 131056)
+
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """Process-wide session, so sends reuse keep-alive connections to the Graph API."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.WHATSAPP_POOL_SIZE)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+class WhatsAppError(Exception):
+    def __init__(self, message: str, status: int = None, code: int = None, retryable: bool = False) -> None:
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.retryable = retryable
+
+
+class WhatsAppDeliveryUnknown(WhatsAppError):
+    """The request was sent but no response came back; the API may have accepted the message."""
+
+
+def text_message(recipient: str, text: str, preview_url: bool = False) -> Dict:
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": recipient,
+        "type": "text",
+        "text": {"preview_url": preview_url, "body": text},
+    }
+
+
+def acquire_send_slot(phone_number_id: str, limit: int = None) -> float:
+    """Wait for a slot in this second's send budget of a business number.
+
+    The budget is a per-second counter in Redis, so it holds across workers.
+    Returns the seconds spent waiting.
+    """
+    limit = limit or settings.WHATSAPP_RATE_LIMIT
+    waited = 0.0
+    redis = get_redis()
+    while True:
+        now = time.time()
+        key = RATE_KEY.format(phone_number_id=phone_number_id, second=int(now))
+        count, _ = redis.pipeline().incr(key).expire(key, 2).execute()
+        if count <= limit:
+            return waited
+        pause = 1 - (now % 1)
+        time.sleep(pause)
+        waited += pause
+
+
+class WhatsAppClient:
+    """Sends messages through the WhatsApp Cloud API for one business number.
+
+    Requests go through a pooled session and the number's send budget. A 429,
+    a 5xx, a Graph error code that signals throttling, or a connection that
+    could not be made is retried with exponential backoff and jitter,
+    honouring ``Retry-After``; after ``max_retries`` the last error is
+    raised. A request that times out waiting for the response is not sent
+    again, since the API may already have accepted it: it raises
+    ``WhatsAppDeliveryUnknown``.
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        phone_number_id: str,
+        version: str = None,
+        max_retries: int = None,
+        backoff: float = 0.5,
+        session: requests.Session = None,
+    ) -> None:
+        self.access_token = access_token
+        self.phone_number_id = phone_number_id
+        self.url = GRAPH_URL.format(
+            version=version or settings.WHATSAPP_API_VERSION, phone_number_id=phone_number_id
+        )
+        self.max_retries = settings.WHATSAPP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = backoff
+        self.session = session or get_session()
+        self.attempts = 0
+
+    def _error(self, response: requests.Response) -> WhatsAppError:
+        try:
+            error = response.json().get("error") or {}
+        except ValueError:
+            error = {}
+        code = error.get("code")
+        return WhatsAppError(
+            error.get("message") or f"HTTP {response.status_code}",
+            status=response.status_code,
+            code=code,
+            retryable=response.status_code in RETRYABLE_STATUSES or code in RETRYABLE_CODES,
+        )
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * 2**attempt + random.uniform(0, self.backoff)
+
+    def send(self, payload: Dict) -> Dict:
+        """Send a message payload; returns the API response (with the ``wamid``)."""
+        for attempt in range(self.max_retries + 1):
+            acquire_send_slot(self.phone_number_id)
+            self.attempts += 1
+            response = None
+            try:
+                response = self.session.post(
+                    self.url,
+                    json=payload,
+                    headers={"Authorization": f"Bearer {self.access_token}"},
+                    timeout=settings.WHATSAPP_TIMEOUT,
+                )
+            except requests.ConnectionError as exc:
+                # Includes ConnectTimeout: the request never reached the API
+                error = WhatsAppError(str(exc), retryable=True)
+            except requests.Timeout as exc:
+                raise WhatsAppDeliveryUnknown(str(exc)) from exc
+            else:
+                if response.ok:
+                    return response.json()
+                error = self._error(response)
+
+            if not error.retryable or attempt == self.max_retries:
+                raise error
+            delay = self._delay(attempt, response)
+            logger.warning(
+                "WhatsApp send from %s failed (%s), retrying in %.1fs", self.phone_number_id, error, delay
+            )
+            time.sleep(delay)
+
+    def send_text(self, recipient: str, text: str) -> Dict:
+        return self.send(text_message(recipient, text))